@@ -0,0 +1,143 @@
+"""
+Local stand-ins for everything the pipelines talk to, so benchmarks run offline:
+bare git remotes, a fake docker CLI, the deployed apps, a stub Prometheus and incident channels.
+The stub LLM lives in src/llm/stub_server.py.
+"""
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Records every call and sleeps FAKE_DOCKER_BUILD_SECONDS for `docker build`; `inspect` reports running.
+FAKE_DOCKER = """#!/bin/bash
+[ -n "$FAKE_DOCKER_LOG" ] && echo "$*" >> "$FAKE_DOCKER_LOG"
+case "$1" in
+  build) echo "Step 1/3 : FROM python:3.11-slim"; sleep "${FAKE_DOCKER_BUILD_SECONDS:-0}"; echo "Successfully built fake";;
+  run) echo "fakecontainer$RANDOM";;
+  inspect) echo true;;
+esac
+exit 0
+"""
+
+APP_FILES = {
+    "requirements.txt": "flask\nprometheus-flask-exporter\n",
+    "app.py": "from flask import Flask\napp = Flask(__name__)\n",
+    "README.md": "# Benchmark app\n",
+}
+
+
+def start_server(handler, **attributes):
+    """Starts a ThreadingHTTPServer on a free local port; attributes are set on the server for the handler."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    for name, value in attributes.items():
+        setattr(server, name, value)
+    return start_server_thread(server)
+
+
+def start_server_thread(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _reply(handler, status, body=b"", content_type="text/plain"):
+    handler.send_response(status)
+    handler.send_header("Content-Type", content_type)
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+class FakeAppHandler(BaseHTTPRequestHandler):
+    """The 'deployed' app: / answers 200, /error fails with the server's error_rate."""
+
+    def do_GET(self):
+        if self.path.startswith("/error") and random.random() < self.server.error_rate:
+            _reply(self, 500, b"error")
+        else:
+            _reply(self, 200, b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class FakePrometheusHandler(BaseHTTPRequestHandler):
+    """Targets that were scraped 'just now' for every app port, and a healthy metric bundle."""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/api/v1/targets":
+            now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            targets = [
+                {"labels": {"job": "app", "instance": f"localhost:{port}"}, "health": "up",
+                 "lastScrape": now, "scrapeInterval": "1s"}
+                for port in self.server.app_ports
+            ]
+            body = {"status": "success", "data": {"activeTargets": targets}}
+        else:
+            query = parse_qs(url.query).get("query", [""])[0]
+            if 'status=~"5.."' in query or 'status=~"4.."' in query:
+                value = "0"
+            elif "histogram_quantile" in query:
+                value = "0.05"
+            elif query.startswith("up"):
+                value = "1"
+            else:
+                value = "5"
+            body = {"status": "success", "data": {"resultType": "vector", "result": [{"metric": {}, "value": [0, value]}]}}
+        _reply(self, 200, json.dumps(body).encode(), "application/json")
+
+    def log_message(self, *args):
+        pass
+
+
+def install_fake_docker(bin_dir):
+    os.makedirs(bin_dir, exist_ok=True)
+    path = os.path.join(bin_dir, "docker")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(FAKE_DOCKER)
+    os.chmod(path, 0o755)
+    return path
+
+
+def _git(*args, cwd=None):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+def make_bare_remote(remotes_dir, repo_full_name, port, branches=("main",)):
+    """
+    Creates <remotes_dir>/<owner>/<name>.git with a small Flask app whose Dockerfile exposes port,
+    one branch per entry in branches. Returns the head commit SHA of the first branch.
+    """
+    work_dir = os.path.join(remotes_dir, "_work", repo_full_name)
+    bare_dir = os.path.join(remotes_dir, f"{repo_full_name}.git")
+    os.makedirs(work_dir, exist_ok=True)
+    _git("init", "-q", "-b", branches[0], cwd=work_dir)
+    files = {**APP_FILES, "Dockerfile": f"FROM python:3.11-slim\nCOPY . /app\nEXPOSE {port}\nCMD [\"python\", \"app.py\"]\n"}
+    for name, content in files.items():
+        with open(os.path.join(work_dir, name), "w", encoding="utf-8") as f:
+            f.write(content)
+    _git("add", ".", cwd=work_dir)
+    _git("-c", "user.name=bench", "-c", "user.email=bench@localhost", "commit", "-q", "-m", "initial", cwd=work_dir)
+    for branch in branches[1:]:
+        _git("branch", branch, cwd=work_dir)
+    _git("clone", "-q", "--bare", work_dir, bare_dir)
+    _git("config", "uploadpack.allowFilter", "true", cwd=bare_dir)
+    _git("config", "uploadpack.allowAnySHA1InWant", "true", cwd=bare_dir)
+    return subprocess.run(["git", "rev-parse", branches[0]], cwd=work_dir, check=True,
+                          capture_output=True, text=True).stdout.strip()
+
+
+def fake_senders(latency):
+    """Incident channel senders that only wait `latency` seconds, like a slow GitHub/Jira/SMTP call."""
+    def sender(channel):
+        def send(payload):
+            time.sleep(latency)
+            return f"fake-{channel}://{payload.get('repo')}/{int(time.time() * 1000)}"
+        return send
+    return {channel: sender(channel) for channel in ("github", "jira", "email")}
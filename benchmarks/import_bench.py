@@ -0,0 +1,102 @@
+"""
+Startup benchmark: how long importing the webhook server takes, and which modules it pulls in.
+
+Each sample imports the module in a fresh interpreter with `-X importtime` (so nothing is cached in
+sys.modules), run from a scratch directory so the SQLite stores created at import land there. Reports the median
+cumulative import time and the slowest modules it imports directly. Exits 1 if the median regressed beyond --tolerance
+against the baseline, or if a client that must be imported lazily (LangChain, PyGithub, jira,
+prometheus-api-client) was loaded at import.
+
+    python -m benchmarks.import_bench
+    python -m benchmarks.import_bench --module src.orchestrator --samples 9 --update-baseline
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "import_baseline.json")
+# Heavy clients that are only needed once an LLM call, incident or PromQL query actually happens.
+LAZY_MODULES = ("langchain_core", "langchain_mistralai", "github", "jira", "prometheus_api_client", "pandas")
+
+def _sandbox_env():
+    # Relative store paths (workspace/...) resolve inside the scratch directory the sample runs in.
+    return dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+                SDLC_AGENT_CONFIG=os.path.join(REPO_ROOT, "config.yaml"))
+
+def sample(module, scratch):
+    """Imports module once in a fresh interpreter; returns (cumulative µs per module up to depth 1, loaded modules)."""
+    code = f"import json, sys; import {module}; print(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=scratch, env=_sandbox_env(),
+                            capture_output=True, text=True, check=True)
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # Names are indented two spaces per nesting level; keep top-level imports and their direct imports.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= 1:
+            packages[name.strip()] = packages.get(name.strip(), 0) + int(cumulative)
+    return packages, json.loads(result.stdout.strip().splitlines()[-1])
+
+def run(module, samples):
+    totals, slowest, loaded = [], {}, set()
+    with tempfile.TemporaryDirectory(prefix="import-bench-") as scratch:
+        for _ in range(samples):
+            packages, modules = sample(module, scratch)
+            totals.append(packages.get(module, sum(packages.values())) / 1000)
+            for name, micros in packages.items():
+                slowest.setdefault(name, []).append(micros / 1000)
+            loaded.update(modules)
+    top = sorted(((statistics.median(ms), name) for name, ms in slowest.items() if name != module), reverse=True)[:10]
+    return {
+        "module": module,
+        "samples": samples,
+        "median_ms": round(statistics.median(totals), 1),
+        "min_ms": round(min(totals), 1),
+        "slowest_packages_ms": {name: round(ms, 1) for ms, name in top},
+        "eager_heavy_modules": sorted(name for name in LAZY_MODULES if name in loaded),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the import (startup) time of the agent.")
+    parser.add_argument("--module", default="src.webhook_server")
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative regression of the median")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    report = run(args.module, args.samples)
+    problems = [f"{name} is imported eagerly" for name in report["eager_heavy_modules"]]
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("module") == args.module and report["median_ms"] > baseline["median_ms"] * (1 + args.tolerance):
+            problems.append(f"median import time {report['median_ms']} ms vs baseline {baseline['median_ms']} ms")
+    report["regressions"] = problems
+
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print(f"import {args.module}: median {report['median_ms']} ms, min {report['min_ms']} ms ({args.samples} samples)")
+        for name, ms in report["slowest_packages_ms"].items():
+            print(f"  {name:<32} {ms:8.1f} ms")
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
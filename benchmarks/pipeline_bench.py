@@ -0,0 +1,270 @@
+"""
+End-to-end pipeline benchmark that runs entirely on this machine.
+
+Webhook deliveries are posted to the Flask app (test client), queued and drained by the worker pool exactly as
+in production, but every external system is a local stand-in from benchmarks/fakes.py: the stub LLM, bare git
+remotes served over file://, a fake docker CLI, one HTTP app per repo, a stub Prometheus and incident channels
+with configurable latency. Reports events/second, job outcomes (processed vs superseded), per-stage p50/p95
+from the run history and peak memory, and compares them against a stored baseline.
+
+    python -m benchmarks.pipeline_bench --events 40 --repos 4 --workers 4
+    python -m benchmarks.pipeline_bench --payloads deliveries.jsonl --json
+    python -m benchmarks.pipeline_bench --update-baseline
+
+--payloads takes recorded deliveries, one {"event": "push" | "pull_request", "payload": {...}} per line.
+Commit SHAs in them are rewritten to the fake remotes' heads. Exits 1 when a metric regressed beyond --tolerance.
+"""
+import argparse
+import itertools
+import json
+import os
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import fakes
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+FEATURE_BRANCH = "feature"
+
+def synthesize_deliveries(count, repos):
+    """Alternates PR merges to main and pushes to a feature branch, round-robin over the repos."""
+    deliveries = []
+    for i, repo in zip(range(count), itertools.cycle(repos)):
+        if i % 2 == 0:
+            deliveries.append({"event": "pull_request", "payload": {
+                "action": "closed",
+                "pull_request": {
+                    "number": i + 1,
+                    "title": f"Benchmark change {i + 1}",
+                    "body": "Synthetic pull request for the pipeline benchmark.",
+                    "user": {"login": "bench"},
+                    "merged": True,
+                    "additions": 10, "deletions": 2, "changed_files": 1,
+                    "base": {"ref": "main", "repo": {"full_name": repo}},
+                },
+            }})
+        else:
+            deliveries.append({"event": "push", "payload": {
+                "ref": f"refs/heads/{FEATURE_BRANCH}",
+                "repository": {"full_name": repo},
+            }})
+    return deliveries
+
+def load_deliveries(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def _target(delivery):
+    """(repo, branch) a delivery deploys, or None for events the webhook ignores."""
+    payload = delivery["payload"]
+    if delivery["event"] == "pull_request":
+        pr = payload.get("pull_request", {})
+        return pr.get("base", {}).get("repo", {}).get("full_name"), pr.get("base", {}).get("ref")
+    if delivery["event"] == "push" and "repository" in payload:
+        return payload["repository"]["full_name"], payload.get("ref", "refs/heads/main").split("/")[-1]
+    return None
+
+def _pin_commit(delivery, sha):
+    payload = delivery["payload"]
+    if delivery["event"] == "pull_request":
+        payload.setdefault("pull_request", {})["merge_commit_sha"] = sha
+    else:
+        payload["after"] = sha
+
+def _configure_environment(args, root, prometheus_url, llm_url):
+    """Points every setting at the sandbox; src reads them at import time, so this runs before importing it."""
+    bin_dir = os.path.join(root, "bin")
+    fakes.install_fake_docker(bin_dir)
+    os.environ.pop("GITHUB_WEBHOOK_SECRET", None)
+    os.environ.update({
+        "PATH": bin_dir + os.pathsep + os.environ.get("PATH", ""),
+        "FAKE_DOCKER_BUILD_SECONDS": str(args.build_seconds),
+        "LLM_BACKEND": "stub",
+        "LLM_STUB_URL": llm_url,
+        "LLM_RETRY_BACKOFF": "0.1",
+        "PROMETHEUS_URL": prometheus_url,
+        "GITHUB_TOKEN": "bench",
+        "GIT_REMOTE_URL": "file://" + os.path.join(root, "remotes", "{repo}.git"),
+        "GIT_MIRROR_DIR": os.path.join(root, "mirrors"),
+        "GIT_WORKTREE_DIR": os.path.join(root, "worktrees"),
+        "JOB_QUEUE_DB": os.path.join(root, "jobs.sqlite3"),
+        "DEPLOY_HISTORY_DB": os.path.join(root, "history.sqlite3"),
+        "DEPLOY_SCRIPT_CACHE_DIR": os.path.join(root, "script_cache"),
+        "DEPLOY_LOG_DIR": os.path.join(root, "deploy_logs"),
+        "BLUE_GREEN_STATE_DIR": os.path.join(root, "blue_green"),
+        "WEBHOOK_JOURNAL_DIR": os.path.join(root, "webhook_journal"),
+        "INCIDENT_DB": os.path.join(root, "incidents.sqlite3"),
+        "PIPELINE_WORKERS": str(args.workers),
+        "READINESS_TIMEOUT": "10",
+        "SCRAPE_WAIT_TIMEOUT": "5",
+        "INCIDENT_RETRY_BACKOFF": "0.1",
+        # The post-deploy watch outlives the pipeline by design; the benchmark times the pipeline itself.
+        "WATCH_WINDOW": "0",
+        "LOG_LEVEL": "WARNING",
+    })
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[max(0, -(-len(values) * pct // 100) - 1)] if values else None
+
+def run_benchmark(args):
+    deliveries = load_deliveries(args.payloads) if args.payloads else synthesize_deliveries(
+        args.events, [f"bench/app-{i}" for i in range(args.repos)]
+    )
+    root = tempfile.mkdtemp(prefix="pipeline-bench-")
+
+    # Stand-ins that do not depend on src settings start first, so their ports can go into the environment.
+    targets = sorted({t for t in map(_target, deliveries) if t and t[0]})
+    repos = sorted({repo for repo, _ in targets})
+    apps = {repo: fakes.start_server(fakes.FakeAppHandler, error_rate=args.error_rate) for repo in repos}
+    prometheus = fakes.start_server(fakes.FakePrometheusHandler, app_ports=[app.server_port for app in apps.values()])
+    from src.llm.stub_server import make_server
+    llm = make_server("127.0.0.1", 0, latency=args.llm_latency)
+    fakes.start_server_thread(llm)
+
+    heads = {}
+    for repo in repos:
+        branches = ["main"] + sorted({branch for r, branch in targets if r == repo and branch != "main"})
+        sha = fakes.make_bare_remote(os.path.join(root, "remotes"), repo, apps[repo].server_port, branches)
+        heads.update({(repo, branch): sha for branch in branches})
+    for delivery in deliveries:
+        target = _target(delivery)
+        if target in heads:
+            _pin_commit(delivery, heads[target])
+
+    _configure_environment(args, root, f"http://127.0.0.1:{prometheus.server_port}", f"http://127.0.0.1:{llm.server_port}")
+    from loguru import logger
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    import src.incident.dispatcher as dispatcher
+    dispatcher.default_senders = lambda: fakes.fake_senders(args.channel_latency)
+    dispatcher.default_lookups = lambda: {}
+    from src import webhook_server
+
+    if args.trace_memory:
+        tracemalloc.start()
+    client = webhook_server.app.test_client()
+    started = time.monotonic()
+    accept_latencies = []
+    for i, delivery in enumerate(deliveries):
+        posted = time.monotonic()
+        client.post("/webhook", json=delivery["payload"],
+                    headers={"X-GitHub-Event": delivery["event"], "X-GitHub-Delivery": f"bench-{i}"})
+        accept_latencies.append(time.monotonic() - posted)
+
+    deadline = started + args.timeout
+    while time.monotonic() < deadline:
+        depth = webhook_server.job_queue.depth()
+        if not depth.get("queued") and not depth.get("running"):
+            break
+        time.sleep(0.05)
+    elapsed = time.monotonic() - started
+    webhook_server.worker_pool.stop(timeout=5)
+
+    with sqlite3.connect(os.environ["JOB_QUEUE_DB"]) as conn:
+        jobs = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+    processed = jobs.get("succeeded", 0) + jobs.get("failed", 0)
+    report = {
+        "options": {key: getattr(args, key) for key in (
+            "workers", "llm_latency", "build_seconds", "channel_latency", "error_rate")},
+        "deliveries": len(deliveries),
+        "repos": len(repos),
+        "elapsed_s": round(elapsed, 3),
+        "events_per_s": round(len(deliveries) / elapsed, 3),
+        "pipelines_per_s": round(processed / elapsed, 3),
+        "jobs": jobs,
+        "processed": processed,
+        "superseded": jobs.get("superseded", 0),
+        "timed_out": bool(jobs.get("queued") or jobs.get("running")),
+        "webhook_accept_ms": {"p50": round(_percentile(accept_latencies, 50) * 1000, 3),
+                              "p95": round(_percentile(accept_latencies, 95) * 1000, 3)},
+        "stages": webhook_server.history.stage_durations(since_s=elapsed + 60),
+        # ru_maxrss is KiB on Linux.
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if args.trace_memory:
+        report["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        tracemalloc.stop()
+    for server in (*apps.values(), prometheus, llm):
+        server.shutdown()
+    if args.keep_workdir:
+        report["workdir"] = root
+    else:
+        shutil.rmtree(root, ignore_errors=True)
+    return report
+
+# Stage p95 differences smaller than this are timer noise, whatever the relative change.
+STAGE_NOISE_FLOOR_S = 0.05
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Returns regressions as strings: throughput below or stage p95/memory above the baseline by more than tolerance."""
+    regressions = []
+    checks = [("events_per_s", report["events_per_s"], baseline.get("events_per_s"), False, 0),
+              ("pipelines_per_s", report["pipelines_per_s"], baseline.get("pipelines_per_s"), False, 0),
+              ("peak_rss_mb", report["peak_rss_mb"], baseline.get("peak_rss_mb"), True, 0)]
+    for stage, stats in baseline.get("stages", {}).items():
+        if stage in report["stages"]:
+            checks.append((f"stages.{stage}.p95", report["stages"][stage]["p95"], stats["p95"], True, STAGE_NOISE_FLOOR_S))
+    for name, value, expected, lower_is_better, noise_floor in checks:
+        if not expected or abs(value - expected) < noise_floor:
+            continue
+        change = (value - expected) / expected
+        if (change if lower_is_better else -change) > tolerance:
+            regressions.append(f"{name}: {value} vs baseline {expected} ({change:+.0%})")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the deployment pipelines.")
+    parser.add_argument("--events", type=int, default=20, help="synthetic deliveries to send (ignored with --payloads)")
+    parser.add_argument("--repos", type=int, default=4, help="repositories the synthetic deliveries spread over")
+    parser.add_argument("--workers", type=int, default=4, help="pipeline workers (PIPELINE_WORKERS)")
+    parser.add_argument("--payloads", help="JSONL of recorded deliveries: {\"event\", \"payload\"} per line")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="stub LLM latency per request (s)")
+    parser.add_argument("--build-seconds", type=float, default=0.2, help="time the fake `docker build` takes (s)")
+    parser.add_argument("--channel-latency", type=float, default=0.1, help="latency of each incident channel (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of /error requests the fake apps fail")
+    parser.add_argument("--timeout", type=float, default=300, help="give up waiting for the queue to drain after (s)")
+    parser.add_argument("--trace-memory", action="store_true", help="also report the tracemalloc peak (slower)")
+    parser.add_argument("--keep-workdir", action="store_true", help="keep the sandbox (remotes, databases, deploy logs)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression (0.25 = 25%%)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args)
+    regressions = []
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("options") != report["options"]:
+            print(f"Note: baseline was recorded with {baseline.get('options')}", file=sys.stderr)
+        regressions = compare_to_baseline(report, baseline, args.tolerance)
+    report["regressions"] = regressions
+
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print(f"{report['deliveries']} deliveries over {report['repos']} repos in {report['elapsed_s']}s: "
+              f"{report['events_per_s']} events/s, {report['pipelines_per_s']} pipelines/s")
+        print(f"jobs: {report['jobs']} (processed {report['processed']}, superseded {report['superseded']})")
+        print(f"webhook accept p50/p95: {report['webhook_accept_ms']['p50']}/{report['webhook_accept_ms']['p95']} ms")
+        for stage, stats in sorted(report["stages"].items()):
+            print(f"  {stage:<16} n={stats['count']:<4} p50={stats['p50']:.3f}s p95={stats['p95']:.3f}s")
+        print(f"peak RSS: {report['peak_rss_mb']} MB" + (
+            f", traced peak: {report['peak_traced_mb']} MB" if "peak_traced_mb" in report else ""))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+    return 1 if regressions or report["timed_out"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python < 3.11
+    import tomli as tomllib
+
+logger = logging.getLogger(__name__)
+
+# Files summarized for the LLM, in prompt order.
+CONTEXT_FILES = ["requirements.txt", "Dockerfile", "package.json", "Pipfile", "pyproject.toml", "README.md"]
+# Rough bytes per token, as in the stub LLM's usage accounting.
+BYTES_PER_TOKEN = 4
+# Files that are reduced to extracted facts are read up to this size; manifests must be parsed whole,
+# so larger ones are summarized from their first lines only.
+MAX_PARSE_BYTES = 512 * 1024
+_EXTRACTED = {"requirements.txt", "Dockerfile", "package.json", "Pipfile", "pyproject.toml"}
+
+# Dockerfile instructions that matter for deploying; RUN/COPY and the like are dropped.
+_DOCKERFILE_KEEP = {"FROM", "ARG", "ENV", "EXPOSE", "WORKDIR", "USER", "CMD", "ENTRYPOINT", "HEALTHCHECK"}
+_TRUNCATED = "\n[... truncated]"
+_REQUIREMENT_NAME = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)")
+# Packages that expose a /metrics endpoint (not Prometheus query clients such as prometheus-api-client).
+_METRICS_PACKAGES = re.compile(
+    r"prometheus[-_](client|.*exporter)$|^prom-client$|^express-prom|micrometer-registry-prometheus|exporter-prometheus",
+    re.IGNORECASE,
+)
+
+
+def read_bounded(path, max_bytes):
+    """
+    Reads at most max_bytes of a text file, cut back to the last complete line. Returns (text, truncated).
+    Only that much is read from disk, however large the file is.
+    """
+    with open(path, "rb") as f:
+        data = f.read(max_bytes + 1)
+    truncated = len(data) > max_bytes
+    if truncated:
+        data = data[:max_bytes]
+        data = data[:data.rfind(b"\n") + 1] or data
+    return data.decode("utf-8", errors="replace"), truncated
+
+
+def _names(packages):
+    return sorted({_REQUIREMENT_NAME.match(p).group(1).lower() for p in packages if _REQUIREMENT_NAME.match(p)})
+
+
+def _summarize_requirements(text):
+    lines = [line for line in text.splitlines() if line.strip() and not line.lstrip().startswith(("#", "-"))]
+    return _names(lines)
+
+
+def _summarize_dockerfile(text):
+    lines, pending = [], ""
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.endswith("\\"):
+            pending += line[:-1] + " "
+            continue
+        line, pending = pending + line, ""
+        if line.split(None, 1)[0].upper() in _DOCKERFILE_KEEP:
+            lines.append(line)
+    return lines
+
+
+def _summarize_package_json(text):
+    manifest = json.loads(text)
+    summary = {key: manifest[key] for key in ("name", "main", "engines") if key in manifest}
+    scripts = manifest.get("scripts") or {}
+    summary["scripts"] = {key: scripts[key] for key in ("start", "build", "serve") if key in scripts}
+    for section in ("dependencies", "devDependencies"):
+        if manifest.get(section):
+            summary[section] = sorted(manifest[section])
+    return summary
+
+
+def _toml_dependencies(text):
+    data = tomllib.loads(text)
+    project = data.get("project") or {}
+    packages = list(project.get("dependencies") or [])
+    for extra in (project.get("optional-dependencies") or {}).values():
+        packages += extra
+    names = _names(packages)
+    poetry = ((data.get("tool") or {}).get("poetry") or {}).get("dependencies") or {}
+    # Pipfile sections, and Poetry's table of name = version.
+    for table in (poetry, data.get("packages") or {}, data.get("dev-packages") or {}):
+        names += [name.lower() for name in table if name.lower() != "python"]
+    return sorted(set(names)), project.get("scripts") or {}
+
+
+class AppContextBuilder:
+    """
+    Builds the bounded app context sent to the LLM from a checked-out repository. Only what a deploy
+    decision needs is kept: Dockerfile base/ports/env/cmd, dependency names, the start scripts of
+    package.json and the beginning of the README. The README is read only up to max_file_bytes and
+    the other files up to MAX_PARSE_BYTES; every section is capped at max_file_bytes and the whole
+    context at max_tokens.
+
+    Results are memoized per workspace, keyed by the size and mtime of every context file, so an
+    unchanged checkout is not read again.
+    """
+
+    def __init__(self, max_file_bytes=4096, max_tokens=3000, max_entries=128):
+        self.max_file_bytes = max_file_bytes
+        self.max_tokens = max_tokens
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _fingerprint(self, workspace_dir):
+        stats = []
+        for file_name in CONTEXT_FILES:
+            try:
+                stat = os.stat(os.path.join(workspace_dir, file_name))
+            except OSError:
+                continue
+            stats.append((file_name, stat.st_size, stat.st_mtime_ns))
+        return os.path.abspath(workspace_dir), tuple(stats), self.max_file_bytes, self.max_tokens
+
+    def build(self, workspace_dir):
+        key = self._fingerprint(workspace_dir)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+        context = self._build(workspace_dir, [file_name for file_name, _, _ in key[1]])
+        with self._lock:
+            self._cache[key] = context
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return context
+
+    def _build(self, workspace_dir, file_names):
+        sections, dependencies, ports = [], [], []
+        for file_name in file_names:
+            path = os.path.join(workspace_dir, file_name)
+            try:
+                section = self._summarize_file(path, file_name, dependencies, ports)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not summarize context file {path}: {e}")
+                continue
+            if section:
+                sections.append(f"# {file_name}\n{section}\n")
+        if not sections:
+            return ""
+
+        metrics_packages = [name for name in dependencies if _METRICS_PACKAGES.search(name)]
+        signals = [
+            f"exposed ports: {', '.join(ports) or 'none declared'}",
+            f"metrics exporter: {'yes (' + ', '.join(metrics_packages) + ')' if metrics_packages else 'none found'}",
+        ]
+        context = "# Summary\n" + "\n".join(f"- {signal}" for signal in signals) + "\n"
+        budget = self.max_tokens * BYTES_PER_TOKEN - len(context)
+        for section in sections:
+            if len(section) > budget:
+                if budget > 200:
+                    context += "\n" + section[:budget].rsplit("\n", 1)[0] + _TRUNCATED + "\n"
+                context += "\n[further context files omitted: token budget reached]\n"
+                break
+            context += "\n" + section
+            budget -= len(section) + 1
+        return context
+
+    def _summarize_file(self, path, file_name, dependencies, ports):
+        """The section for one file, at most max_file_bytes; dependency names and ports are collected on the way."""
+        section = self._extract(path, file_name, dependencies, ports)
+        if len(section) > self.max_file_bytes:
+            section = section[:self.max_file_bytes - len(_TRUNCATED)].rsplit("\n", 1)[0] + _TRUNCATED
+        return section
+
+    def _extract(self, path, file_name, dependencies, ports):
+        if file_name not in _EXTRACTED:
+            # README and the like: the beginning of the file, which usually says what the app is and how it runs.
+            text, truncated = read_bounded(path, self.max_file_bytes - len(_TRUNCATED))
+            return text.strip() + (_TRUNCATED if truncated else "")
+        # Files reduced to a few facts are read further, so e.g. an EXPOSE at the end is not missed.
+        text, truncated = read_bounded(path, MAX_PARSE_BYTES)
+        if file_name == "requirements.txt":
+            names = _summarize_requirements(text)
+            dependencies += names
+            return f"dependencies: {', '.join(names)}" + (" [...]" if truncated else "")
+        if file_name == "Dockerfile":
+            lines = _summarize_dockerfile(text)
+            ports += [port for line in lines if line.upper().startswith("EXPOSE") for port in line.split()[1:]]
+            return "\n".join(lines)
+        if truncated:
+            # A cut-off manifest cannot be parsed; fall back to its first lines.
+            return read_bounded(path, self.max_file_bytes)[0]
+        if file_name == "package.json":
+            summary = _summarize_package_json(text)
+            dependencies += summary.get("dependencies", []) + summary.get("devDependencies", [])
+            return json.dumps(summary, sort_keys=True)
+        names, scripts = _toml_dependencies(text)
+        dependencies += names
+        lines = [f"dependencies: {', '.join(names)}"]
+        if scripts:
+            lines.append(f"scripts: {json.dumps(scripts, sort_keys=True)}")
+        return "\n".join(lines)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._cache),
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
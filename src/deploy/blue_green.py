@@ -0,0 +1,261 @@
+import json
+import logging
+import os
+import select
+import socket
+import socketserver
+import subprocess
+import threading
+import time
+
+from src.deploy.deployer import deploy_application
+from src.deploy.planner import render_script
+from src.monitor.agent_metrics import BLUE_GREEN_SWAP_DURATION, BLUE_GREEN_OUTCOMES
+
+logger = logging.getLogger(__name__)
+
+BLUE = "blue"
+GREEN = "green"
+SLOT_SCRIPT_NAME = "blue_green_deploy.sh"
+
+class DeploymentRolledBack(Exception):
+    """Raised when the new slot failed its health check and traffic stayed on (or returned to) the previous image."""
+
+class _ProxyHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # The upstream is read once per connection: after a switch, open connections drain on the old slot.
+        try:
+            upstream = socket.create_connection(("127.0.0.1", self.server.proxy.upstream_port), timeout=10)
+        except OSError as e:
+            logger.warning(f"Proxy on port {self.server.proxy.port} could not reach upstream: {e}")
+            return
+        sockets = [self.request, upstream]
+        try:
+            while True:
+                readable, _, _ = select.select(sockets, [], [], 60)
+                if not readable:
+                    return
+                for source in readable:
+                    data = source.recv(65536)
+                    if not data:
+                        return
+                    (upstream if source is self.request else self.request).sendall(data)
+        except OSError:
+            return
+        finally:
+            upstream.close()
+
+class _ProxyServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class SwapProxy:
+    """
+    Minimal local TCP reverse proxy in front of the blue/green slots. switch() changes the upstream
+    port atomically; new connections go to the new slot while open ones finish on the old one.
+    """
+
+    def __init__(self, listen_port, upstream_port, host="0.0.0.0"):
+        self.upstream_port = upstream_port
+        self._server = _ProxyServer((host, listen_port), _ProxyHandler)
+        self._server.proxy = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"swap-proxy-{self.port}", daemon=True)
+        self._thread.start()
+
+    def switch(self, upstream_port):
+        previous, self.upstream_port = self.upstream_port, upstream_port
+        logger.info(f"Proxy on port {self.port} switched from {previous} to {upstream_port}.")
+        return previous
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+_proxies = {}
+_proxies_lock = threading.Lock()
+
+def ensure_proxy(public_port, upstream_port):
+    """Returns the proxy serving public_port, starting it (pointed at upstream_port) if needed."""
+    with _proxies_lock:
+        proxy = _proxies.get(public_port)
+        if proxy is None:
+            proxy = _proxies[public_port] = SwapProxy(public_port, upstream_port)
+        return proxy
+
+def discard_proxy(public_port):
+    """Stops the proxy serving public_port (if any), releasing the port."""
+    with _proxies_lock:
+        proxy = _proxies.pop(public_port, None)
+    if proxy is not None:
+        proxy.close()
+
+def slot_port(public_port, slot, offset):
+    """Each slot listens on its own host port: public + offset (blue) or public + offset + 1 (green)."""
+    return public_port + offset + (0 if slot == BLUE else 1)
+
+def _state_path(state_dir, container_name):
+    return os.path.join(state_dir, f"{container_name}.json")
+
+def load_state(state_dir, container_name):
+    try:
+        with open(_state_path(state_dir, container_name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_state(state_dir, container_name, state):
+    os.makedirs(state_dir, exist_ok=True)
+    path = _state_path(state_dir, container_name)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+def restore_proxies(state_dir):
+    """Re-creates the proxies for every blue/green app after an agent restart, pointed at each active slot."""
+    if not os.path.isdir(state_dir):
+        return []
+    restored = []
+    for file_name in sorted(os.listdir(state_dir)):
+        if not file_name.endswith(".json"):
+            continue
+        state = load_state(state_dir, file_name[:-5])
+        if state.get("public_port") and state.get("slot_port"):
+            try:
+                ensure_proxy(state["public_port"], state["slot_port"])
+                restored.append(state["public_port"])
+            except OSError as e:
+                logger.error(f"Could not restore proxy on port {state['public_port']}: {e}")
+    return restored
+
+def _docker(*args):
+    result = subprocess.run(["docker", *args], capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        logger.debug(f"docker {' '.join(args)} exited {result.returncode}: {result.stderr.strip()}")
+    return result.returncode == 0
+
+def _remove_container(name):
+    _docker("rm", "-f", name)
+
+def _container_image(name):
+    """The id of the image a container runs, or None if there is no such container."""
+    result = subprocess.run(["docker", "inspect", "--format", "{{.Image}}", name],
+                            capture_output=True, text=True, timeout=30)
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip() or None
+
+def _container_running(name):
+    result = subprocess.run(["docker", "inspect", "--format", "{{.State.Running}}", name],
+                            capture_output=True, text=True, timeout=30)
+    return result.returncode == 0 and result.stdout.strip() == "true"
+
+def _slot_plan(plan, container_name, port):
+    """The planner's build step followed by (re)creating one slot's container on its own port."""
+    run = ["docker", "run", "-d", "--name", container_name, "--restart", "always",
+           "-p", f"{port}:{plan['container_port']}", plan["image_ref"]]
+    return {
+        **plan,
+        "steps": [
+            plan["steps"][0],
+            {"phase": "cleanup", "command": ["docker", "rm", "-f", container_name], "allow_failure": True},
+            {"phase": "run", "command": run, "allow_failure": False},
+        ],
+    }
+
+def _rollback(plan, state, new_container, proxy):
+    """Removes the failed slot, points :latest back at the previous image and makes sure the previous slot serves."""
+    name = plan["container_name"]
+    _remove_container(new_container)
+    previous_image = state.get("image_ref")
+    if not previous_image:
+        return False
+    _docker("tag", previous_image, f"{plan['image']}:latest")
+    previous_container = f"{name}-{state['active_slot']}"
+    if not _container_running(previous_container):
+        logger.warning(f"{previous_container} is not running; restarting it from {previous_image}.")
+        _remove_container(previous_container)
+        _docker("run", "-d", "--name", previous_container, "--restart", "always",
+                "-p", f"{state['slot_port']}:{plan['container_port']}", previous_image)
+    if proxy is not None:
+        proxy.switch(state["slot_port"])
+    return True
+
+def _restore_plain_container(plan, new_container, image, public_port):
+    """Undoes a failed first swap: removes the new slot and the proxy and restarts the stopped plain container."""
+    name = plan["container_name"]
+    _remove_container(new_container)
+    discard_proxy(public_port)
+    if image:
+        _docker("tag", image, f"{plan['image']}:latest")
+    return _docker("start", name)
+
+def blue_green_deploy(plan, workspace_dir, health_check, state_dir, port_offset=10000, **deploy_kwargs):
+    """
+    Deploys a planner plan without downtime. The new image is built and started in the idle slot
+    (blue/green) on its own port and health-checked there; only then is the local proxy on the
+    public port switched over atomically and the old slot retired. If the new slot fails its check
+    (before or right after the switch), it is removed, :latest is re-tagged to the previous image,
+    traffic stays on or returns to the previous slot, and DeploymentRolledBack is raised.
+
+    health_check(port, container_name) -> bool. Returns the deployment snapshot plus slot,
+    slot_port, public_port and swap_latency_s.
+    """
+    name = plan["container_name"]
+    public_port = plan["host_port"]
+    state = load_state(state_dir, name)
+    active_slot = state.get("active_slot")
+    new_slot = GREEN if active_slot == BLUE else BLUE
+    new_port = slot_port(public_port, new_slot, port_offset)
+    new_container = f"{name}-{new_slot}"
+    logger.info(f"Blue/green deploy of {plan['image_ref']} into {new_slot} slot (port {new_port}); active: {active_slot}.")
+
+    script_path = os.path.join(workspace_dir, SLOT_SCRIPT_NAME)
+    with open(script_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(render_script(_slot_plan(plan, new_container, new_port)))
+    try:
+        result = deploy_application(script_path, **deploy_kwargs)
+    except Exception:
+        _rollback(plan, state, new_container, proxy=None)
+        BLUE_GREEN_OUTCOMES.labels(outcome="failed").inc()
+        raise
+
+    if not health_check(new_port, new_container):
+        _rollback(plan, state, new_container, proxy=None)
+        BLUE_GREEN_OUTCOMES.labels(outcome="rolled_back").inc()
+        raise DeploymentRolledBack(f"{plan['image_ref']} failed its health check in the {new_slot} slot; kept {state.get('image_ref')}")
+
+    swap_started = time.monotonic()
+    plain_image = None
+    if active_slot is None:
+        # First blue/green deploy: the plain container still holds the public port the proxy needs. It is
+        # only stopped, so a swap that fails behind the proxy can bring it back.
+        plain_image = _container_image(name)
+        _docker("stop", name)
+    proxy = ensure_proxy(public_port, new_port)
+    proxy.switch(new_port)
+    swap_latency = time.monotonic() - swap_started
+
+    if not health_check(public_port, new_container):
+        if active_slot is None:
+            _restore_plain_container(plan, new_container, plain_image, public_port)
+        else:
+            _rollback(plan, state, new_container, proxy=proxy)
+        BLUE_GREEN_OUTCOMES.labels(outcome="rolled_back").inc()
+        raise DeploymentRolledBack(f"{plan['image_ref']} failed behind the proxy on port {public_port}; switched back")
+
+    _remove_container(name if active_slot is None else f"{name}-{active_slot}")
+    _save_state(state_dir, name, {
+        "active_slot": new_slot,
+        "image_ref": plan["image_ref"],
+        "previous_image_ref": state.get("image_ref"),
+        "public_port": public_port,
+        "slot_port": new_port,
+        "updated_at": time.time(),
+    })
+    BLUE_GREEN_SWAP_DURATION.observe(swap_latency)
+    BLUE_GREEN_OUTCOMES.labels(outcome="swapped").inc()
+    logger.info(f"{name} now serves {plan['image_ref']} from the {new_slot} slot (swap took {swap_latency * 1000:.1f}ms).")
+    return {**result, "slot": new_slot, "slot_port": new_port, "public_port": public_port,
+            "swap_latency_s": round(swap_latency, 6)}
@@ -1,8 +1,17 @@
 import subprocess
 import logging
+import logging.handlers
 import os
+import re
+import signal
 import sys
 import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from src.monitor.tracing import traced
 
 def _find_bash_on_windows():
     """Find a reliable bash executable on Windows, preferring Git Bash."""
@@ -18,14 +27,175 @@ def _find_bash_on_windows():
     # If not found in common locations, fall back to searching the PATH.
     return shutil.which("bash")
 
-def deploy_application(script_path):
-    """Deploy the application by executing the provided script file."""
+# Lines like `echo "--- Building image ---"` in a deployment script start a new timed phase.
+_PHASE_MARKER = re.compile(r"^-{3,}\s*(.+?)\s*-{3,}$")
+_PHASE_KEYWORDS = (("clean", "cleanup"), ("stop", "cleanup"), ("build", "build"), ("run", "run"), ("start", "run"))
+
+def phase_for_marker(line):
+    """Maps a phase marker line to 'cleanup', 'build', 'run' or a slug of its text; None if it isn't a marker."""
+    match = _PHASE_MARKER.match(line.strip())
+    if not match:
+        return None
+    text = match.group(1).lower()
+    for keyword, phase in _PHASE_KEYWORDS:
+        if keyword in text:
+            return phase
+    return re.sub(r"[^a-z0-9]+", "_", text).strip("_") or None
+
+class DeploymentLog:
+    """Live state of one script execution: a bounded ring buffer of output lines plus per-phase timings."""
+
+    def __init__(self, deployment_id, script_path, max_lines):
+        self.deployment_id = deployment_id
+        self.script_path = script_path
+        self.lines = deque(maxlen=max_lines)
+        self.status = "running"
+        self.returncode = None
+        self.started_at = time.time()
+        self.duration_s = None
+        self.phases = {}
+        self.log_path = None
+        self._phase = None
+        self._phase_started = None
+        self._lock = threading.Lock()
+
+    def append(self, line):
+        now = time.monotonic()
+        with self._lock:
+            self.lines.append(line)
+            phase = phase_for_marker(line)
+            if phase:
+                self._close_phase(now)
+                self._phase, self._phase_started = phase, now
+
+    def _close_phase(self, now):
+        if self._phase is not None:
+            self.phases[self._phase] = round(self.phases.get(self._phase, 0) + now - self._phase_started, 3)
+            self._phase = None
+
+    def finish(self, status, returncode, duration_s):
+        with self._lock:
+            self._close_phase(time.monotonic())
+            self.status, self.returncode, self.duration_s = status, returncode, round(duration_s, 3)
+
+    def tail(self, n=None):
+        with self._lock:
+            lines = list(self.lines)
+        if n is None:
+            return lines
+        return lines[-n:] if n > 0 else []
+
+    def snapshot(self, tail=None):
+        with self._lock:
+            phases = dict(self.phases)
+            if self._phase is not None:
+                phases[self._phase] = round(phases.get(self._phase, 0) + time.monotonic() - self._phase_started, 3)
+        return {
+            "deployment_id": self.deployment_id,
+            "script_path": self.script_path,
+            "status": self.status,
+            "returncode": self.returncode,
+            "started_at": self.started_at,
+            "duration_s": self.duration_s,
+            "phases": phases,
+            "log_path": self.log_path,
+            "lines": self.tail(tail),
+        }
+
+# Recent deployments (running or finished), oldest first, so the status endpoint can tail them.
+_recent_logs = OrderedDict()
+_recent_logs_lock = threading.Lock()
+MAX_RECENT_DEPLOYMENTS = 50
+
+def _register(deployment_log):
+    with _recent_logs_lock:
+        _recent_logs[deployment_log.deployment_id] = deployment_log
+        while len(_recent_logs) > MAX_RECENT_DEPLOYMENTS:
+            _recent_logs.popitem(last=False)
+
+def get_deployment_log(deployment_id):
+    with _recent_logs_lock:
+        return _recent_logs.get(deployment_id)
+
+def recent_deployments():
+    with _recent_logs_lock:
+        logs = list(_recent_logs.values())
+    return [{k: v for k, v in log.snapshot(tail=0).items() if k != "lines"} for log in reversed(logs)]
+
+def _file_logger(deployment_id, log_path, max_bytes, backups):
+    file_logger = logging.getLogger(f"{__name__}.run.{deployment_id}")
+    file_logger.propagate = False
+    file_logger.setLevel(logging.INFO)
+    handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    file_logger.addHandler(handler)
+    return file_logger
+
+def _close_file_logger(file_logger):
+    for handler in list(file_logger.handlers):
+        handler.close()
+        file_logger.removeHandler(handler)
+
+def _popen_group_kwargs():
+    """Runs the script in its own process group so a timeout can kill docker build and every other child."""
+    if sys.platform == "win32":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+def _kill_process_group(process, grace=5):
+    if process.poll() is not None:
+        return
+    try:
+        if sys.platform == "win32":
+            process.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=grace)
+    except (OSError, subprocess.TimeoutExpired):
+        if sys.platform == "win32":
+            process.kill()
+        else:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        process.wait()
+
+# How long to wait for the rest of the output once the script has exited.
+OUTPUT_DRAIN_TIMEOUT = 2.0
+
+def _kill_leftover_children(process):
+    """
+    Kills what remains of the script's process group after the script exited, e.g. a `cmd &` that
+    inherited stdout and keeps the pipe open.
+    """
+    if sys.platform == "win32":
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+@traced("deploy_application")
+def deploy_application(script_path, timeout=None, log_dir=None, tail_lines=500, log_max_bytes=5 * 1024 * 1024,
+                       log_backups=2, deployment_id=None):
+    """
+    Deploy the application by executing the provided script file, streaming its output line by line
+    into a ring buffer of tail_lines (see get_deployment_log) and, if log_dir is set, a rotating
+    <deployment_id>.log file. After timeout seconds the script's whole process group is killed.
+
+    Returns the deployment snapshot: status, returncode, duration_s and per-phase timings parsed from
+    `--- <phase> ---` markers. Raises CalledProcessError on a non-zero exit and TimeoutExpired on timeout.
+    """
+    deployment_id = deployment_id or uuid.uuid4().hex[:12]
+    deployment_log = DeploymentLog(deployment_id, script_path, tail_lines)
+    file_logger = None
     try:
         # Ensure the script exists before trying to execute it
         if not os.path.exists(script_path):
             raise FileNotFoundError(f"Deployment script not found at path: {script_path}")
 
-        logging.info(f"Executing deployment script: {script_path}")
+        logging.info(f"Executing deployment script: {script_path} (deployment {deployment_id})")
 
         # Make the script executable (only necessary on non-Windows systems)
         if sys.platform != "win32" and os.path.exists(script_path):
@@ -47,27 +217,74 @@ def deploy_application(script_path):
                 "Please install Git for Windows or WSL and ensure 'bash.exe' is in your system's PATH."
             )
 
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+            deployment_log.log_path = os.path.abspath(os.path.join(log_dir, f"{deployment_id}.log"))
+            file_logger = _file_logger(deployment_id, deployment_log.log_path, log_max_bytes, log_backups)
+        _register(deployment_log)
+
         # Execute the script using the found 'bash' executable. This is the most robust
         # method for cross-platform compatibility.
         command = [bash_executable, script_name]
         logging.info(f"Executing command: '{' '.join(command)}' in '{cwd}'")
-        result = subprocess.run(
+        started = time.monotonic()
+        process = subprocess.Popen(
             command,
-            check=True,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
             encoding='utf-8',
-            cwd=cwd
+            errors='replace',
+            bufsize=1,
+            cwd=cwd,
+            **_popen_group_kwargs()
         )
-        logging.info("Deployment successful.")
-        logging.info(f"Script output:\n{result.stdout}")
+
+        def _pump():
+            for line in process.stdout:
+                line = line.rstrip("\n")
+                deployment_log.append(line)
+                if file_logger:
+                    file_logger.info(line)
+                logging.debug(f"[deploy {deployment_id}] {line}")
+
+        reader = threading.Thread(target=_pump, name=f"deploy-log-{deployment_id}", daemon=True)
+        reader.start()
+        try:
+            returncode = process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill_process_group(process)
+            reader.join(timeout=5)
+            deployment_log.finish("timeout", process.returncode, time.monotonic() - started)
+            logging.error(f"Deployment script timed out after {timeout}s; killed its process group.")
+            raise subprocess.TimeoutExpired(command, timeout, output="\n".join(deployment_log.tail()))
+        reader.join(timeout=OUTPUT_DRAIN_TIMEOUT)
+        if reader.is_alive():
+            # A background child still holds stdout open; without this the pipe never reaches EOF.
+            logging.warning("Deployment script exited but left processes holding its output open; killing them.")
+            _kill_leftover_children(process)
+            reader.join(timeout=OUTPUT_DRAIN_TIMEOUT)
+
+        if returncode != 0:
+            deployment_log.finish("failed", returncode, time.monotonic() - started)
+            raise subprocess.CalledProcessError(returncode, command, output="\n".join(deployment_log.tail()))
+
+        deployment_log.finish("succeeded", returncode, time.monotonic() - started)
+        logging.info(f"Deployment successful in {deployment_log.duration_s}s (phases: {deployment_log.phases}).")
+        return deployment_log.snapshot(tail=0)
 
     except subprocess.CalledProcessError as e:
         # e.cmd is a list when shell=False, so we join it for logging.
         logging.error(f"Deployment script failed: Command '{' '.join(e.cmd)}' returned non-zero exit status {e.returncode}.")
-        if e.stdout: logging.error(f"STDOUT:\n{e.stdout}")
-        if e.stderr: logging.error(f"STDERR:\n{e.stderr}")
+        if e.output: logging.error(f"Last output:\n{e.output}")
         raise  # Re-raise the exception so the caller knows it failed.
+    except subprocess.TimeoutExpired:
+        raise
     except (FileNotFoundError, Exception) as e:
+        if deployment_log.status == "running":
+            deployment_log.finish("failed", None, time.time() - deployment_log.started_at)
         logging.error(f"An unexpected error occurred during deployment: {e}")
         raise
+    finally:
+        if file_logger:
+            _close_file_logger(file_logger)
@@ -0,0 +1,142 @@
+import glob
+import logging
+import os
+import shutil
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+
+class CheckoutError(Exception):
+    """Raised when a repository revision cannot be materialized in the workspace."""
+
+
+def _git(*args, cwd=None):
+    """Runs a git command and returns its stripped stdout."""
+    result = subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True)
+    return result.stdout.strip()
+
+
+def _redact(text, repo_url):
+    """Keeps access tokens embedded in the remote URL out of logs and exceptions."""
+    return (text or "").replace(repo_url, "<remote>") if repo_url else (text or "")
+
+
+def ensure_mirror(repo_url, mirror_dir, blob_filter="blob:none"):
+    """
+    Creates the shared bare mirror for a repository if needed and points it at repo_url.
+    With blob_filter set the mirror is a partial clone: commits and trees are fetched eagerly,
+    file contents only when a worktree checks them out.
+    """
+    if not os.path.exists(os.path.join(mirror_dir, "HEAD")):
+        logger.info(f"Initializing bare mirror at {mirror_dir}.")
+        os.makedirs(mirror_dir, exist_ok=True)
+        _git("init", "--bare", "--quiet", mirror_dir)
+        _git("-C", mirror_dir, "remote", "add", "origin", repo_url)
+        if blob_filter:
+            _git("-C", mirror_dir, "config", "remote.origin.promisor", "true")
+            _git("-C", mirror_dir, "config", "remote.origin.partialclonefilter", blob_filter)
+    else:
+        # The URL embeds the access token, which may have been rotated since the last sync.
+        _git("-C", mirror_dir, "remote", "set-url", "origin", repo_url)
+
+
+def fetch_revision(mirror_dir, branch, commit_sha=None, depth=1, blob_filter="blob:none", repo_url=None):
+    """
+    Fetches exactly what is about to be deployed with a single fetch and returns its commit SHA.
+    commit_sha (e.g. the webhook's 'after' or 'merge_commit_sha') is fetched directly; servers
+    that refuse fetching by SHA fall back to fetching the branch tip that contains it.
+    repo_url, if given, is redacted from logged git errors.
+    """
+    options = ["fetch", "--no-tags", "--quiet"]
+    if depth:
+        options.append(f"--depth={depth}")
+    if blob_filter:
+        options.append(f"--filter={blob_filter}")
+    branch_refspec = f"+refs/heads/{branch}:refs/heads/{branch}"
+
+    if commit_sha:
+        if _has_commit(mirror_dir, commit_sha):
+            logger.info(f"Commit {commit_sha[:12]} already present in mirror; skipping fetch.")
+            return commit_sha
+        try:
+            _git("-C", mirror_dir, *options, "origin", commit_sha)
+            return _git("-C", mirror_dir, "rev-parse", "--verify", f"{commit_sha}^{{commit}}")
+        except subprocess.CalledProcessError as e:
+            logger.warning(
+                f"Fetching commit {commit_sha[:12]} directly failed, fetching branch '{branch}': {_redact(e.stderr, repo_url)}"
+            )
+        _git("-C", mirror_dir, *options, "origin", branch_refspec)
+        if not _has_commit(mirror_dir, commit_sha):
+            raise CheckoutError(f"Commit {commit_sha} is not reachable from branch '{branch}'.")
+        return commit_sha
+
+    _git("-C", mirror_dir, *options, "origin", branch_refspec)
+    return _git("-C", mirror_dir, "rev-parse", "--verify", f"refs/heads/{branch}^{{commit}}")
+
+
+def _has_commit(mirror_dir, commit_sha):
+    try:
+        _git("-C", mirror_dir, "cat-file", "-e", f"{commit_sha}^{{commit}}")
+        return True
+    except subprocess.CalledProcessError:
+        return False
+
+
+def checkout_worktree(mirror_dir, worktree_dir, commit_sha, repo_url=None):
+    """
+    Moves the worktree for a branch to commit_sha, (re)creating it from the mirror if necessary.
+    repo_url, if given, is redacted from logged git errors (a partial clone fetches blobs during checkout).
+    """
+    if os.path.exists(os.path.join(worktree_dir, ".git")):
+        try:
+            _git("-C", worktree_dir, "checkout", "--quiet", "--force", "--detach", commit_sha)
+            _git("-C", worktree_dir, "clean", "-fdx", "--quiet")
+            return
+        except subprocess.CalledProcessError as e:
+            logger.warning(f"Worktree {worktree_dir} is unusable, recreating it from the mirror: {_redact(e.stderr, repo_url)}")
+    _recreate_worktree(mirror_dir, worktree_dir, commit_sha)
+
+
+def _recreate_worktree(mirror_dir, worktree_dir, commit_sha):
+    # Only the checkout is discarded; the mirror's object store is kept, so no refetch is needed.
+    if os.path.exists(worktree_dir):
+        shutil.rmtree(worktree_dir)
+    _git("-C", mirror_dir, "worktree", "prune")
+    os.makedirs(os.path.dirname(os.path.abspath(worktree_dir)), exist_ok=True)
+    _git("-C", mirror_dir, "worktree", "add", "--quiet", "--force", "--detach", worktree_dir, commit_sha)
+
+
+def repair_mirror(mirror_dir):
+    """Clears leftovers of an interrupted git process (stale lock files, dangling worktrees) without losing objects."""
+    stale_locks = glob.glob(os.path.join(mirror_dir, "*.lock")) + glob.glob(
+        os.path.join(mirror_dir, "refs", "**", "*.lock"), recursive=True
+    )
+    for lock_file in stale_locks:
+        logger.warning(f"Removing stale git lock file {lock_file}.")
+        os.remove(lock_file)
+    _git("-C", mirror_dir, "worktree", "prune")
+
+
+def sync_worktree(repo_url, mirror_dir, worktree_dir, branch, commit_sha=None, depth=1, blob_filter="blob:none"):
+    """
+    Materializes branch (or exactly commit_sha) of repo_url in worktree_dir and returns the checked-out SHA.
+    All branches of a repository share one bare mirror, so each extra branch is just a cheap worktree.
+    """
+    try:
+        ensure_mirror(repo_url, mirror_dir, blob_filter=blob_filter)
+        try:
+            revision = fetch_revision(
+                mirror_dir, branch, commit_sha, depth=depth, blob_filter=blob_filter, repo_url=repo_url
+            )
+        except subprocess.CalledProcessError as e:
+            logger.warning(f"Fetch into {mirror_dir} failed, repairing mirror and retrying: {_redact(e.stderr, repo_url)}")
+            repair_mirror(mirror_dir)
+            revision = fetch_revision(
+                mirror_dir, branch, commit_sha, depth=depth, blob_filter=blob_filter, repo_url=repo_url
+            )
+        checkout_worktree(mirror_dir, worktree_dir, revision, repo_url=repo_url)
+    except subprocess.CalledProcessError as e:
+        raise CheckoutError(f"git {_redact(' '.join(e.cmd[1:]), repo_url)} failed: {_redact(e.stderr, repo_url)}") from None
+    logger.info(f"Checked out {branch}@{revision[:12]} into {worktree_dir}.")
+    return revision
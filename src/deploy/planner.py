@@ -0,0 +1,222 @@
+import json
+import logging
+import os
+import re
+import shlex
+import subprocess
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 5000
+PLANNED_SCRIPT_NAME = "planned_deploy.sh"
+
+class PlanError(Exception):
+    """Raised when a workspace cannot be planned natively (e.g. it has no Dockerfile)."""
+
+def _dockerfile_instructions(path):
+    """Yields (INSTRUCTION, arguments) pairs, joining backslash continuations and skipping comments."""
+    with open(path, "r", encoding="utf-8") as f:
+        pending = ""
+        for raw in f:
+            line = raw.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.endswith("\\"):
+                pending += line[:-1] + " "
+                continue
+            line, pending = pending + line, ""
+            parts = line.split(None, 1)
+            yield parts[0].upper(), parts[1] if len(parts) > 1 else ""
+
+def parse_dockerfile(path):
+    """
+    Extracts what a deploy needs from a Dockerfile: the runtime base image (last FROM), exposed
+    container ports, the PORT env default and CMD. Multi-stage builds only count the final stage.
+    """
+    info = {"base_image": None, "exposed_ports": [], "env_port": None, "cmd": None}
+    args = {}
+    for instruction, value in _dockerfile_instructions(path):
+        if instruction == "ARG" and "=" in value:
+            name, default = value.split("=", 1)
+            args[name.strip()] = default.strip().strip('"')
+        elif instruction == "FROM":
+            image = value.split()[0]
+            info = {"base_image": re.sub(r"\$\{?(\w+)\}?", lambda m: args.get(m.group(1), m.group(0)), image),
+                    "exposed_ports": [], "env_port": None, "cmd": None}
+        elif instruction == "EXPOSE":
+            for port in value.split():
+                port = port.split("/")[0]
+                if port.isdigit():
+                    info["exposed_ports"].append(int(port))
+        elif instruction == "ENV":
+            match = re.search(r"\bPORT[=\s]+\"?(\d+)", value)
+            if match:
+                info["env_port"] = int(match.group(1))
+        elif instruction == "CMD":
+            info["cmd"] = value
+    return info
+
+def _compose_ports(workspace_dir):
+    """Returns (host_port, container_port) of the first service published in a compose file, if any."""
+    for name in ("docker-compose.yml", "docker-compose.yaml", "compose.yml", "compose.yaml"):
+        path = os.path.join(workspace_dir, name)
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                compose = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError) as e:
+            logger.warning(f"Could not parse {path}: {e}")
+            return None
+        for service in (compose.get("services") or {}).values():
+            for mapping in (service or {}).get("ports") or []:
+                # "8080:5000", "127.0.0.1:8080:5000/tcp" or the long syntax {target, published}.
+                if isinstance(mapping, dict) and mapping.get("target"):
+                    return int(mapping.get("published") or mapping["target"]), int(mapping["target"])
+                parts = str(mapping).split("/")[0].split(":")
+                if parts[-1].isdigit():
+                    host = parts[-2] if len(parts) > 1 and parts[-2].isdigit() else parts[-1]
+                    return int(host), int(parts[-1])
+    return None
+
+def _package_json_port(workspace_dir):
+    """Looks for an explicit port in package.json's start script (`--port 3000`, `PORT=3000`)."""
+    path = os.path.join(workspace_dir, "package.json")
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            start = (json.load(f).get("scripts") or {}).get("start") or ""
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not parse {path}: {e}")
+        return None
+    match = re.search(r"(?:--port[=\s]+|PORT=)(\d+)", start)
+    return int(match.group(1)) if match else None
+
+def _revision_tag(workspace_dir, commit_sha):
+    """A stable image tag for the checked-out revision: the short commit SHA."""
+    if commit_sha:
+        return commit_sha[:12]
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short=12", "HEAD"], cwd=workspace_dir,
+                                check=True, capture_output=True, text=True, timeout=10)
+        return result.stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return "latest"
+
+def plan_deployment(workspace_dir, container_name, commit_sha=None, host_port=None, cache_from=None):
+    """
+    Builds the docker build/run plan for a workspace from its Dockerfile (plus compose/package.json
+    for ports) without asking the LLM. The new image is built, tagged <name>:<sha> and <name>:latest
+    with --cache-from the previous :latest, before the old container is stopped, so downtime is only
+    the stop/run swap. cache_from adds further images (e.g. the last good deploy) as build cache sources.
+    Raises PlanError if there is no Dockerfile.
+
+    Returns a dict with image, tag, container/host port, base image and the ordered `steps`
+    ([{'phase', 'command', 'allow_failure'}]).
+    """
+    dockerfile = os.path.join(workspace_dir, "Dockerfile")
+    if not os.path.exists(dockerfile):
+        raise PlanError(f"No Dockerfile in {workspace_dir}")
+    docker = parse_dockerfile(dockerfile)
+    compose = _compose_ports(workspace_dir)
+
+    container_port = (
+        (docker["exposed_ports"] or [None])[0]
+        or docker["env_port"]
+        or (compose[1] if compose else None)
+        or _package_json_port(workspace_dir)
+        or DEFAULT_PORT
+    )
+    if host_port is None:
+        host_port = compose[0] if compose and compose[1] == container_port else container_port
+
+    image = container_name
+    tag = _revision_tag(workspace_dir, commit_sha)
+    image_ref = f"{image}:{tag}"
+    build = ["docker", "build", "--cache-from", f"{image}:latest"]
+    for extra in cache_from or []:
+        if extra and extra not in (f"{image}:latest", image_ref):
+            build += ["--cache-from", extra]
+    build += ["--build-arg", "BUILDKIT_INLINE_CACHE=1", "-t", image_ref, "-t", f"{image}:latest", "."]
+    run = ["docker", "run", "-d", "--name", container_name, "--restart", "always",
+           "-p", f"{host_port}:{container_port}", image_ref]
+    plan = {
+        "image": image,
+        "tag": tag,
+        "image_ref": image_ref,
+        "container_name": container_name,
+        "container_port": int(container_port),
+        "host_port": int(host_port),
+        "base_image": docker["base_image"],
+        "steps": [
+            {"phase": "build", "command": build, "allow_failure": False},
+            {"phase": "cleanup", "command": ["docker", "stop", container_name], "allow_failure": True},
+            {"phase": "cleanup", "command": ["docker", "rm", container_name], "allow_failure": True},
+            {"phase": "run", "command": run, "allow_failure": False},
+        ],
+    }
+    logger.info(f"Planned deployment of {image_ref} on port {host_port}->{container_port} (base {docker['base_image']}).")
+    return plan
+
+def rollback_plan(plan, image_ref):
+    """A plan that replaces the container with an already built image_ref (no build), e.g. the last good deploy."""
+    run = ["docker", "run", "-d", "--name", plan["container_name"], "--restart", "always",
+           "-p", f"{plan['host_port']}:{plan['container_port']}", image_ref]
+    return {
+        **plan,
+        "image_ref": image_ref,
+        "tag": image_ref.rsplit(":", 1)[-1],
+        "steps": [
+            {"phase": "cleanup", "command": ["docker", "rm", "-f", plan["container_name"]], "allow_failure": True},
+            {"phase": "run", "command": run, "allow_failure": False},
+            {"phase": "run", "command": ["docker", "tag", image_ref, f"{plan['image']}:latest"], "allow_failure": True},
+        ],
+    }
+
+def plan_commands(plan):
+    """The plan as a list of argv lists, in execution order (the dry-run output)."""
+    return [step["command"] for step in plan["steps"]]
+
+_PHASE_TITLES = {"build": "Building image", "cleanup": "Cleaning up old container", "run": "Running container"}
+
+def render_script(plan):
+    """Renders the plan as a bash script with `--- phase ---` markers, so deploy_application can stream and time it."""
+    lines = ["#!/bin/bash", "set -e", f"# Planned from Dockerfile; image {plan['image_ref']}, port {plan['host_port']}."]
+    current_phase = None
+    for step in plan["steps"]:
+        if step["phase"] != current_phase:
+            current_phase = step["phase"]
+            lines.append(f'echo "--- {_PHASE_TITLES.get(current_phase, current_phase)} ---"')
+        command = " ".join(shlex.quote(part) for part in step["command"])
+        lines.append(f"{command} || true" if step["allow_failure"] else command)
+    return "\n".join(lines) + "\n"
+
+def write_planned_script(plan, workspace_dir, file_name=PLANNED_SCRIPT_NAME):
+    path = os.path.join(workspace_dir, file_name)
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(render_script(plan))
+    return path
+
+def execute_plan(plan, workspace_dir, dry_run=False, **deploy_kwargs):
+    """
+    Runs the plan through deploy_application (streamed output, timeout, phase timing) and returns its snapshot.
+    With dry_run, nothing is written or executed and {'dry_run': True, 'commands': [...]} is returned.
+    """
+    if dry_run:
+        return {"dry_run": True, "commands": plan_commands(plan)}
+    from src.deploy.deployer import deploy_application
+    return deploy_application(write_planned_script(plan, workspace_dir), **deploy_kwargs)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print the deploy plan for a checked-out repository (dry run).")
+    parser.add_argument("workspace_dir")
+    parser.add_argument("container_name")
+    parser.add_argument("--commit-sha")
+    args = parser.parse_args()
+    for command in plan_commands(plan_deployment(args.workspace_dir, args.container_name, args.commit_sha)):
+        print(" ".join(shlex.quote(part) for part in command))
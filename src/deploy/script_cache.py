@@ -0,0 +1,131 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+
+
+class ScriptCache:
+    """
+    Content-addressed on-disk cache of generated deployment scripts.
+    Entries are evicted least-recently-used once max_entries is exceeded, and expire after ttl_seconds.
+    The directory is created and the index loaded on first use, not when the cache is constructed.
+    """
+
+    def __init__(self, cache_dir, max_entries=128, ttl_seconds=7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._loaded_index = None
+
+    @property
+    def _index(self):
+        # Only accessed with self._lock held.
+        if self._loaded_index is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._loaded_index = self._load_index()
+        return self._loaded_index
+
+    @staticmethod
+    def make_key(app_context, container_name, prompt_version):
+        """Hashes everything that influences the generated script."""
+        digest = hashlib.sha256()
+        for part in (prompt_version, container_name, app_context):
+            digest.update(str(part).encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Returns the cached script for key, or None on a miss."""
+        with self._lock:
+            entry = self._index.get(key)
+            path = self._script_path(key)
+            if entry and time.time() - entry["created_at"] > self.ttl_seconds:
+                self._remove(key)
+                entry = None
+            if entry is None or not os.path.exists(path):
+                self.misses += 1
+                return None
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    script = f.read()
+            except OSError as e:
+                logger.warning(f"Could not read cached deployment script {path}: {e}")
+                self._remove(key)
+                self.misses += 1
+                return None
+            entry["last_used"] = time.time()
+            self.hits += 1
+            self._save_index()
+            return script
+
+    def put(self, key, script):
+        with self._lock:
+            path = self._script_path(key)
+            with open(path, "w", encoding="utf-8", newline="\n") as f:
+                f.write(script)
+            now = time.time()
+            self._index[key] = {"created_at": now, "last_used": now}
+            self._evict()
+            self._save_index()
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._index:
+                self._remove(key)
+                self._save_index()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._index),
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _evict(self):
+        while len(self._index) > self.max_entries:
+            oldest = min(self._index, key=lambda k: self._index[k]["last_used"])
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        self._index.pop(key, None)
+        try:
+            os.remove(self._script_path(key))
+        except FileNotFoundError:
+            pass
+
+    def _script_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.sh")
+
+    def _load_index(self):
+        path = os.path.join(self.cache_dir, INDEX_FILE)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable deployment script cache index {path}: {e}")
+            return {}
+
+    def _save_index(self):
+        # Write to a temp file and rename so a crash never leaves a truncated index behind.
+        path = os.path.join(self.cache_dir, INDEX_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, path)
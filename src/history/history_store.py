@@ -0,0 +1,242 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Run outcomes
+RUN_RUNNING = "running"
+RUN_SUCCEEDED = "succeeded"
+RUN_FAILED = "failed"
+RUN_SKIPPED = "skipped"
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS runs (
+        id TEXT PRIMARY KEY,
+        pipeline TEXT NOT NULL,
+        repo TEXT NOT NULL,
+        branch TEXT,
+        commit_sha TEXT,
+        status TEXT NOT NULL,
+        started_at REAL NOT NULL,
+        finished_at REAL,
+        duration_s REAL,
+        error TEXT,
+        image_ref TEXT,
+        script_hash TEXT,
+        data TEXT NOT NULL DEFAULT '{}'
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_runs_repo_branch_started ON runs (repo, branch, started_at)",
+    "CREATE INDEX IF NOT EXISTS idx_runs_commit ON runs (commit_sha)",
+    "CREATE INDEX IF NOT EXISTS idx_runs_started ON runs (started_at)",
+    """
+    CREATE TABLE IF NOT EXISTS stages (
+        run_id TEXT NOT NULL,
+        stage TEXT NOT NULL,
+        status TEXT NOT NULL,
+        started_at REAL NOT NULL,
+        duration_s REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_stages_run ON stages (run_id)",
+    "CREATE INDEX IF NOT EXISTS idx_stages_stage_started ON stages (stage, started_at)",
+]
+
+# Run columns that can be set directly; anything else passed to update_run is merged into the JSON `data` column.
+# status/error are set this way when a finished run turns out bad later (e.g. its post-deploy watch breached).
+_RUN_COLUMNS = {"commit_sha", "image_ref", "script_hash", "status", "error"}
+
+
+def _percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * pct // 100))
+    return values[int(rank) - 1]
+
+
+class DeploymentHistory:
+    """
+    Embedded SQLite (WAL) record of every pipeline run: what was decided, deployed and measured at each stage.
+    Read by the webhook server's /history endpoints and by the orchestrator for build-cache and rollback hints.
+    The database file is created on first use, not when the store is constructed (e.g. at import).
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _initialize(self):
+        with self._init_lock:
+            if self._initialized:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+            finally:
+                conn.close()
+            self._initialized = True
+
+    def _connect(self):
+        """Returns a per-thread connection; sqlite3 connections must not be shared across threads."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self._initialize()
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def start_run(self, pipeline, repo, branch=None, commit_sha=None, **data):
+        run_id = uuid.uuid4().hex
+        self._connect().execute(
+            "INSERT INTO runs (id, pipeline, repo, branch, commit_sha, status, started_at, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (run_id, pipeline, repo, branch, commit_sha, RUN_RUNNING, time.time(), json.dumps(data, default=str)),
+        )
+        return run_id
+
+    def update_run(self, run_id, **fields):
+        """Sets commit_sha/image_ref/script_hash/status/error columns and merges every other field into the run's JSON data."""
+        conn = self._connect()
+        columns = {k: v for k, v in fields.items() if k in _RUN_COLUMNS}
+        extra = {k: v for k, v in fields.items() if k not in _RUN_COLUMNS}
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if extra:
+                row = conn.execute("SELECT data FROM runs WHERE id = ?", (run_id,)).fetchone()
+                data = json.loads(row["data"]) if row else {}
+                data.update(extra)
+                columns["data"] = json.dumps(data, default=str)
+            if columns:
+                assignments = ", ".join(f"{column} = ?" for column in columns)
+                conn.execute(f"UPDATE runs SET {assignments} WHERE id = ?", (*columns.values(), run_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def finish_run(self, run_id, status, error=None):
+        now = time.time()
+        self._connect().execute(
+            "UPDATE runs SET status = ?, error = ?, finished_at = ?, duration_s = ? - started_at WHERE id = ?",
+            (status, str(error) if error else None, now, now, run_id),
+        )
+
+    def record_stage(self, run_id, stage, duration_s, status="ok", started_at=None):
+        self._connect().execute(
+            "INSERT INTO stages (run_id, stage, status, started_at, duration_s) VALUES (?, ?, ?, ?, ?)",
+            (run_id, stage, status, started_at or time.time() - duration_s, duration_s),
+        )
+
+    @contextmanager
+    def stage(self, run_id, stage):
+        """Times the enclosed block as one stage of the run; a raised exception records it as 'failed'."""
+        started_at, started = time.time(), time.monotonic()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "failed"
+            raise
+        finally:
+            try:
+                self.record_stage(run_id, stage, time.monotonic() - started, status, started_at)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not record stage {stage} of run {run_id}: {e}")
+
+    def _run_dict(self, row):
+        run = dict(row)
+        run["data"] = json.loads(run["data"] or "{}")
+        return run
+
+    def get_run(self, run_id):
+        """Returns the run with its stages in execution order, or None."""
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        run = self._run_dict(row)
+        run["stages"] = [dict(stage) for stage in conn.execute(
+            "SELECT stage, status, started_at, duration_s FROM stages WHERE run_id = ? ORDER BY started_at", (run_id,)
+        )]
+        return run
+
+    def recent_runs(self, repo=None, branch=None, limit=20):
+        query, params = "SELECT * FROM runs", []
+        filters = [(column, value) for column, value in (("repo", repo), ("branch", branch)) if value]
+        if filters:
+            query += " WHERE " + " AND ".join(f"{column} = ?" for column, _ in filters)
+            params = [value for _, value in filters]
+        query += " ORDER BY started_at DESC LIMIT ?"
+        return [self._run_dict(row) for row in self._connect().execute(query, (*params, limit))]
+
+    def newer_run(self, run_id):
+        """The newest run of the same repo@branch that started after run_id, or None (also for an unknown run_id)."""
+        conn = self._connect()
+        run = conn.execute("SELECT repo, branch, started_at FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if run is None:
+            return None
+        row = conn.execute(
+            "SELECT * FROM runs WHERE repo = ? AND branch IS ? AND started_at > ? AND id != ? ORDER BY started_at DESC LIMIT 1",
+            (run["repo"], run["branch"], run["started_at"], run_id),
+        ).fetchone()
+        return self._run_dict(row) if row else None
+
+    def last_successful_run(self, repo, branch=None, require_image=False):
+        """The newest succeeded run for repo (and branch); with require_image, only runs that recorded an image."""
+        query = "SELECT * FROM runs WHERE repo = ? AND status = ?"
+        params = [repo, RUN_SUCCEEDED]
+        if branch:
+            query += " AND branch = ?"
+            params.append(branch)
+        if require_image:
+            query += " AND image_ref IS NOT NULL"
+        row = self._connect().execute(query + " ORDER BY started_at DESC LIMIT 1", params).fetchone()
+        return self._run_dict(row) if row else None
+
+    def deploy_frequency(self, since_s=7 * 86400):
+        """Per repo: successful deploys in the window and deploys per day. since_s must be positive."""
+        if since_s <= 0:
+            raise ValueError(f"since_s must be positive, got {since_s}")
+        days = since_s / 86400
+        rows = self._connect().execute(
+            "SELECT repo, COUNT(*) AS deploys FROM runs WHERE status = ? AND started_at >= ? GROUP BY repo ORDER BY deploys DESC",
+            (RUN_SUCCEEDED, time.time() - since_s),
+        )
+        return [{"repo": row["repo"], "deploys": row["deploys"], "per_day": round(row["deploys"] / days, 3)} for row in rows]
+
+    def stage_durations(self, since_s=7 * 86400, percentiles=(50, 95)):
+        """Per stage: count and duration percentiles (seconds) over the window."""
+        by_stage = {}
+        for row in self._connect().execute(
+            "SELECT stage, duration_s FROM stages WHERE started_at >= ? ORDER BY stage, duration_s", (time.time() - since_s,)
+        ):
+            by_stage.setdefault(row["stage"], []).append(row["duration_s"])
+        return {
+            stage: {"count": len(durations), **{f"p{p}": round(_percentile(durations, p), 3) for p in percentiles}}
+            for stage, durations in by_stage.items()
+        }
+
+    def failure_rates(self, since_s=7 * 86400):
+        """Per repo: finished runs, failed runs and the failure rate over the window (skipped runs excluded)."""
+        rows = self._connect().execute(
+            "SELECT repo, COUNT(*) AS runs, SUM(status = ?) AS failed FROM runs "
+            "WHERE started_at >= ? AND status IN (?, ?) GROUP BY repo ORDER BY repo",
+            (RUN_FAILED, time.time() - since_s, RUN_SUCCEEDED, RUN_FAILED),
+        )
+        return [
+            {"repo": row["repo"], "runs": row["runs"], "failed": row["failed"], "failure_rate": round(row["failed"] / row["runs"], 3)}
+            for row in rows
+        ]
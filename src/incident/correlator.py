@@ -0,0 +1,248 @@
+import hashlib
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from loguru import logger
+
+from src.incident.dispatcher import CHANNEL_EMAIL, default_updaters, dispatch_incident
+
+# Dominant metric signatures, most specific first; matched against the reasons of a decision.
+_SIGNATURES = (
+    ("target_down", ("target is down", "target down")),
+    ("5xx", ("5xx", "server error")),
+    ("latency", ("latency", "slow", "timeout")),
+    ("4xx", ("4xx", "client error")),
+)
+SIGNATURE_OTHER = "other"
+
+
+def metric_signature(text):
+    """The dominant signal named in a decision's reasons or analysis text, e.g. '5xx' or 'latency'."""
+    lowered = (text or "").lower()
+    for signature, needles in _SIGNATURES:
+        if any(needle in lowered for needle in needles):
+            return signature
+    return SIGNATURE_OTHER
+
+
+def fingerprint(repo, branch, stage, signature):
+    """Identifies an ongoing problem: the same repo, branch, failing stage and dominant metric signature."""
+    return hashlib.sha256(f"{repo}\0{branch}\0{stage}\0{signature}".encode("utf-8")).hexdigest()[:16]
+
+
+def _clock_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class IncidentCorrelator:
+    """
+    Turns a stream of incident reports into one ticket per ongoing problem.
+
+    Reports are fingerprinted (see fingerprint()) and kept in an IncidentStore. The first occurrence
+    opens an issue/ticket on each channel right away. Repeats are queued instead and delivered in
+    batches: one comment per existing ticket, and a single digest email per channel. Each channel
+    also gets at most rate_limit messages per rate_window seconds; past that, new incidents wait for
+    the next digest. flush() delivers the digests that are due. start() runs it every digest_interval
+    seconds on a background thread.
+    """
+
+    def __init__(self, store, senders=None, updaters=None, digest_interval=300.0, rate_limit=5,
+                 rate_window=600.0, resolve_after=6 * 3600.0, clock=time.time):
+        self.store = store
+        self.senders = senders
+        self.updaters = updaters
+        self.digest_interval = digest_interval
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.resolve_after = resolve_after
+        self.clock = clock
+        self._sent = {}
+        self._last_flush = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _take(self, channel, now):
+        """Uses one of the channel's messages in the current rate window; False when it has none left."""
+        with self._lock:
+            sent = self._sent.setdefault(channel, deque())
+            while sent and sent[0] <= now - self.rate_window:
+                sent.popleft()
+            if self.rate_limit and len(sent) >= self.rate_limit:
+                return False
+            sent.append(now)
+            return True
+
+    def report(self, payload, channels, repo, branch=None, stage=None, signature=None, severity=None):
+        """
+        Records an incident and notifies channels: immediately for a new incident (within the rate
+        limit), otherwise (or when the immediate send fails) through the next digest. Returns
+        {'incident_id', 'fingerprint', 'created', 'occurrences', 'notifications' (dispatch outcomes of
+        the immediate sends), 'deferred' (channels)}.
+        """
+        now = self.clock()
+        signature = signature or metric_signature(payload.get("description"))
+        key = fingerprint(repo, branch, stage, signature)
+        incident, created = self.store.record(
+            key, repo, branch, stage, signature, severity, payload, now, self.resolve_after
+        )
+        immediate, deferred = [], []
+        for channel in dict.fromkeys(channels):
+            if created and self._take(channel, now):
+                immediate.append(channel)
+            else:
+                deferred.append(channel)
+                self.store.queue(channel, incident["id"], self._summary(payload, stage, signature, now), now)
+
+        notifications = {}
+        if immediate:
+            notifications = dispatch_incident(payload, immediate, senders=self.senders)
+            for channel, outcome in notifications.items():
+                if outcome["ok"]:
+                    if outcome["result"]:
+                        self.store.set_ticket(incident["id"], channel, str(outcome["result"]))
+                    continue
+                # Retries are exhausted; the next digest opens the ticket (or sends the email) instead.
+                deferred.append(channel)
+                self.store.queue(channel, incident["id"], self._summary(payload, stage, signature, now), now)
+        if created:
+            logger.info(f"Opened incident {incident['id']} ({repo}@{branch}, {stage}, {signature}).")
+            if deferred:
+                logger.warning(f"Incident {incident['id']}: notifying {deferred} in the next digest instead.")
+        else:
+            logger.info(
+                f"Incident {incident['id']} ({repo}@{branch}, {stage}, {signature}) recurred "
+                f"({incident['occurrences']} occurrences); notifying {deferred} in the next digest."
+            )
+        return {
+            "incident_id": incident["id"],
+            "fingerprint": key,
+            "created": created,
+            "occurrences": incident["occurrences"],
+            "notifications": notifications,
+            "deferred": deferred,
+        }
+
+    @staticmethod
+    def _summary(payload, stage, signature, now):
+        description = (payload.get("description") or "").strip().splitlines()
+        return f"{_clock_time(now)} [{stage or 'unknown stage'}, {signature}] {description[0] if description else payload.get('title', '')}"
+
+    def resolve(self, repo, branch=None):
+        """Marks the open incidents of repo@branch resolved, e.g. once a later deploy is healthy."""
+        return self.store.resolve(repo, branch, self.clock())
+
+    def flush(self, force=False):
+        """
+        Delivers the queued notifications of every channel whose digest is due (or all, with force) and
+        that has a message left in its rate window. Returns {channel: number of notifications delivered}.
+        """
+        delivered = {}
+        with self._flush_lock:
+            for channel in self.store.pending_channels():
+                now = self.clock()
+                if not force and now - self._last_flush.get(channel, 0) < self.digest_interval:
+                    continue
+                if not self._take(channel, now):
+                    continue
+                self._last_flush[channel] = now
+                delivered[channel] = self._flush_channel(channel)
+        return delivered
+
+    def _flush_channel(self, channel):
+        pending = self.store.pending(channel)
+        by_incident = {}
+        for item in pending:
+            by_incident.setdefault(item["incident_id"], []).append(item)
+        incidents = {incident_id: self.store.get(incident_id) for incident_id in by_incident}
+
+        if channel == CHANNEL_EMAIL:
+            # Messages cannot be updated, so every queued notification goes out in one digest email.
+            payload = self._digest_payload(incidents, by_incident)
+            outcome = dispatch_incident(payload, [channel], senders=self.senders)[channel]
+            if not outcome["ok"]:
+                return 0
+            self.store.ack([item["id"] for item in pending])
+            return len(pending)
+
+        acked = []
+        for incident_id, items in by_incident.items():
+            incident = incidents[incident_id]
+            if incident is None:
+                acked += [item["id"] for item in items]
+                continue
+            ticket = incident["tickets"].get(channel)
+            payload = self._update_payload(incident, items, ticket)
+            if ticket:
+                updaters = self.updaters if self.updaters is not None else default_updaters()
+                update = updaters.get(channel)
+                senders = {channel: lambda payload, update=update, ticket=ticket: update(ticket, payload)} if update else {}
+                outcome = dispatch_incident(payload, [channel], senders=senders)[channel]
+            else:
+                # No ticket yet (rate-limited or failed when the incident opened): open it now, with the history so far.
+                outcome = dispatch_incident(payload, [channel], senders=self.senders)[channel]
+                if outcome["ok"] and outcome["result"]:
+                    self.store.set_ticket(incident_id, channel, str(outcome["result"]))
+            if outcome["ok"]:
+                acked += [item["id"] for item in items]
+        self.store.ack(acked)
+        return len(acked)
+
+    @staticmethod
+    def _history(items):
+        return "\n".join(f"- {item['summary']}" for item in items)
+
+    def _update_payload(self, incident, items, ticket):
+        payload = dict(incident["payload"])
+        if ticket:
+            payload["description"] = (
+                f"Seen {len(items)} more time(s) since the last update "
+                f"({incident['occurrences']} occurrences since {_clock_time(incident['opened_at'])}):\n"
+                f"{self._history(items)}\n\n**Latest analysis:**\n{incident['payload'].get('description', '')}"
+            )
+        else:
+            payload["description"] = (
+                f"{incident['payload'].get('description', '')}\n\n"
+                f"**Occurrences ({incident['occurrences']}):**\n{self._history(items)}"
+            )
+        return payload
+
+    def _digest_payload(self, incidents, by_incident):
+        sections = []
+        recipient = None
+        for incident_id, items in by_incident.items():
+            incident = incidents[incident_id] or {"title": incident_id, "tickets": {}, "payload": {}}
+            recipient = recipient or incident["payload"].get("recipient")
+            tickets = ", ".join(str(ref) for ref in incident["tickets"].values()) or "no ticket yet"
+            sections.append(
+                f"{incident['title']} ({incident.get('repo')}@{incident.get('branch')}, {incident.get('stage')}, "
+                f"{incident.get('signature')}): {incident.get('occurrences')} occurrence(s); tickets: {tickets}\n"
+                f"{self._history(items)}"
+            )
+        count = sum(len(items) for items in by_incident.values())
+        return {
+            "title": f"Incident digest: {count} notification(s) for {len(by_incident)} incident(s)",
+            "description": "\n\n".join(sections),
+            "recipient": recipient,
+        }
+
+    def start(self):
+        """Flushes due digests every digest_interval seconds on a daemon thread (no-op once running)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="incident-digest", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.digest_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Incident digest flush failed: {e!r}")
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,141 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from loguru import logger
+from src.config.settings import (
+    GITHUB_TOKEN,
+    JIRA_URL,
+    JIRA_USER,
+    JIRA_API_TOKEN,
+    EMAIL_SMTP_SERVER,
+    EMAIL_PORT,
+    EMAIL_USER,
+    EMAIL_PASSWORD,
+    INCIDENT_CHANNEL_TIMEOUT,
+    INCIDENT_RETRIES,
+    INCIDENT_RETRY_BACKOFF,
+)
+from src.incident.github_issues import comment_on_github_issue, create_github_issue, find_github_issue
+from src.incident.jira_client import comment_on_jira_ticket, create_jira_ticket, find_jira_ticket
+from src.incident.email_notifier import send_email_notification
+from src.monitor.tracing import propagate, span
+
+CHANNEL_GITHUB = "github"
+CHANNEL_JIRA = "jira"
+CHANNEL_EMAIL = "email"
+CHANNELS = (CHANNEL_GITHUB, CHANNEL_JIRA, CHANNEL_EMAIL)
+
+# Shared across incidents so channel sends never queue behind each other.
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="incident")
+
+def default_senders():
+    """Maps each channel to a callable that delivers an incident payload with the configured credentials."""
+    return {
+        CHANNEL_GITHUB: lambda payload: create_github_issue(GITHUB_TOKEN, payload),
+        CHANNEL_JIRA: lambda payload: create_jira_ticket(JIRA_URL, JIRA_USER, JIRA_API_TOKEN, payload),
+        CHANNEL_EMAIL: lambda payload: send_email_notification(
+            EMAIL_SMTP_SERVER, EMAIL_PORT, EMAIL_USER, EMAIL_PASSWORD, payload
+        ),
+    }
+
+def default_updaters():
+    """Maps each ticket channel to a callable (ticket, payload) that comments on an issue/ticket it opened earlier."""
+    return {
+        CHANNEL_GITHUB: lambda ticket, payload: comment_on_github_issue(GITHUB_TOKEN, ticket, payload),
+        CHANNEL_JIRA: lambda ticket, payload: comment_on_jira_ticket(JIRA_URL, JIRA_USER, JIRA_API_TOKEN, ticket, payload),
+    }
+
+def default_lookups():
+    """
+    Maps each ticket channel to a callable (payload, since) that finds an issue/ticket a failed create may
+    still have opened (e.g. a read timeout after the server acted). Creates are not idempotent, so they are
+    only retried once the lookup found nothing.
+    """
+    return {
+        CHANNEL_GITHUB: lambda payload, since: find_github_issue(GITHUB_TOKEN, payload, since),
+        CHANNEL_JIRA: lambda payload, since: find_jira_ticket(JIRA_URL, JIRA_USER, JIRA_API_TOKEN, payload, since),
+    }
+
+def parse_channels(text):
+    """Extracts the known channel names from free text such as an LLM reply."""
+    lowered = (text or "").lower()
+    return [channel for channel in CHANNELS if channel in lowered]
+
+def _send_with_retries(channel, sender, payload, retries, backoff, deadline, lookup=None):
+    with span(f"incident.{channel}") as current:
+        outcome = _attempt_send(channel, sender, payload, retries, backoff, deadline, lookup)
+        current.set(attempts=outcome["attempts"], ok=outcome["ok"])
+    return outcome
+
+def _attempt_send(channel, sender, payload, retries, backoff, deadline, lookup=None):
+    outcome = {"ok": False, "result": None, "error": None, "attempts": 0, "duration_s": None}
+    started = time.monotonic()
+    # A minute of slack for clock skew between the agent and the ticket system.
+    created_since = time.time() - 60
+    for attempt in range(retries + 1):
+        if attempt and lookup is not None:
+            try:
+                existing = lookup(payload, created_since)
+            except Exception as e:
+                # Without knowing whether the failed attempt created a ticket, retrying could file a duplicate.
+                outcome["error"] = f"{outcome['error']} (not retried: lookup of an existing ticket failed: {e})"
+                break
+            if existing:
+                logger.info(f"Incident channel '{channel}': the failed attempt had created {existing}; not retrying.")
+                outcome.update(ok=True, result=existing, error=None)
+                break
+        outcome["attempts"] = attempt + 1
+        try:
+            outcome["result"] = sender(payload)
+            outcome["ok"] = True
+            outcome["error"] = None
+            break
+        except Exception as e:
+            outcome["error"] = str(e)
+            delay = backoff * (2 ** attempt)
+            if attempt == retries or time.monotonic() + delay >= deadline:
+                break
+            logger.warning(f"Incident channel '{channel}' attempt {attempt + 1} failed, retrying in {delay:.1f}s: {e}")
+            time.sleep(delay)
+    outcome["duration_s"] = round(time.monotonic() - started, 3)
+    return outcome
+
+def dispatch_incident(incident_payload, channels, senders=None, timeout=None, retries=None, backoff=None, lookups=None):
+    """
+    Sends the incident to all selected channels concurrently and returns {channel: outcome}.
+    Each outcome has 'ok', 'result' (e.g. the issue URL), 'error', 'attempts' and 'duration_s'.
+    A channel that has not finished within timeout seconds is reported as timed out; it never
+    delays the other channels. lookups (default: default_lookups() with the default senders)
+    are consulted before retrying a channel, see default_lookups().
+    """
+    if lookups is None:
+        lookups = default_lookups() if senders is None else {}
+    senders = senders or default_senders()
+    timeout = INCIDENT_CHANNEL_TIMEOUT if timeout is None else timeout
+    retries = INCIDENT_RETRIES if retries is None else retries
+    backoff = INCIDENT_RETRY_BACKOFF if backoff is None else backoff
+    deadline = time.monotonic() + timeout
+
+    results = {}
+    futures = {}
+    for channel in dict.fromkeys(channels):
+        sender = senders.get(channel)
+        if sender is None:
+            results[channel] = {"ok": False, "result": None, "error": "unknown channel", "attempts": 0, "duration_s": 0.0}
+            continue
+        futures[channel] = _executor.submit(
+            propagate(_send_with_retries), channel, sender, incident_payload, retries, backoff, deadline, lookups.get(channel)
+        )
+
+    wait(futures.values(), timeout=timeout)
+    for channel, future in futures.items():
+        if future.done():
+            results[channel] = future.result()
+        else:
+            results[channel] = {
+                "ok": False, "result": None, "error": f"timed out after {timeout}s", "attempts": None, "duration_s": timeout
+            }
+        if results[channel]["ok"]:
+            logger.info(f"Incident sent via {channel}: {results[channel]['result']}")
+        else:
+            logger.error(f"Incident channel '{channel}' failed: {results[channel]['error']}")
+    return results
@@ -1,9 +1,42 @@
 
 import smtplib
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from loguru import logger
 
+# Authenticated SMTP sessions kept open between incidents, keyed by (server, port, user).
+# smtplib connections are not thread-safe, so each one is used under its own lock.
+_connections = {}
+_connections_lock = threading.Lock()
+
+def _connect(smtp_server, port, user, password, timeout):
+    server = smtplib.SMTP(smtp_server, port, timeout=timeout)
+    server.starttls()
+    server.login(user, password)
+    return server
+
+def _is_alive(server):
+    try:
+        return server.noop()[0] == 250
+    except (smtplib.SMTPException, OSError):
+        return False
+
+def _send_pooled(smtp_server, port, user, password, recipient, message, timeout=15):
+    key = (smtp_server, str(port), user)
+    with _connections_lock:
+        entry = _connections.setdefault(key, {"server": None, "lock": threading.Lock()})
+    with entry["lock"]:
+        if entry["server"] is None or not _is_alive(entry["server"]):
+            entry["server"] = _connect(smtp_server, port, user, password, timeout)
+        try:
+            entry["server"].sendmail(user, recipient, message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # The server dropped an idle session between the liveness check and the send. Other SMTP
+            # errors (refused recipients, rejected data) are not retried: the message may already be out.
+            entry["server"] = _connect(smtp_server, port, user, password, timeout)
+            entry["server"].sendmail(user, recipient, message)
+
 def send_email_notification(smtp_server, port, user, password, incident_data):
     """
     Send an email notification for the incident using real SMTP logic.
@@ -17,10 +50,7 @@ def send_email_notification(smtp_server, port, user, password, incident_data):
         msg['Subject'] = incident_data.get('title', 'Incident Notification')
         msg.attach(MIMEText(incident_data.get('description', ''), 'plain'))
 
-        with smtplib.SMTP(smtp_server, port) as server:
-            server.starttls()
-            server.login(user, password)
-            server.sendmail(user, incident_data.get('recipient'), msg.as_string())
+        _send_pooled(smtp_server, port, user, password, incident_data.get('recipient'), msg.as_string())
         logger.info("Email notification sent successfully.")
     except Exception as e:
         logger.error(f"Failed to send email notification: {e}")
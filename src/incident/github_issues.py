@@ -1,7 +1,34 @@
-
-from github import Github
+import threading
+from datetime import datetime, timezone
 from loguru import logger
 
+INCIDENT_LABEL = "incident"
+
+# Long-lived clients per token and label lookups per repo, shared by all incidents in this process.
+_clients = {}
+_label_cache = {}
+_lock = threading.Lock()
+
+def _get_client(token, timeout=15):
+    with _lock:
+        client = _clients.get(token)
+        if client is None:
+            # PyGithub takes a noticeable time to import; only incidents pay for it.
+            from github import Github
+            client = Github(token, timeout=timeout)
+            _clients[token] = client
+        return client
+
+def _incident_labels(repo):
+    """Returns the labels to apply to incident issues in repo, looking the label up only once per repo."""
+    with _lock:
+        if repo.full_name in _label_cache:
+            return _label_cache[repo.full_name]
+    labels = [l for l in repo.get_labels() if l.name == INCIDENT_LABEL]
+    with _lock:
+        _label_cache[repo.full_name] = labels
+    return labels
+
 def create_github_issue(token, incident_data, repo_full_name=None):
     """
     Create a GitHub issue for the incident using PyGithub.
@@ -9,7 +36,7 @@ def create_github_issue(token, incident_data, repo_full_name=None):
     """
     try:
         logger.info("Creating GitHub issue...")
-        g = Github(token)
+        g = _get_client(token)
         repo_name = repo_full_name or incident_data.get("repo")
         if not repo_name:
             raise ValueError("Repository name must be provided in incident_data['repo'] or as repo_full_name.")
@@ -17,10 +44,43 @@ def create_github_issue(token, incident_data, repo_full_name=None):
         issue = repo.create_issue(
             title=incident_data.get("title", "Incident Detected"),
             body=incident_data.get("description", "No description provided."),
-            labels=[repo.get_label("incident")] if "incident" in [l.name for l in repo.get_labels()] else []
+            labels=_incident_labels(repo)
         )
         logger.info(f"GitHub issue created: {issue.html_url}")
         return issue.html_url
     except Exception as e:
         logger.error(f"Failed to create GitHub issue: {e}")
         raise
+
+def comment_on_github_issue(token, issue_url, incident_data):
+    """
+    Adds incident_data['description'] as a comment to an existing issue, given its html_url
+    (https://github.com/<owner>/<repo>/issues/<number>). Returns the issue URL.
+    """
+    try:
+        parts = issue_url.rstrip("/").split("/")
+        repo_name, number = f"{parts[-4]}/{parts[-3]}", int(parts[-1])
+        issue = _get_client(token).get_repo(repo_name).get_issue(number)
+        issue.create_comment(incident_data.get("description", "No description provided."))
+        logger.info(f"Commented on GitHub issue {issue_url}")
+        return issue_url
+    except Exception as e:
+        logger.error(f"Failed to comment on GitHub issue {issue_url}: {e}")
+        raise
+
+def find_github_issue(token, incident_data, since, repo_full_name=None):
+    """
+    Returns the html_url of an open issue with this incident's title and body created at or after
+    `since` (epoch seconds), or None. Used before retrying a create that may have succeeded server-side.
+    """
+    repo_name = repo_full_name or incident_data.get("repo")
+    repo = _get_client(token).get_repo(repo_name)
+    created_after = datetime.fromtimestamp(since, timezone.utc)
+    title = incident_data.get("title", "Incident Detected")
+    body = incident_data.get("description", "No description provided.")
+    # `since` filters on the update time, which is never before the creation time.
+    for issue in repo.get_issues(state="open", since=created_after):
+        created_at = issue.created_at if issue.created_at.tzinfo else issue.created_at.replace(tzinfo=timezone.utc)
+        if created_at >= created_after and issue.title == title and (issue.body or "") == body:
+            return issue.html_url
+    return None
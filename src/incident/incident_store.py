@@ -0,0 +1,192 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+from loguru import logger
+
+# Incident states
+INCIDENT_OPEN = "open"
+INCIDENT_RESOLVED = "resolved"
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS incidents (
+        id TEXT PRIMARY KEY,
+        fingerprint TEXT NOT NULL,
+        status TEXT NOT NULL,
+        repo TEXT NOT NULL,
+        branch TEXT,
+        stage TEXT,
+        signature TEXT,
+        severity TEXT,
+        title TEXT,
+        opened_at REAL NOT NULL,
+        last_seen REAL NOT NULL,
+        resolved_at REAL,
+        occurrences INTEGER NOT NULL DEFAULT 1,
+        tickets TEXT NOT NULL DEFAULT '{}',
+        payload TEXT NOT NULL DEFAULT '{}'
+    )
+    """,
+    # At most one open incident per fingerprint; resolved ones are kept for the record.
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_incidents_open_fingerprint ON incidents (fingerprint) WHERE status = 'open'",
+    "CREATE INDEX IF NOT EXISTS idx_incidents_repo_branch ON incidents (repo, branch, status)",
+    "CREATE INDEX IF NOT EXISTS idx_incidents_last_seen ON incidents (last_seen)",
+    """
+    CREATE TABLE IF NOT EXISTS pending_notifications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel TEXT NOT NULL,
+        incident_id TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        summary TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_pending_channel ON pending_notifications (channel, id)",
+]
+
+
+class IncidentStore:
+    """
+    Embedded SQLite (WAL) store of incidents by fingerprint, and of the notifications waiting for the
+    next per-channel digest. Lets the correlator find the open incident for a recurring problem with
+    one indexed lookup, across restarts. The database file is created on first use.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _initialize(self):
+        with self._init_lock:
+            if self._initialized:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+            finally:
+                conn.close()
+            self._initialized = True
+
+    def _connect(self):
+        """Returns a per-thread connection; sqlite3 connections must not be shared across threads."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self._initialize()
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _incident_dict(row):
+        incident = dict(row)
+        incident["tickets"] = json.loads(incident["tickets"])
+        incident["payload"] = json.loads(incident["payload"])
+        return incident
+
+    def record(self, fingerprint, repo, branch, stage, signature, severity, payload, now, resolve_after):
+        """
+        Records one occurrence. The open incident with this fingerprint is updated, unless it has been
+        quiet for resolve_after seconds, in which case it is resolved and a new one opened.
+        Returns (incident, created).
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM incidents WHERE fingerprint = ? AND status = ?", (fingerprint, INCIDENT_OPEN)
+            ).fetchone()
+            if row is not None and now - row["last_seen"] > resolve_after:
+                conn.execute(
+                    "UPDATE incidents SET status = ?, resolved_at = ? WHERE id = ?", (INCIDENT_RESOLVED, now, row["id"])
+                )
+                row = None
+            if row is None:
+                incident_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO incidents (id, fingerprint, status, repo, branch, stage, signature, severity, title, "
+                    "opened_at, last_seen, payload) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (incident_id, fingerprint, INCIDENT_OPEN, repo, branch, stage, signature, severity,
+                     payload.get("title"), now, now, json.dumps(payload, default=str)),
+                )
+                created = True
+            else:
+                incident_id = row["id"]
+                conn.execute(
+                    "UPDATE incidents SET occurrences = occurrences + 1, last_seen = ?, payload = ?, "
+                    "severity = COALESCE(?, severity) WHERE id = ?",
+                    (now, json.dumps(payload, default=str), severity, incident_id),
+                )
+                created = False
+            incident = self._incident_dict(conn.execute("SELECT * FROM incidents WHERE id = ?", (incident_id,)).fetchone())
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return incident, created
+
+    def set_ticket(self, incident_id, channel, ref):
+        """Remembers the issue/ticket a channel opened for the incident, so later occurrences update it."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tickets FROM incidents WHERE id = ?", (incident_id,)).fetchone()
+            if row is not None:
+                tickets = {**json.loads(row["tickets"]), channel: ref}
+                conn.execute("UPDATE incidents SET tickets = ? WHERE id = ?", (json.dumps(tickets), incident_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, incident_id):
+        row = self._connect().execute("SELECT * FROM incidents WHERE id = ?", (incident_id,)).fetchone()
+        return self._incident_dict(row) if row else None
+
+    def list(self, status=None, repo=None, limit=50):
+        query, params = "SELECT * FROM incidents", []
+        filters = [(column, value) for column, value in (("status", status), ("repo", repo)) if value]
+        if filters:
+            query += " WHERE " + " AND ".join(f"{column} = ?" for column, _ in filters)
+            params = [value for _, value in filters]
+        query += " ORDER BY last_seen DESC LIMIT ?"
+        return [self._incident_dict(row) for row in self._connect().execute(query, (*params, limit))]
+
+    def resolve(self, repo, branch, now):
+        """Resolves every open incident of repo@branch (e.g. after a healthy deploy); returns how many."""
+        cursor = self._connect().execute(
+            "UPDATE incidents SET status = ?, resolved_at = ? WHERE repo = ? AND branch IS ? AND status = ?",
+            (INCIDENT_RESOLVED, now, repo, branch, INCIDENT_OPEN),
+        )
+        if cursor.rowcount:
+            logger.info(f"Resolved {cursor.rowcount} open incident(s) of {repo}@{branch}.")
+        return cursor.rowcount
+
+    def queue(self, channel, incident_id, summary, now):
+        self._connect().execute(
+            "INSERT INTO pending_notifications (channel, incident_id, created_at, summary) VALUES (?, ?, ?, ?)",
+            (channel, incident_id, now, summary),
+        )
+
+    def pending_channels(self):
+        return [row["channel"] for row in self._connect().execute("SELECT DISTINCT channel FROM pending_notifications")]
+
+    def pending(self, channel):
+        """Queued notifications of a channel, oldest first, as dicts with id, incident_id, created_at and summary."""
+        rows = self._connect().execute(
+            "SELECT * FROM pending_notifications WHERE channel = ? ORDER BY id", (channel,)
+        )
+        return [dict(row) for row in rows]
+
+    def ack(self, notification_ids):
+        """Removes delivered notifications from the queue."""
+        self._connect().executemany(
+            "DELETE FROM pending_notifications WHERE id = ?", [(notification_id,) for notification_id in notification_ids]
+        )
@@ -1,7 +1,23 @@
 
-from jira import JIRA
+import math
+import threading
+import time
 from loguru import logger
 
+# One authenticated session per (server, user, token), reused across incidents.
+_clients = {}
+_lock = threading.Lock()
+
+def _get_client(jira_url, user, api_token, timeout=15):
+    key = (jira_url, user, api_token)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            from jira import JIRA
+            client = JIRA(server=jira_url, basic_auth=(user, api_token), timeout=timeout)
+            _clients[key] = client
+        return client
+
 def create_jira_ticket(jira_url, user, api_token, incident_data, project_key=None):
     """
     Create a Jira ticket for the incident using the jira package.
@@ -9,7 +25,7 @@ def create_jira_ticket(jira_url, user, api_token, incident_data, project_key=Non
     """
     try:
         logger.info("Creating Jira ticket...")
-        jira = JIRA(server=jira_url, basic_auth=(user, api_token))
+        jira = _get_client(jira_url, user, api_token)
         key = project_key or incident_data.get("project_key")
         if not key:
             raise ValueError("Jira project key must be provided in incident_data['project_key'] or as project_key.")
@@ -25,3 +41,31 @@ def create_jira_ticket(jira_url, user, api_token, incident_data, project_key=Non
     except Exception as e:
         logger.error(f"Failed to create Jira ticket: {e}")
         raise
+
+def comment_on_jira_ticket(jira_url, user, api_token, ticket_url, incident_data):
+    """Adds incident_data['description'] as a comment to an existing ticket, given its permalink. Returns the permalink."""
+    try:
+        jira = _get_client(jira_url, user, api_token)
+        jira.add_comment(ticket_url.rstrip("/").rsplit("/", 1)[-1], incident_data.get("description", "No description provided."))
+        logger.info(f"Commented on Jira ticket {ticket_url}")
+        return ticket_url
+    except Exception as e:
+        logger.error(f"Failed to comment on Jira ticket {ticket_url}: {e}")
+        raise
+
+def find_jira_ticket(jira_url, user, api_token, incident_data, since, project_key=None):
+    """
+    Returns the permalink of a ticket with this incident's summary created at or after `since`
+    (epoch seconds), or None. Used before retrying a create that may have succeeded server-side.
+    """
+    jira = _get_client(jira_url, user, api_token)
+    key = project_key or incident_data.get("project_key")
+    summary = incident_data.get("title", "Incident Detected")
+    # Relative JQL dates avoid depending on the Jira server's time zone.
+    minutes = max(1, math.ceil((time.time() - since) / 60))
+    escaped = summary.replace("\\", "\\\\").replace('"', '\\"')
+    jql = f'project = "{key}" AND summary ~ "{escaped}" AND created >= -{minutes}m ORDER BY created DESC'
+    for issue in jira.search_issues(jql, maxResults=10):
+        if issue.fields.summary == summary:
+            return issue.permalink()
+    return None
@@ -0,0 +1,121 @@
+from loguru import logger
+
+VERDICT_HEALTHY = "healthy"
+VERDICT_INCIDENT = "incident"
+VERDICT_AMBIGUOUS = "ambiguous"
+
+SEVERITY_CRITICAL = "critical"
+SEVERITY_MAJOR = "major"
+
+# Used for any threshold missing from the incident_rules section of config.yaml.
+DEFAULT_RULES = {
+    "enabled": True,
+    "min_requests": 10,
+    "healthy": {"max_5xx_ratio": 0.0, "max_4xx_ratio": 0.1, "max_p95_latency_s": 0.5},
+    "incident": {"min_5xx_ratio": 0.05, "min_p95_latency_s": 2.0},
+    "critical": {"min_5xx_ratio": 0.25},
+    "channels": {
+        SEVERITY_CRITICAL: ["github", "jira", "email"],
+        SEVERITY_MAJOR: ["github", "jira"],
+    },
+}
+
+def _merged(rules):
+    merged = {key: (dict(value) if isinstance(value, dict) else value) for key, value in DEFAULT_RULES.items()}
+    for key, value in (rules or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key].update(value)
+        else:
+            merged[key] = value
+    return merged
+
+def _signals(metrics, smoke_test):
+    """
+    Derives the rule inputs, preferring Prometheus' view and falling back to the agent's own smoke test:
+    5xx ratio, 4xx ratio, p95 latency in seconds, request count and whether the target is up.
+    """
+    metrics = metrics or {}
+    total = (smoke_test or {}).get("total") or {}
+    requests_seen = total.get("requests") or 0
+    status_codes = total.get("status_codes") or {}
+
+    ratio_5xx = metrics.get("error_5xx_ratio")
+    smoke_5xx = total.get("error_rate") if requests_seen else None
+    if smoke_5xx is not None:
+        ratio_5xx = smoke_5xx if ratio_5xx is None else max(ratio_5xx, smoke_5xx)
+
+    ratio_4xx = None
+    if metrics.get("request_rate") and metrics.get("error_4xx_rate") is not None:
+        ratio_4xx = metrics["error_4xx_rate"] / metrics["request_rate"]
+    elif requests_seen:
+        ratio_4xx = sum(n for code, n in status_codes.items() if code.startswith("4")) / requests_seen
+
+    p95_s = metrics.get("latency_p95_s")
+    if p95_s is None and (total.get("latency_ms") or {}).get("p95") is not None:
+        p95_s = total["latency_ms"]["p95"] / 1000
+
+    return {
+        "ratio_5xx": ratio_5xx,
+        "ratio_4xx": ratio_4xx,
+        "p95_latency_s": p95_s,
+        "requests": requests_seen,
+        "up": metrics.get("up"),
+    }
+
+def channels_for(severity, rules=None):
+    """The notification channels configured for an incident severity."""
+    return list(_merged(rules)["channels"].get(severity, []))
+
+def evaluate_incident_rules(metrics, smoke_test, rules=None):
+    """
+    Decides clear-cut post-deploy outcomes locally so the LLM is only consulted for ambiguous ones.
+    Returns {'verdict', 'severity', 'channels', 'reasons', 'signals'}; verdict is 'healthy', 'incident'
+    or 'ambiguous', and channels are the notification channels for the incident's severity.
+    """
+    rules = _merged(rules)
+    signals = _signals(metrics, smoke_test)
+    decision = {"verdict": VERDICT_AMBIGUOUS, "severity": None, "channels": [], "reasons": [], "signals": signals}
+    if not rules["enabled"]:
+        decision["reasons"].append("rules engine disabled")
+        return decision
+
+    ratio_5xx, ratio_4xx, p95 = signals["ratio_5xx"], signals["ratio_4xx"], signals["p95_latency_s"]
+    incident, critical, healthy = rules["incident"], rules["critical"], rules["healthy"]
+
+    if signals["up"] == 0:
+        decision["reasons"].append("scrape target is down")
+        decision["severity"] = SEVERITY_CRITICAL
+    if ratio_5xx is not None and ratio_5xx >= incident["min_5xx_ratio"]:
+        decision["reasons"].append(f"5xx ratio {ratio_5xx:.3f} >= {incident['min_5xx_ratio']}")
+        if ratio_5xx >= critical["min_5xx_ratio"]:
+            decision["severity"] = SEVERITY_CRITICAL
+    if p95 is not None and p95 >= incident["min_p95_latency_s"]:
+        decision["reasons"].append(f"p95 latency {p95:.3f}s >= {incident['min_p95_latency_s']}s")
+
+    if decision["reasons"]:
+        decision["verdict"] = VERDICT_INCIDENT
+        decision["severity"] = decision["severity"] or SEVERITY_MAJOR
+        decision["channels"] = channels_for(decision["severity"], rules)
+        return decision
+
+    enough_traffic = signals["requests"] >= rules["min_requests"]
+    if (
+        enough_traffic
+        and ratio_5xx is not None and ratio_5xx <= healthy["max_5xx_ratio"]
+        and ratio_4xx is not None and ratio_4xx <= healthy["max_4xx_ratio"]
+        and p95 is not None and p95 <= healthy["max_p95_latency_s"]
+    ):
+        decision["verdict"] = VERDICT_HEALTHY
+        decision["reasons"].append(
+            f"no 5xx, 4xx ratio {ratio_4xx:.3f}, p95 latency {p95:.3f}s within thresholds"
+        )
+        return decision
+
+    decision["reasons"].append("signals between healthy and incident thresholds or missing")
+    logger.info(f"Incident rules inconclusive: {signals}")
+    return decision
+
+def describe_decision(decision):
+    """One-line, human-readable summary of a rules decision for logs and incident descriptions."""
+    severity = f" ({decision['severity']})" if decision["severity"] else ""
+    return f"Rule-based verdict: {decision['verdict']}{severity} - {'; '.join(decision['reasons'])}"
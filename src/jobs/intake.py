@@ -0,0 +1,61 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# GitHub Event Constants
+EVENT_PULL_REQUEST = "pull_request"
+EVENT_PUSH = "push"
+ACTION_CLOSED = "closed"
+
+# Job kinds stored in the queue
+JOB_PR_MERGE = "pr_merge"
+JOB_BRANCH_PUSH = "branch_push"
+# Queued by the orchestrator (not by webhooks) when a post-deploy watch breaches.
+JOB_ROLLBACK = "rollback"
+
+
+def route_event(event, data):
+    """
+    Maps a GitHub webhook to the pipeline job it triggers. Returns (job, None) with job =
+    {'kind', 'payload', 'repo', 'branch'}, or (None, reason) for events that trigger nothing.
+    Raises KeyError for a push event without a repository.
+    """
+    if event == EVENT_PULL_REQUEST:
+        action = data.get("action")
+        pr_data = data.get("pull_request", {})
+        base = pr_data.get("base", {})
+
+        # Trigger orchestrator only when a PR is closed and merged into the main branch
+        if action == ACTION_CLOSED and pr_data.get("merged") and base.get("ref") == "main":
+            return {"kind": JOB_PR_MERGE, "payload": pr_data, "repo": base.get("repo", {}).get("full_name"),
+                    "branch": base.get("ref")}, None
+        logger.info(f"Ignoring pull_request event (action: {action}, merged: {pr_data.get('merged')}, base_ref: {base.get('ref')})")
+        return None, "not a merge to main"
+
+    if event == EVENT_PUSH:
+        repo = data["repository"]["full_name"]
+        # ref is like 'refs/heads/main', get the branch name
+        branch = data.get("ref", "refs/heads/main").split("/")[-1]
+
+        # Ignore pushes to main to avoid double-triggering on PR merge
+        if branch == "main":
+            logger.info("Ignoring push event to 'main' branch to prevent duplicate action on PR merge.")
+            return None, "push to main is handled by PR merge event"
+        return {"kind": JOB_BRANCH_PUSH, "payload": {"repo": repo, "branch": branch, "commit_sha": data.get("after")},
+                "repo": repo, "branch": branch}, None
+
+    return None, f"unhandled event {event!r}"
+
+
+def submit_event(job_queue, event, data, delivery_id=None):
+    """
+    Routes a webhook and persists its job. Returns {'status': 'queued' | 'duplicate delivery', 'job_id'}
+    or {'status': 'ignored', 'reason'}.
+    """
+    job, reason = route_event(event, data)
+    if job is None:
+        return {"status": "ignored", "reason": reason}
+    job_id, created = job_queue.enqueue(
+        job["kind"], job["payload"], repo=job["repo"], branch=job["branch"], delivery_id=delivery_id
+    )
+    return {"status": "queued" if created else "duplicate delivery", "job_id": job_id}
@@ -0,0 +1,199 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Job lifecycle states
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+STATUS_SUPERSEDED = "superseded"
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        repo TEXT,
+        branch TEXT,
+        delivery_id TEXT UNIQUE,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        superseded_by TEXT,
+        superseded_count INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_target ON jobs (repo, branch, kind, status)",
+]
+
+# Columns added after the initial schema, applied to existing queue databases on open.
+_MIGRATIONS = {
+    "superseded_by": "ALTER TABLE jobs ADD COLUMN superseded_by TEXT",
+    "superseded_count": "ALTER TABLE jobs ADD COLUMN superseded_count INTEGER NOT NULL DEFAULT 0",
+}
+
+
+class JobQueue:
+    """Durable, SQLite-backed queue for webhook-triggered pipeline jobs with per-repo scheduling."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if existing:
+            for column, statement in _MIGRATIONS.items():
+                if column not in existing:
+                    conn.execute(statement)
+        for statement in _SCHEMA:
+            conn.execute(statement)
+
+    def _connect(self):
+        """Returns a per-thread connection; sqlite3 connections must not be shared across threads."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind, payload, repo=None, branch=None, delivery_id=None):
+        """
+        Persists a new job and returns (job_id, created).
+        A repeated delivery_id (GitHub redelivering the same webhook) returns the existing job instead.
+        """
+        conn = self._connect()
+        if delivery_id:
+            row = conn.execute("SELECT id FROM jobs WHERE delivery_id = ?", (delivery_id,)).fetchone()
+            if row:
+                logger.info(f"Webhook delivery {delivery_id} already queued as job {row['id']}.")
+                return row["id"], False
+
+        job_id = uuid.uuid4().hex
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, payload, repo, branch, delivery_id, status, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), repo, branch, delivery_id, STATUS_QUEUED, time.time()),
+            )
+        except sqlite3.IntegrityError:
+            # Lost a race against a concurrent redelivery of the same webhook.
+            row = conn.execute("SELECT id FROM jobs WHERE delivery_id = ?", (delivery_id,)).fetchone()
+            return row["id"], False
+        logger.info(f"Enqueued job {job_id} ({kind}) for {repo}@{branch}.")
+        return job_id, True
+
+    def claim(self):
+        """
+        Picks the next runnable job, marks it 'running' and returns it, or None if nothing can run.
+
+        Scheduling rules:
+        - Jobs for a repository that already has a running job are held back, so the
+          workspace checkout and container of one repo are only touched by one worker at a time.
+          Jobs for other repositories still run in parallel.
+        - When several jobs of the same kind are queued for the same repo@branch, only the
+          newest one runs; the older ones are marked 'superseded' and the winner records
+          how many events it replaced.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND (repo IS NULL OR repo NOT IN "
+                "(SELECT repo FROM jobs WHERE status = ? AND repo IS NOT NULL)) "
+                "ORDER BY created_at LIMIT 1",
+                (STATUS_QUEUED, STATUS_RUNNING),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            if row["repo"] is not None:
+                row = self._coalesce(conn, row)
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ? WHERE id = ?",
+                (STATUS_RUNNING, time.time(), row["id"]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        job = self._row_to_job(row)
+        job["status"] = STATUS_RUNNING
+        return job
+
+    def _coalesce(self, conn, row):
+        """Collapses queued jobs for the same kind and repo@branch into the newest one and returns it."""
+        siblings = conn.execute(
+            "SELECT * FROM jobs WHERE status = ? AND kind = ? AND repo = ? AND branch IS ? "
+            "ORDER BY created_at",
+            (STATUS_QUEUED, row["kind"], row["repo"], row["branch"]),
+        ).fetchall()
+        latest = siblings[-1]
+        stale = [sibling["id"] for sibling in siblings[:-1]]
+        if not stale:
+            return row
+        now = time.time()
+        conn.executemany(
+            "UPDATE jobs SET status = ?, superseded_by = ?, finished_at = ? WHERE id = ?",
+            [(STATUS_SUPERSEDED, latest["id"], now, job_id) for job_id in stale],
+        )
+        conn.execute(
+            "UPDATE jobs SET superseded_count = superseded_count + ? WHERE id = ?", (len(stale), latest["id"])
+        )
+        logger.info(
+            f"Coalesced {len(stale)} queued {row['kind']} job(s) for {row['repo']}@{row['branch']} "
+            f"into job {latest['id']}."
+        )
+        return conn.execute("SELECT * FROM jobs WHERE id = ?", (latest["id"],)).fetchone()
+
+    def complete(self, job_id):
+        self._finish(job_id, STATUS_SUCCEEDED, None)
+
+    def fail(self, job_id, error):
+        self._finish(job_id, STATUS_FAILED, str(error))
+
+    def _finish(self, job_id, status, error):
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, error, time.time(), job_id),
+        )
+
+    def requeue_running(self):
+        """Puts jobs left 'running' by a crashed or restarted process back on the queue."""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?", (STATUS_QUEUED, STATUS_RUNNING)
+        )
+        if cursor.rowcount:
+            logger.warning(f"Requeued {cursor.rowcount} job(s) interrupted by a previous shutdown.")
+        return cursor.rowcount
+
+    def get(self, job_id):
+        """Returns the job as a dict, or None if it does not exist."""
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def depth(self):
+        """Returns a {status: count} mapping of all jobs in the store."""
+        rows = self._connect().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    @staticmethod
+    def _row_to_job(row):
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
@@ -0,0 +1,75 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    """
+    A fixed pool of daemon threads that drain a JobQueue.
+    handlers maps a job kind (e.g. 'pr_merge') to a callable taking the job payload.
+    """
+
+    def __init__(self, job_queue, handlers, workers=2, poll_interval=1.0):
+        self.job_queue = job_queue
+        self.handlers = handlers
+        self.workers = max(1, int(workers))
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Starts the worker threads once; repeated calls are no-ops."""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            self.job_queue.requeue_running()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"pipeline-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Started {self.workers} pipeline worker(s).")
+
+    def stop(self, timeout=None):
+        """Signals workers to exit after their current job and waits for them."""
+        self._stopping.set()
+        self._wakeup.set()
+        with self._lock:
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+
+    def notify(self):
+        """Wakes idle workers immediately instead of waiting for the next poll."""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            job = self.job_queue.claim()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._execute(job)
+
+    def _execute(self, job):
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            logger.error(f"No handler registered for job kind '{job['kind']}' (job {job['id']}).")
+            self.job_queue.fail(job["id"], f"unknown job kind: {job['kind']}")
+            return
+        logger.info(f"Worker picked up job {job['id']} ({job['kind']}).")
+        try:
+            handler(job["payload"])
+        except Exception as e:
+            logger.exception(f"Job {job['id']} failed:")
+            self.job_queue.fail(job["id"], e)
+        else:
+            logger.info(f"Job {job['id']} completed.")
+            self.job_queue.complete(job["id"])
+        finally:
+            # Jobs held back for this repo are runnable now; don't let them wait for a poll.
+            self.notify()
@@ -0,0 +1,229 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+HUMAN_TEMPLATE = """{prompt}
+Context: {context}"""
+
+
+class Completion(str):
+    """
+    A completion's text; usage holds {'input_tokens', 'output_tokens'} when the backend reports them,
+    and backend the name of the backend that answered (set by ResilientLLM).
+    """
+
+    def __new__(cls, text, usage=None, backend=None):
+        completion = super().__new__(cls, text)
+        completion.usage = usage
+        completion.backend = backend
+        return completion
+
+
+class LLMUnavailableError(Exception):
+    """Raised when no backend could answer: retries exhausted, circuit open and no fallback."""
+
+
+class MistralBackend:
+    """Mistral via LangChain. The client and chain are built on first use, so importing needs no API key."""
+
+    def __init__(self, model, api_key=None, timeout=30):
+        self.name = f"mistral:{model}"
+        self.model = model
+        self.api_key = api_key
+        self.timeout = timeout
+        self._chain = None
+        self._lock = threading.Lock()
+
+    def _get_chain(self):
+        with self._lock:
+            if self._chain is None:
+                from langchain_core.prompts import ChatPromptTemplate
+                from langchain_mistralai import ChatMistralAI
+
+                # Retries are handled by ResilientLLM so that backoff and the circuit breaker see every failure.
+                llm = ChatMistralAI(api_key=self.api_key, model=self.model, timeout=self.timeout, max_retries=0)
+                chat_prompt = ChatPromptTemplate.from_messages([
+                    ("system", "{system_prompt}"),
+                    ("human", HUMAN_TEMPLATE)
+                ])
+                # No output parser: the AIMessage carries the token usage.
+                self._chain = chat_prompt | llm
+            return self._chain
+
+    def invoke(self, system_prompt, prompt, context):
+        chain = self._get_chain()
+        message = chain.invoke({"system_prompt": system_prompt, "prompt": prompt, "context": context})
+        usage = getattr(message, "usage_metadata", None) or None
+        if usage:
+            usage = {"input_tokens": usage.get("input_tokens", 0), "output_tokens": usage.get("output_tokens", 0)}
+        return Completion(message.content, usage)
+
+
+class StubBackend:
+    """Talks to the local stub LLM server (python -m src.llm.stub_server) so pipelines can run offline."""
+
+    def __init__(self, url, timeout=30):
+        self.name = f"stub:{url}"
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def invoke(self, system_prompt, prompt, context):
+        response = self._session.post(
+            f"{self.url}/v1/complete",
+            json={"system": system_prompt, "prompt": prompt, "context": context},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        body = response.json()
+        return Completion(body["text"], body.get("usage"))
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Blocks until a token is available; returns False if that would take longer than timeout."""
+        if not self.rate:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and lets one trial call through after `reset_timeout`.
+    Other callers are refused while that trial runs; its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        """True if a call may go through; in half-open state only for the caller that takes the trial."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self.trial_in_flight:
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.trial_in_flight = False
+            self.failures += 1
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                # A failed half-open trial re-opens the circuit for another full reset_timeout.
+                self.opened_at = time.monotonic()
+
+
+def is_retryable(error):
+    """Timeouts, connection errors, HTTP 429 and 5xx are worth retrying; anything else is not."""
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    retryable_names = ("Timeout", "TimeoutError", "ConnectError", "ConnectionError", "RemoteProtocolError")
+    return isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__.endswith(retryable_names)
+
+
+class ResilientLLM:
+    """
+    Wraps a primary and optional secondary backend with:
+    - a concurrency limit and a token-bucket rate limit shared by all pipeline threads,
+    - retries with exponential backoff and jitter on retryable errors (429/5xx/timeouts),
+    - a circuit breaker per backend; while the primary's circuit is open calls go to the secondary.
+    """
+
+    def __init__(self, primary, secondary=None, retries=3, backoff=1.0, max_concurrency=4, rate=0, burst=4,
+                 acquire_timeout=60, failure_threshold=5, reset_timeout=60):
+        self.backends = [backend for backend in (primary, secondary) if backend is not None]
+        self.breakers = {backend.name: CircuitBreaker(failure_threshold, reset_timeout) for backend in self.backends}
+        self.retries = retries
+        self.backoff = backoff
+        self.acquire_timeout = acquire_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._bucket = TokenBucket(rate, burst)
+
+    @property
+    def name(self):
+        return self.backends[0].name
+
+    def invoke(self, system_prompt, prompt, context):
+        errors = []
+        for backend in self.backends:
+            breaker = self.breakers[backend.name]
+            if not breaker.allow():
+                errors.append(f"{backend.name}: circuit open")
+                continue
+            try:
+                result = self._invoke_with_retries(backend, system_prompt, prompt, context)
+            except Exception as e:
+                breaker.record_failure()
+                errors.append(f"{backend.name}: {e}")
+                logger.warning(f"LLM backend {backend.name} failed ({breaker.state}): {e}")
+                continue
+            breaker.record_success()
+            return Completion(result, getattr(result, "usage", None), backend.name)
+        raise LLMUnavailableError("; ".join(errors))
+
+    def _invoke_with_retries(self, backend, system_prompt, prompt, context):
+        for attempt in range(self.retries + 1):
+            if not self._bucket.acquire(self.acquire_timeout):
+                raise LLMUnavailableError("rate limit wait exceeded")
+            if not self._slots.acquire(timeout=self.acquire_timeout):
+                raise LLMUnavailableError("no free LLM concurrency slot")
+            try:
+                return backend.invoke(system_prompt, prompt, context)
+            except Exception as e:
+                if attempt == self.retries or not is_retryable(e):
+                    raise
+                delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.0)
+                logger.warning(f"LLM call to {backend.name} failed ({e}); retry {attempt + 1} in {delay:.1f}s")
+            finally:
+                self._slots.release()
+            time.sleep(delay)
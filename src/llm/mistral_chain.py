@@ -1,34 +1,239 @@
-
 import os
+import json
+import logging
+import re
+import threading
+import time
 from dotenv import load_dotenv
-from langchain.prompts import ChatPromptTemplate
-from langchain_mistralai import ChatMistralAI
-from langchain_core.output_parsers import StrOutputParser
+from src.llm.backends import Completion, LLMUnavailableError, MistralBackend, ResilientLLM, StubBackend
+from src.llm.response_cache import ResponseCache, make_key, normalize_context
+from src.monitor.agent_metrics import LLM_LATENCY, LLM_REQUESTS, LLM_TOKENS
+from src.monitor.tracing import span
+from src.config.settings import (
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_DB,
+    LLM_CACHE_TTLS,
+    LLM_BACKEND,
+    LLM_MODEL,
+    LLM_FALLBACK_MODEL,
+    LLM_STUB_URL,
+    LLM_TIMEOUT,
+    LLM_RETRIES,
+    LLM_RETRY_BACKOFF,
+    LLM_MAX_CONCURRENCY,
+    LLM_RATE_PER_SEC,
+    LLM_BURST,
+    LLM_CIRCUIT_FAILURES,
+    LLM_CIRCUIT_RESET,
+)
 
 load_dotenv()
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
 
-# Initialize LangChain LLM for Mistral
-llm = ChatMistralAI(api_key=MISTRAL_API_KEY, model="mistral-tiny")
+logger = logging.getLogger(__name__)
+
+# Prompt types used by the pipeline, so answers can be cached with type-specific TTLs.
+PROMPT_DEPLOY_GATE = "deploy_gate"
+PROMPT_DEPLOY_SCRIPT = "deploy_script"
+PROMPT_POST_DEPLOY_ANALYSIS = "post_deploy_analysis"
+
+# Seconds to keep an answer per prompt type. The post-deploy analysis (verdict and channels) depends
+# on live metrics, so it is only deduplicated, never stored. Deploy scripts have their own cache.
+DEFAULT_PROMPT_TTLS = {
+    PROMPT_DEPLOY_GATE: 3600,
+    PROMPT_DEPLOY_SCRIPT: 0,
+    PROMPT_POST_DEPLOY_ANALYSIS: 0,
+}
+
+SYSTEM_PROMPT = """You are an SDLC agent that makes deployment, monitoring, and incident decisions.
+Your response must be concise and directly answer the user's prompt.
+Do not include any conversational filler, explanations, or justifications.
+Output only the direct decision, command, or requested information."""
+
+# The LLM client is built on first use (see get_llm_client), not at import time.
+_client = None
+_client_lock = threading.Lock()
+
+response_cache = ResponseCache(
+    max_entries=LLM_CACHE_MAX_ENTRIES,
+    disk_path=LLM_CACHE_DB or None,
+    ttls={**DEFAULT_PROMPT_TTLS, **LLM_CACHE_TTLS},
+)
+
+def _build_backend(model):
+    if LLM_BACKEND == "stub":
+        return StubBackend(LLM_STUB_URL, timeout=LLM_TIMEOUT)
+    return MistralBackend(model, api_key=MISTRAL_API_KEY, timeout=LLM_TIMEOUT)
+
+def get_llm_client():
+    """
+    Returns the process-wide LLM client, building it on first use from settings:
+    LLM_BACKEND ('mistral' or 'stub'), with LLM_FALLBACK_MODEL as secondary when the primary's circuit is open.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            secondary = None
+            if LLM_FALLBACK_MODEL and LLM_BACKEND != "stub":
+                secondary = _build_backend(LLM_FALLBACK_MODEL)
+            _client = ResilientLLM(
+                _build_backend(LLM_MODEL),
+                secondary=secondary,
+                retries=LLM_RETRIES,
+                backoff=LLM_RETRY_BACKOFF,
+                max_concurrency=LLM_MAX_CONCURRENCY,
+                rate=LLM_RATE_PER_SEC,
+                burst=LLM_BURST,
+                failure_threshold=LLM_CIRCUIT_FAILURES,
+                reset_timeout=LLM_CIRCUIT_RESET,
+            )
+            logger.info(f"Initialized LLM client ({_client.name}).")
+        return _client
+
+def set_llm_client(client):
+    """Replaces the LLM client, e.g. with a local stand-in for tests and offline benchmarks. None resets it."""
+    global _client
+    with _client_lock:
+        _client = client
+
+def _complete(prompt, context, prompt_type=None):
+    """One LLM call, traced as an 'llm' span and counted in the LLM request/latency/token metrics."""
+    prompt_type = prompt_type or "other"
+    context = normalize_context(context)
+    started = time.monotonic()
+    with span("llm", prompt_type=prompt_type) as current:
+        try:
+            completion = get_llm_client().invoke(SYSTEM_PROMPT, prompt, context)
+        except Exception:
+            LLM_REQUESTS.labels(prompt_type=prompt_type, outcome="error").inc()
+            raise
+        finally:
+            LLM_LATENCY.labels(prompt_type=prompt_type).observe(time.monotonic() - started)
+        usage = getattr(completion, "usage", None) or {
+            # Rough estimate (about four characters per token) when the backend reports no usage.
+            "input_tokens": (len(SYSTEM_PROMPT) + len(prompt) + len(context)) // 4,
+            "output_tokens": len(completion) // 4,
+        }
+        LLM_REQUESTS.labels(prompt_type=prompt_type, outcome="ok").inc()
+        for direction in ("input", "output"):
+            LLM_TOKENS.labels(prompt_type=prompt_type, direction=direction).inc(usage.get(f"{direction}_tokens", 0))
+        current.set(**usage)
+    return Completion(completion.strip(), usage, getattr(completion, "backend", None))
 
-def get_llm_decision(prompt, context=None):
+def _answered_by_primary(completion):
+    """
+    Only the primary backend's answers are cached: the key names LLM_MODEL, and a fallback model's answer
+    must not be replayed as the primary's once it is back.
+    """
+    backend = getattr(completion, "backend", None)
+    return backend is None or backend == get_llm_client().name
+
+def get_llm_decision(prompt, context=None, prompt_type=None, fallback=None):
     """
     Use LangChain to manage prompt and LLM call for agentic decision-making.
+    Answers are memoized per prompt_type TTL and identical in-flight requests share one API call.
+    If no backend is available and a fallback is given, the fallback is returned instead of raising.
     Returns the LLM's response as a string.
     """
-    system_prompt = """You are an SDLC agent that makes deployment, monitoring, and incident decisions.
-Your response must be concise and directly answer the user's prompt.
-Do not include any conversational filler, explanations, or justifications.
-Output only the direct decision, command, or requested information."""
+    key = make_key(SYSTEM_PROMPT, prompt, context, LLM_MODEL)
+    try:
+        return response_cache.get_or_compute(
+            key, lambda: _complete(prompt, context, prompt_type), prompt_type=prompt_type, cacheable=_answered_by_primary
+        )
+    except LLMUnavailableError as e:
+        if fallback is None:
+            raise
+        LLM_REQUESTS.labels(prompt_type=prompt_type or "other", outcome="fallback").inc()
+        logger.warning(f"LLM unavailable, using deterministic fallback for {prompt_type or 'prompt'}: {e}")
+        return fallback
+
+class LLMResponseError(Exception):
+    """Raised when the LLM keeps returning output that does not match the requested JSON schema."""
+
+STRUCTURED_TEMPLATE = """Answer every question below in ONE JSON object and output nothing else (no markdown, no prose).
+The object must have exactly these keys: {keys}.
+The value for each key must validate against its JSON schema.
+
+{questions}"""
+
+def _schema_errors(value, schema, path="$"):
+    """Validates value against the JSON Schema subset used here (object/array/string/boolean/number, enum, required)."""
+    expected = schema.get("type")
+    checks = {
+        "object": lambda v: isinstance(v, dict),
+        "array": lambda v: isinstance(v, list),
+        "string": lambda v: isinstance(v, str),
+        "boolean": lambda v: isinstance(v, bool),
+        "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    }
+    if expected and not checks[expected](value):
+        return [f"{path} must be of type {expected}"]
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{path} must be one of {schema['enum']}"]
+    errors = []
+    if expected == "object":
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}.{key} is required")
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(_schema_errors(value[key], sub_schema, f"{path}.{key}"))
+    if expected == "array" and "items" in schema:
+        for i, item in enumerate(value):
+            errors.extend(_schema_errors(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+def _extract_json(text):
+    """Parses the first JSON object in text, tolerating markdown fences or stray prose around it."""
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip())
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("no JSON object found")
+    return json.loads(text[start:end + 1])
+
+def get_structured_decision(questions, context=None, prompt_type=None, fallback=None):
+    """
+    Asks several compatible questions in a single LLM request and returns the validated answers.
+
+    questions maps an answer key to {"prompt": str, "schema": <JSON schema>}, e.g.
+    {"deploy_gate": {"prompt": "...", "schema": {"type": "object", ...}}}. The reply must be one JSON
+    object with those keys; if it doesn't parse or validate, the request is retried once with the
+    validation errors appended, then LLMResponseError is raised. Returns {key: answer}.
+    If no backend is available and a fallback dict is given, it is returned instead of raising.
+    """
+    schema = {"type": "object", "required": list(questions), "properties": {k: q["schema"] for k, q in questions.items()}}
+    prompt = STRUCTURED_TEMPLATE.format(
+        keys=", ".join(questions),
+        questions="\n\n".join(
+            f"### {key}\n{q['prompt'].strip()}\nJSON schema: {json.dumps(q['schema'])}" for key, q in questions.items()
+        ),
+    )
+    key = make_key(SYSTEM_PROMPT, prompt, context, f"{LLM_MODEL}:json")
 
-    human_template = """{prompt}
-Context: {context}"""
+    def _ask():
+        attempt_prompt = prompt
+        for _ in range(2):
+            raw = _complete(attempt_prompt, context, prompt_type)
+            try:
+                answer = _extract_json(raw)
+                errors = _schema_errors(answer, schema)
+            except ValueError as e:
+                errors = [f"invalid JSON: {e}"]
+            if not errors:
+                return Completion(json.dumps({k: answer[k] for k in questions}), backend=raw.backend)
+            attempt_prompt = (
+                f"{prompt}\n\nYour previous reply was rejected: {'; '.join(errors)}.\n"
+                "Reply again with only the corrected JSON object."
+            )
+        raise LLMResponseError(f"LLM reply did not match the schema after a retry: {'; '.join(errors)}")
 
-    chat_prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        ("human", human_template)
-    ])
+    # Only validated answers are cached, so a malformed reply is never replayed.
+    try:
+        return json.loads(response_cache.get_or_compute(key, _ask, prompt_type=prompt_type, cacheable=_answered_by_primary))
+    except LLMUnavailableError as e:
+        if fallback is None:
+            raise
+        LLM_REQUESTS.labels(prompt_type=prompt_type or "other", outcome="fallback").inc()
+        logger.warning(f"LLM unavailable, using deterministic fallback for {prompt_type or 'decision'}: {e}")
+        return fallback
 
-    chain = chat_prompt | llm | StrOutputParser()
-    result = chain.invoke({"prompt": prompt, "context": context or ""})
-    return result.strip()
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_context(context):
+    """Renders a prompt context (str, dict, list, None) deterministically so equal contexts hash equally."""
+    if context is None:
+        return ""
+    if isinstance(context, str):
+        return context
+    return json.dumps(context, sort_keys=True, default=str)
+
+
+def make_key(system_prompt, prompt, context, model):
+    """Hashes the normalized (system prompt, prompt, context, model) tuple; whitespace runs are collapsed."""
+    parts = [" ".join(str(part).split()) for part in (system_prompt, prompt, normalize_context(context), model)]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """An in-progress computation that concurrent callers with the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResponseCache:
+    """
+    Two-tier memoization for LLM responses with single-flight request deduplication.
+
+    - Memory tier: bounded LRU of up to max_entries responses.
+    - Disk tier (optional): SQLite file at disk_path, shared across restarts.
+    TTLs are looked up per prompt type; a TTL of 0 disables storage for that type,
+    but concurrent identical requests are still collapsed into one call.
+    """
+
+    def __init__(self, max_entries=256, disk_path=None, ttls=None, default_ttl=0):
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        self._memory = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            conn = self._disk()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def ttl_for(self, prompt_type):
+        return self.ttls.get(prompt_type, self.default_ttl)
+
+    def get_or_compute(self, key, compute, prompt_type=None, cacheable=None):
+        """
+        Returns the cached response for key, or runs compute() once for all concurrent callers and caches it.
+        A result for which cacheable(result) is false is returned to those callers but not cached.
+        """
+        ttl = self.ttl_for(prompt_type)
+        if ttl > 0:
+            cached = self._lookup(key)
+            if cached is not None:
+                return cached
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.misses += 1
+            else:
+                self.deduplicated += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = compute()
+            if ttl > 0 and (cacheable is None or cacheable(flight.result)):
+                self._store(key, flight.result, time.time() + ttl)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "deduplicated": self.deduplicated,
+                "memory_entries": len(self._memory),
+                "disk_enabled": bool(self.disk_path),
+            }
+
+    def _lookup(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+
+        if not self.disk_path:
+            return None
+        try:
+            row = self._disk().execute(
+                "SELECT value, expires_at FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"LLM response disk cache lookup failed: {e}")
+            return None
+        if row is None:
+            return None
+        with self._lock:
+            self.hits += 1
+            self._remember(key, row[0], row[1])
+        return row[0]
+
+    def _store(self, key, value, expires_at):
+        with self._lock:
+            self._remember(key, value, expires_at)
+        if not self.disk_path:
+            return
+        try:
+            self._disk().execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires_at)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"LLM response disk cache write failed: {e}")
+
+    def _remember(self, key, value, expires_at):
+        # Caller must hold self._lock.
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
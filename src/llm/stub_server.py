@@ -0,0 +1,91 @@
+"""
+Local stand-in for the LLM API, so pipelines and load tests can run offline.
+
+    python -m src.llm.stub_server --port 8089 --latency 0.2
+    LLM_BACKEND=stub LLM_STUB_URL=http://127.0.0.1:8089 python -m src.webhook_server
+
+POST /v1/complete with {"system", "prompt", "context"} returns {"text": ..., "usage": {...}}. Answers are deterministic:
+structured prompts get a JSON object that satisfies every requested schema, deploy-script prompts get a
+minimal bash script and anything else gets "ok".
+"""
+import argparse
+import json
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from loguru import logger
+
+_SECTION = re.compile(r"^### (\w+)\n.*?^JSON schema: ([^\n]+)$", re.MULTILINE | re.DOTALL)
+_CONTAINER_NAME = re.compile(r"Container Name: '([^']+)'")
+
+STUB_DEPLOY_SCRIPT = """#!/bin/bash
+set -e
+CONTAINER_NAME="{container_name}"
+PORT=5000
+echo "stub deployment of $CONTAINER_NAME on port $PORT"
+"""
+
+def sample_value(schema):
+    """Builds the simplest value that validates against schema: first enum value, true, 0, 'stub', []."""
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type")
+    if kind == "object":
+        return {key: sample_value(sub) for key, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        return []
+    if kind == "boolean":
+        return True
+    if kind == "number":
+        return 0
+    return "stub"
+
+def estimate_tokens(*texts):
+    """Rough token count (about four characters per token), as reported in the stub's usage block."""
+    return sum(len(text or "") for text in texts) // 4 + 1
+
+def stub_completion(prompt):
+    sections = _SECTION.findall(prompt)
+    if sections:
+        return json.dumps({key: sample_value(json.loads(schema)) for key, schema in sections})
+    if "shell script" in prompt.lower():
+        match = _CONTAINER_NAME.search(prompt)
+        return STUB_DEPLOY_SCRIPT.format(container_name=match.group(1) if match else "stub-app")
+    return "ok"
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path != "/v1/complete":
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        text = stub_completion(body.get("prompt", ""))
+        usage = {"input_tokens": estimate_tokens(body.get("system", ""), body.get("prompt", ""), body.get("context", "")),
+                 "output_tokens": estimate_tokens(text)}
+        payload = json.dumps({"text": text, "usage": usage}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+def make_server(host="127.0.0.1", port=8089, latency=0.0):
+    server = ThreadingHTTPServer((host, port), StubLLMHandler)
+    server.latency = latency
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deterministic local LLM stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before answering")
+    args = parser.parse_args()
+    server = make_server(args.host, args.port, args.latency)
+    logger.info(f"Stub LLM listening on http://{args.host}:{args.port}/v1/complete")
+    server.serve_forever()
@@ -0,0 +1,107 @@
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily
+
+# Metrics about the agent's own pipeline, exported on the webhook server's /metrics endpoint.
+
+TIME_TO_READY = Histogram(
+    "sdlc_agent_time_to_ready_seconds",
+    "Time from the end of a deployment until the application answered its readiness probe.",
+    ["pipeline", "outcome"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120),
+)
+
+INCIDENT_DECISIONS = Counter(
+    "sdlc_agent_incident_decisions_total",
+    "Post-deploy incident decisions, by whether the local rules (fast path) or the LLM decided.",
+    ["path", "verdict"],
+)
+
+DEPLOY_PHASE_DURATION = Histogram(
+    "sdlc_agent_deploy_phase_seconds",
+    "Duration of each phase (cleanup/build/run) of a deployment script, parsed from its phase markers.",
+    ["phase", "status"],
+    buckets=(0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1200),
+)
+
+BLUE_GREEN_SWAP_DURATION = Histogram(
+    "sdlc_agent_blue_green_swap_seconds",
+    "Time to move traffic from the old to the new slot once the new slot passed its health check.",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10),
+)
+
+BLUE_GREEN_OUTCOMES = Counter(
+    "sdlc_agent_blue_green_deploys_total",
+    "Blue/green deployments by outcome (swapped, rolled_back, failed).",
+    ["outcome"],
+)
+
+STAGE_DURATION = Histogram(
+    "sdlc_agent_stage_duration_seconds",
+    "Duration of each traced pipeline stage (git sync, LLM calls, deploy, health check, incident channels...).",
+    ["stage", "status"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900),
+)
+
+STAGE_IN_FLIGHT = Gauge(
+    "sdlc_agent_stage_in_flight",
+    "Pipeline stages currently executing.",
+    ["stage"],
+)
+
+LLM_REQUESTS = Counter(
+    "sdlc_agent_llm_requests_total",
+    "LLM calls by prompt type and outcome (ok, error, fallback); cache hits are not counted.",
+    ["prompt_type", "outcome"],
+)
+
+LLM_LATENCY = Histogram(
+    "sdlc_agent_llm_request_seconds",
+    "Latency of LLM calls (including retries) by prompt type.",
+    ["prompt_type"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+
+LLM_TOKENS = Counter(
+    "sdlc_agent_llm_tokens_total",
+    "LLM tokens by prompt type and direction (input/output), as reported by the backend or estimated.",
+    ["prompt_type", "direction"],
+)
+
+DEPLOY_WATCHES_ACTIVE = Gauge(
+    "sdlc_agent_deploy_watches_active",
+    "Deploys currently under post-deploy watch.",
+)
+
+DEPLOY_WATCH_OUTCOMES = Counter(
+    "sdlc_agent_deploy_watches_total",
+    "Finished post-deploy watches by outcome (passed, breached, cancelled).",
+    ["outcome"],
+)
+
+# Job statuses that make up the pipeline queue depth.
+QUEUE_DEPTH_STATUSES = ("queued", "running")
+
+
+class _QueueDepthCollector:
+    """Reads the job queue's depth at scrape time, so the gauge is never stale."""
+
+    def __init__(self, depth):
+        self.depth = depth
+
+    def collect(self):
+        family = GaugeMetricFamily("sdlc_agent_job_queue_depth", "Pipeline jobs by status.", labels=["status"])
+        counts = self.depth()
+        for status in QUEUE_DEPTH_STATUSES:
+            family.add_metric([status], counts.get(status, 0))
+        yield family
+
+
+_queue_depth_collector = None
+
+def register_queue_depth(depth):
+    """Exports sdlc_agent_job_queue_depth{status} from depth(), a callable returning {status: count}."""
+    global _queue_depth_collector
+    if _queue_depth_collector is not None:
+        REGISTRY.unregister(_queue_depth_collector)
+    _queue_depth_collector = _QueueDepthCollector(depth)
+    REGISTRY.register(_queue_depth_collector)
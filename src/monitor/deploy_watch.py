@@ -0,0 +1,311 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+from src.monitor.agent_metrics import DEPLOY_WATCHES_ACTIVE, DEPLOY_WATCH_OUTCOMES
+from src.monitor.prometheus_client import DEFAULT_METRIC_QUERIES, _parse_duration, fetch_metric_range
+from src.monitor.smoke_runner import percentile
+
+WATCH_PASSED = "passed"
+WATCH_BREACHED = "breached"
+WATCH_CANCELLED = "cancelled"
+
+SEVERITY_CRITICAL = "critical"
+SEVERITY_MAJOR = "major"
+
+# The subset of the metric bundle followed during a watch; the 5xx ratio is derived per sample.
+WATCH_QUERIES = {name: DEFAULT_METRIC_QUERIES[name] for name in ("up", "request_rate", "error_5xx_rate", "latency_p95_s")}
+
+# Used for any threshold missing from the watch_rules section of config.yaml.
+DEFAULT_WATCH_RULES = {
+    # Weight of the newest sample in the moving averages.
+    "ewma_alpha": 0.3,
+    # Samples before any verdict, and consecutive samples over a threshold before a breach.
+    "min_samples": 3,
+    "consecutive_breaches": 2,
+    # Allowed rise of the averaged 5xx ratio over the baseline's p95, in absolute ratio points.
+    "max_5xx_ratio_increase": 0.02,
+    # Allowed rise of the averaged p95 latency over the baseline's p95: relative, but at least the absolute floor.
+    "max_latency_increase": 0.5,
+    "min_latency_increase_s": 0.05,
+    # Without a baseline (first deploy, no earlier data) the averages are held against these instead.
+    "max_5xx_ratio": 0.05,
+    "max_p95_latency_s": 2.0,
+    # 5xx ratio at which a breach is critical rather than major.
+    "critical_5xx_ratio": 0.25,
+}
+
+
+def merged_rules(rules):
+    return {**DEFAULT_WATCH_RULES, **(rules or {})}
+
+
+class Ewma:
+    """Exponentially weighted moving average; the first sample seeds it."""
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, sample):
+        self.value = sample if self.value is None else self.alpha * sample + (1 - self.alpha) * self.value
+        return self.value
+
+
+def _ratios(series):
+    """Per-timestamp 5xx ratio from the request and 5xx rate series (timestamps without traffic are skipped)."""
+    requests_at = dict(series.get("request_rate") or [])
+    return [
+        (timestamp, errors / requests_at[timestamp])
+        for timestamp, errors in series.get("error_5xx_rate") or []
+        if requests_at.get(timestamp)
+    ]
+
+
+def summarize_baseline(series):
+    """
+    p50/p95 of the pre-deploy 5xx ratio and p95 latency, from range-query series. A signal without
+    samples is None, and is then held against the absolute thresholds instead.
+    """
+    baseline = {}
+    for name, samples in (("ratio_5xx", _ratios(series)), ("p95_latency_s", series.get("latency_p95_s") or [])):
+        values = sorted(value for _, value in samples)
+        baseline[name] = {"p50": percentile(values, 50), "p95": percentile(values, 95), "samples": len(values)} if values else None
+    return baseline
+
+
+class DeployWatch:
+    """
+    One deploy under watch: folds incoming samples into EWMAs and compares them with the baseline.
+    Not thread-safe on its own; DeployWatcher never runs two ticks of the same watch at once.
+    """
+
+    def __init__(self, watch_id, key, job, instance, started_at, ends_at, interval, step, window,
+                 baseline_window, baseline_end, rules, on_done):
+        self.watch_id = watch_id
+        self.key = key
+        self.job = job
+        self.instance = instance
+        self.started_at = started_at
+        self.ends_at = ends_at
+        self.interval = interval
+        self.step = step
+        self.window = window
+        self.baseline_window = baseline_window
+        self.baseline_end = baseline_end
+        self.rules = merged_rules(rules)
+        self.on_done = on_done
+        self.baseline = None
+        self.cursor = started_at
+        self.samples = 0
+        self.streak = 0
+        self.ewma = {"ratio_5xx": Ewma(self.rules["ewma_alpha"]), "p95_latency_s": Ewma(self.rules["ewma_alpha"])}
+        self.last_up = None
+        self.outcome = None
+        self.finding = None
+
+    def thresholds(self):
+        """Upper bounds for the averaged 5xx ratio and p95 latency: baseline-relative, or absolute without a baseline."""
+        rules, baseline = self.rules, self.baseline or {}
+        limits = {"ratio_5xx": rules["max_5xx_ratio"], "p95_latency_s": rules["max_p95_latency_s"]}
+        if baseline.get("ratio_5xx"):
+            limits["ratio_5xx"] = baseline["ratio_5xx"]["p95"] + rules["max_5xx_ratio_increase"]
+        if baseline.get("p95_latency_s"):
+            p95 = baseline["p95_latency_s"]["p95"]
+            limits["p95_latency_s"] = max(p95 * (1 + rules["max_latency_increase"]), p95 + rules["min_latency_increase_s"])
+        return limits
+
+    def observe(self, series):
+        """Folds new range-query samples in, in time order; returns a finding once a threshold is crossed, else None."""
+        ratios = dict(_ratios(series))
+        latencies = dict(series.get("latency_p95_s") or [])
+        ups = dict(series.get("up") or [])
+        limits = self.thresholds()
+        for timestamp in sorted(set(ratios) | set(latencies) | set(ups)):
+            self.samples += 1
+            reasons = []
+            if timestamp in ups:
+                self.last_up = ups[timestamp]
+                if self.last_up == 0:
+                    reasons.append("scrape target is down")
+            for name, value in (("ratio_5xx", ratios.get(timestamp)), ("p95_latency_s", latencies.get(timestamp))):
+                if value is None:
+                    continue
+                average = self.ewma[name].update(value)
+                if average > limits[name]:
+                    reasons.append(f"{name} EWMA {average:.3f} > {limits[name]:.3f}")
+            self.streak = self.streak + 1 if reasons else 0
+            if self.samples >= self.rules["min_samples"] and self.streak >= self.rules["consecutive_breaches"]:
+                return self._finding(timestamp, reasons)
+        return None
+
+    def _finding(self, timestamp, reasons):
+        ratio = self.ewma["ratio_5xx"].value
+        critical = self.last_up == 0 or (ratio is not None and ratio >= self.rules["critical_5xx_ratio"])
+        return {
+            "at": timestamp,
+            "after_s": round(timestamp - self.started_at, 1),
+            "severity": SEVERITY_CRITICAL if critical else SEVERITY_MAJOR,
+            "reasons": reasons,
+        }
+
+    def status(self):
+        return {
+            "watch_id": self.watch_id,
+            "key": self.key,
+            "instance": self.instance,
+            "started_at": self.started_at,
+            "ends_at": self.ends_at,
+            "samples": self.samples,
+            "baseline": self.baseline,
+            "ewma": {name: None if ewma.value is None else round(ewma.value, 6) for name, ewma in self.ewma.items()},
+            "thresholds": {name: round(limit, 6) for name, limit in self.thresholds().items()},
+            "outcome": self.outcome,
+            "finding": self.finding,
+        }
+
+
+class DeployWatcher:
+    """
+    Watches deploys for a while after they went live and reports a regression as soon as one shows up.
+
+    Every watch first reads a pre-deploy baseline, then on each tick fetches only the samples since
+    its previous tick (a range query from its cursor) and folds them into EWMAs, which are held against
+    the baseline's percentiles. A single scheduler thread keeps the due times in a heap and hands due
+    ticks to a small shared pool, so any number of watches costs no thread each. When a watch
+    breaches, passes its window or is superseded, on_done(status) is called on a pool thread.
+    """
+
+    def __init__(self, prometheus_url, workers=4, fetch_range=fetch_metric_range, clock=time.time):
+        self.prometheus_url = prometheus_url
+        self.fetch_range = fetch_range
+        self.clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="deploy-watch")
+        self._watches = {}
+        self._heap = []
+        self._ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def watch(self, key, started_at, on_done, job=None, instance=None, window=600.0, interval=30.0, step=15.0,
+              rate_window="1m", baseline_window=600.0, baseline_end=None, rules=None):
+        """
+        Starts watching a deploy; key (e.g. repo@branch) identifies it, and a new watch for the same key
+        cancels the previous one. The watch ends window seconds after started_at; its first sample is taken
+        one rate_window later, so no rate covers traffic from before started_at (e.g. the smoke test).
+        The baseline is the baseline_window seconds before baseline_end (default started_at). Returns the watch id.
+        """
+        with self._condition:
+            for previous in [w for w in self._watches.values() if w.key == key]:
+                self._finish(previous, WATCH_CANCELLED)
+            watch = DeployWatch(
+                next(self._ids), key, job, instance, started_at, started_at + window, interval, step, rate_window,
+                baseline_window, baseline_end or started_at, rules, on_done,
+            )
+            watch.cursor = started_at + (_parse_duration(rate_window) or 0)
+            self._watches[watch.watch_id] = watch
+            DEPLOY_WATCHES_ACTIVE.set(len(self._watches))
+            heapq.heappush(self._heap, (max(self.clock(), watch.cursor) + interval, watch.watch_id))
+            self._ensure_thread()
+            self._condition.notify()
+        logger.info(f"Watching {key} ({instance or 'all targets'}) for {window:g}s after deploy.")
+        return watch.watch_id
+
+    def cancel(self, watch_id):
+        with self._condition:
+            watch = self._watches.get(watch_id)
+            if watch is not None:
+                self._finish(watch, WATCH_CANCELLED)
+        return watch is not None
+
+    def active(self):
+        with self._condition:
+            return [watch.status() for watch in self._watches.values()]
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._schedule, name="deploy-watch-scheduler", daemon=True)
+            self._thread.start()
+
+    def _schedule(self):
+        with self._condition:
+            while not self._stopped:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                due, watch_id = self._heap[0]
+                delay = due - self.clock()
+                if delay > 0:
+                    self._condition.wait(min(delay, 60))
+                    continue
+                heapq.heappop(self._heap)
+                watch = self._watches.get(watch_id)
+                if watch is not None:
+                    self._executor.submit(self._tick, watch)
+
+    def _tick(self, watch):
+        try:
+            self._advance(watch)
+        except Exception as e:
+            logger.warning(f"Deploy watch of {watch.key} failed a tick: {e!r}")
+        with self._condition:
+            if watch.watch_id not in self._watches:
+                return
+            if watch.finding is not None:
+                self._finish(watch, WATCH_BREACHED)
+            elif watch.cursor > watch.ends_at:
+                self._finish(watch, WATCH_PASSED)
+            else:
+                heapq.heappush(self._heap, (self.clock() + watch.interval, watch.watch_id))
+                self._condition.notify()
+
+    def _advance(self, watch):
+        if watch.baseline is None:
+            series = self.fetch_range(
+                self.prometheus_url, watch.baseline_end - watch.baseline_window, watch.baseline_end, watch.step,
+                job=watch.job, instance=watch.instance, window=watch.window, queries=WATCH_QUERIES,
+            )
+            watch.baseline = summarize_baseline(series)
+        end = min(self.clock(), watch.ends_at)
+        if end < watch.cursor:
+            return
+        series = self.fetch_range(
+            self.prometheus_url, watch.cursor, end, watch.step,
+            job=watch.job, instance=watch.instance, window=watch.window, queries=WATCH_QUERIES,
+        )
+        # Range queries return samples at cursor + k * step, so the next one starts a step after the last.
+        watch.cursor = max([watch.cursor] + [t for samples in series.values() for t, _ in samples]) + watch.step
+        if end >= watch.ends_at:
+            watch.cursor = max(watch.cursor, watch.ends_at + watch.step)
+        watch.finding = watch.observe(series)
+
+    def _finish(self, watch, outcome):
+        """Removes a watch and reports it; called with the lock held, the callback runs on the pool."""
+        del self._watches[watch.watch_id]
+        DEPLOY_WATCHES_ACTIVE.set(len(self._watches))
+        DEPLOY_WATCH_OUTCOMES.labels(outcome=outcome).inc()
+        watch.outcome = outcome
+        status = watch.status()
+        if outcome == WATCH_BREACHED:
+            logger.warning(f"Deploy watch of {watch.key} breached after {watch.finding['after_s']}s: {watch.finding['reasons']}")
+        else:
+            logger.info(f"Deploy watch of {watch.key} {outcome} after {watch.samples} samples.")
+        if watch.on_done is not None:
+            self._executor.submit(self._report, watch, status)
+
+    def _report(self, watch, status):
+        try:
+            watch.on_done(status)
+        except Exception as e:
+            logger.error(f"Handling the {status['outcome']} deploy watch of {watch.key} failed: {e!r}")
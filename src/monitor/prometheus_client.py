@@ -1,14 +1,49 @@
+import math
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 
-from prometheus_api_client import PrometheusConnect
+import requests
 from loguru import logger
 
+# Reused for the lightweight /api/v1 polling done while waiting for scrapes.
+_session = requests.Session()
+
+# One PrometheusConnect (and its HTTP connection pool) per server, shared by all queries.
+_connections = {}
+_connections_lock = threading.Lock()
+_query_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="promql")
+
+# PromQL templates for the post-deploy metric bundle. {selector} expands to the job/instance
+# label matchers, {extra} to additional matchers (prefixed with a comma) and {window} to the rate window.
+DEFAULT_METRIC_QUERIES = {
+    "up": 'max(up{{{selector}}})',
+    "request_rate": 'sum(rate(http_requests_total{{{selector}}}[{window}]))',
+    "error_5xx_rate": 'sum(rate(http_requests_total{{{selector}{extra_5xx}}}[{window}]))',
+    "error_4xx_rate": 'sum(rate(http_requests_total{{{selector}{extra_4xx}}}[{window}]))',
+    "latency_p50_s": 'histogram_quantile(0.50, sum by (le) (rate(http_requests_latency_seconds_bucket{{{selector}}}[{window}])))',
+    "latency_p95_s": 'histogram_quantile(0.95, sum by (le) (rate(http_requests_latency_seconds_bucket{{{selector}}}[{window}])))',
+    "latency_p99_s": 'histogram_quantile(0.99, sum by (le) (rate(http_requests_latency_seconds_bucket{{{selector}}}[{window}])))',
+}
+
+def get_connection(prometheus_url):
+    with _connections_lock:
+        prom = _connections.get(prometheus_url)
+        if prom is None:
+            from prometheus_api_client import PrometheusConnect
+            prom = PrometheusConnect(url=prometheus_url, disable_ssl=True)
+            _connections[prometheus_url] = prom
+        return prom
+
 def fetch_metrics(prometheus_url, query="up"):
     """
     Fetch metrics from Prometheus using prometheus-api-client.
     Returns the result of the query as a Python object.
     """
     try:
-        prom = PrometheusConnect(url=prometheus_url, disable_ssl=True)
+        prom = get_connection(prometheus_url)
         logger.info(f"Querying Prometheus: {query}")
         result = prom.custom_query(query=query)
         logger.info(f"Prometheus query result: {result}")
@@ -16,3 +51,180 @@ def fetch_metrics(prometheus_url, query="up"):
     except Exception as e:
         logger.error(f"Failed to fetch metrics from Prometheus: {e}")
         raise
+
+def _label_selector(job=None, instance=None):
+    matchers = []
+    if job:
+        matchers.append(f'job="{job}"')
+    if instance:
+        matchers.append(f'instance="{instance}"')
+    return ",".join(matchers)
+
+def _scalar(result):
+    """Reduces an instant-vector result to one float (summing series); None when empty or NaN."""
+    values = []
+    for sample in result or []:
+        try:
+            value = float(sample["value"][1])
+        except (KeyError, IndexError, TypeError, ValueError):
+            continue
+        if not math.isnan(value):
+            values.append(value)
+    return round(sum(values), 6) if values else None
+
+def _render(template, selector, window):
+    separator = "," if selector else ""
+    return template.format(
+        selector=selector,
+        window=window,
+        extra_5xx=f'{separator}status=~"5.."',
+        extra_4xx=f'{separator}status=~"4.."',
+    )
+
+def fetch_metric_bundle(prometheus_url, job=None, instance=None, window="1m", queries=None):
+    """
+    Runs a set of PromQL queries concurrently over one pooled connection, scoped to job/instance,
+    and returns a compact summary of plain numbers, e.g.
+    {'up': 1.0, 'request_rate': 2.5, 'error_5xx_rate': 0.0, 'error_4xx_rate': 0.1,
+     'latency_p50_s': 0.012, 'latency_p95_s': 0.05, 'latency_p99_s': 0.08, 'error_5xx_ratio': 0.0}.
+    Missing series and failed queries are reported as None.
+    """
+    queries = queries or DEFAULT_METRIC_QUERIES
+    selector = _label_selector(job, instance)
+    prom = get_connection(prometheus_url)
+
+    def run(name, template):
+        try:
+            return name, _scalar(prom.custom_query(query=_render(template, selector, window)))
+        except Exception as e:
+            logger.warning(f"Metric bundle query '{name}' failed: {e}")
+            return name, None
+
+    logger.info(f"Querying {len(queries)} metrics from Prometheus for {selector or 'all targets'}.")
+    summary = dict(_query_executor.map(lambda item: run(*item), queries.items()))
+    if summary.get("request_rate") and summary.get("error_5xx_rate") is not None:
+        summary["error_5xx_ratio"] = round(summary["error_5xx_rate"] / summary["request_rate"], 6)
+    logger.info(f"Metric bundle: {summary}")
+    return summary
+
+def _series(result):
+    """Reduces a range-query (matrix) result to [(timestamp, value)], summing series per timestamp and skipping NaN."""
+    totals = {}
+    for series in result or []:
+        for timestamp, raw in series.get("values") or []:
+            try:
+                value = float(raw)
+            except (TypeError, ValueError):
+                continue
+            if not math.isnan(value):
+                totals[float(timestamp)] = totals.get(float(timestamp), 0.0) + value
+    return [(timestamp, round(value, 6)) for timestamp, value in sorted(totals.items())]
+
+def fetch_metric_range(prometheus_url, start, end, step, job=None, instance=None, window="1m", queries=None):
+    """
+    Range-query counterpart of fetch_metric_bundle: evaluates each query at every step seconds from
+    start to end (epoch seconds) and returns {name: [(timestamp, value), ...]}, oldest first.
+    A failed query yields an empty list.
+    """
+    queries = queries or DEFAULT_METRIC_QUERIES
+    selector = _label_selector(job, instance)
+    prom = get_connection(prometheus_url)
+    start_time = datetime.fromtimestamp(start, timezone.utc)
+    end_time = datetime.fromtimestamp(end, timezone.utc)
+
+    def run(name, template):
+        try:
+            result = prom.custom_query_range(
+                query=_render(template, selector, window), start_time=start_time, end_time=end_time, step=f"{step:g}s"
+            )
+            return name, _series(result)
+        except Exception as e:
+            logger.warning(f"Metric range query '{name}' failed: {e}")
+            return name, []
+
+    return dict(_query_executor.map(lambda item: run(*item), queries.items()))
+
+def _parse_timestamp(value):
+    """Parses Prometheus' RFC 3339 timestamps (nanosecond precision, 'Z' or offset) into epoch seconds."""
+    match = re.match(r"^(.*?T\d{2}:\d{2}:\d{2})(?:\.(\d+))?(Z|[+-]\d{2}:\d{2})?$", value or "")
+    if not match:
+        return None
+    base, fraction, zone = match.groups()
+    fraction = (fraction or "0")[:6].ljust(6, "0")
+    zone = "+00:00" if zone in (None, "Z") else zone
+    try:
+        return datetime.fromisoformat(f"{base}.{fraction}{zone}").timestamp()
+    except ValueError:
+        return None
+
+def _parse_duration(value):
+    """Parses a Prometheus duration such as '15s', '1m' or '1m30s' into seconds."""
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value or "")
+    return sum(float(amount) * units[unit] for amount, unit in parts) or None
+
+def get_scrape_targets(prometheus_url, job=None, instance=None):
+    """
+    Returns the active scrape targets matching job/instance as dicts with
+    'job', 'instance', 'health', 'last_scrape' (epoch seconds) and 'scrape_interval' (seconds or None).
+    """
+    response = _session.get(
+        f"{prometheus_url.rstrip('/')}/api/v1/targets", params={"state": "active"}, timeout=5
+    )
+    response.raise_for_status()
+    targets = []
+    for target in response.json().get("data", {}).get("activeTargets", []):
+        labels = target.get("labels", {})
+        if job and labels.get("job") != job:
+            continue
+        if instance and labels.get("instance") != instance:
+            continue
+        targets.append({
+            "job": labels.get("job"),
+            "instance": labels.get("instance"),
+            "health": target.get("health"),
+            "last_scrape": _parse_timestamp(target.get("lastScrape")),
+            "scrape_interval": _parse_duration(target.get("scrapeInterval")),
+        })
+    return targets
+
+def wait_for_scrape(prometheus_url, since, job=None, instance=None, timeout=30.0, min_poll=0.2, max_poll=5.0):
+    """
+    Blocks until Prometheus has scraped a matching target at or after `since` (epoch seconds),
+    e.g. the end of the smoke test, or until timeout seconds have passed.
+
+    Instead of sleeping a fixed scrape interval, it reads each target's last scrape time and
+    interval from /api/v1/targets and sleeps only until the next scrape is due.
+    Returns a dict with 'scraped', 'waited_s' and 'last_scrape'.
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    outcome = {"scraped": False, "waited_s": None, "last_scrape": None}
+    while True:
+        next_poll = min_poll
+        try:
+            targets = get_scrape_targets(prometheus_url, job=job, instance=instance)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"Could not read Prometheus scrape targets: {e}")
+            targets = []
+        scrapes = [t["last_scrape"] for t in targets if t["last_scrape"]]
+        if scrapes:
+            outcome["last_scrape"] = max(scrapes)
+            if outcome["last_scrape"] >= since:
+                outcome["scraped"] = True
+                break
+            # Sleep until just after the next scrape is due, based on the target's own interval.
+            interval = min((t["scrape_interval"] for t in targets if t["scrape_interval"]), default=None)
+            if interval:
+                next_poll = outcome["last_scrape"] + interval - time.time() + min_poll
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(max(min_poll, min(next_poll, max_poll, remaining)))
+
+    outcome["waited_s"] = round(time.monotonic() - started, 3)
+    if outcome["scraped"]:
+        logger.info(f"Prometheus scraped fresh metrics after {outcome['waited_s']}s.")
+    else:
+        logger.warning(f"No Prometheus scrape newer than the smoke test within {timeout}s; using the latest data.")
+    return outcome
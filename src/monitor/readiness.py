@@ -0,0 +1,113 @@
+import random
+import socket
+import subprocess
+import time
+from urllib.parse import urlparse
+
+import requests
+from loguru import logger
+
+from src.monitor.agent_metrics import TIME_TO_READY
+
+# One keep-alive session for all probes; consecutive attempts reuse the same connection.
+_session = requests.Session()
+
+def _backoff_delays(initial_delay, max_delay):
+    """Exponential backoff with jitter: roughly initial, 2x, 4x ... capped at max_delay."""
+    delay = initial_delay
+    while True:
+        yield delay / 2 + random.uniform(0, delay / 2)
+        delay = min(delay * 2, max_delay)
+
+def _sleep_until_next(delays, deadline):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return False
+    time.sleep(min(next(delays), remaining))
+    return True
+
+def wait_for_port(host, port, deadline, initial_delay=0.02, max_delay=1.0):
+    """Waits until a TCP connection to host:port succeeds; cheaper than HTTP while the process is still starting."""
+    delays = _backoff_delays(initial_delay, max_delay)
+    while True:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return True
+        except OSError:
+            if not _sleep_until_next(delays, deadline):
+                return False
+
+def docker_container_state(container_name):
+    """
+    Returns (running, health) for a container, where health is 'starting', 'healthy', 'unhealthy'
+    or None when the image defines no HEALTHCHECK. Returns (None, None) if docker can't be queried.
+    """
+    try:
+        result = subprocess.run(
+            ["docker", "inspect", "--format",
+             "{{.State.Running}} {{if .State.Health}}{{.State.Health.Status}}{{end}}", container_name],
+            check=True, capture_output=True, text=True, timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None, None
+    parts = result.stdout.split()
+    running = parts[0] == "true" if parts else None
+    health = parts[1] if len(parts) > 1 else None
+    return running, health
+
+def wait_until_ready(base_url, path="/", timeout=60.0, container_name=None, wait_for_tcp=True,
+                     initial_delay=0.05, max_delay=2.0, pipeline="unknown"):
+    """
+    Polls base_url + path until it answers with a 2xx, starting within milliseconds and backing off
+    exponentially with jitter, for at most timeout seconds.
+
+    - wait_for_tcp: first wait for the port to accept connections before sending HTTP requests.
+    - container_name: consult `docker inspect`; an exited container or an 'unhealthy' HEALTHCHECK
+      fails immediately, a 'starting' one is waited on.
+
+    Returns a dict with 'ready', 'time_to_ready_s', 'attempts', 'status_code' and 'reason',
+    and records time-to-ready in the sdlc_agent_time_to_ready_seconds histogram.
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    url = base_url.rstrip("/") + "/" + path.lstrip("/")
+    outcome = {"ready": False, "time_to_ready_s": None, "attempts": 0, "status_code": None, "reason": None}
+    logger.info(f"Waiting up to {timeout}s for {url} to become ready...")
+
+    parsed = urlparse(base_url)
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    if wait_for_tcp and not wait_for_port(parsed.hostname, port, deadline):
+        outcome["reason"] = f"port {port} did not open"
+
+    delays = _backoff_delays(initial_delay, max_delay)
+    while outcome["reason"] is None:
+        if container_name:
+            running, health = docker_container_state(container_name)
+            if running is False:
+                outcome["reason"] = f"container '{container_name}' is not running"
+                break
+            if health == "unhealthy":
+                outcome["reason"] = f"container '{container_name}' reported unhealthy"
+                break
+
+        outcome["attempts"] += 1
+        try:
+            response = _session.get(url, timeout=max(0.1, min(5, deadline - time.monotonic())))
+            outcome["status_code"] = response.status_code
+            if 200 <= response.status_code < 300:
+                outcome["ready"] = True
+                break
+        except requests.RequestException as e:
+            logger.debug(f"Readiness attempt {outcome['attempts']} for {url} failed: {e}")
+
+        if not _sleep_until_next(delays, deadline):
+            outcome["reason"] = f"not ready after {timeout}s (last status: {outcome['status_code']})"
+
+    elapsed = time.monotonic() - started
+    outcome["time_to_ready_s"] = round(elapsed, 3)
+    TIME_TO_READY.labels(pipeline=pipeline, outcome="ready" if outcome["ready"] else "failed").observe(elapsed)
+    if outcome["ready"]:
+        logger.info(f"{url} ready after {elapsed:.3f}s ({outcome['attempts']} attempt(s)).")
+    else:
+        logger.error(f"Readiness check failed for {url}: {outcome['reason']}")
+    return outcome
@@ -0,0 +1,125 @@
+import itertools
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from loguru import logger
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class _Pacer:
+    """Spaces request starts evenly so the whole run stays at or below rate requests/second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            slot = max(self.next_slot, time.monotonic())
+            self.next_slot = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _summarize(samples):
+    latencies = sorted(latency for latency, _ in samples)
+    status_codes = Counter(str(status) if status is not None else "error" for _, status in samples)
+    failures = sum(1 for _, status in samples if status is None or status >= 500)
+    return {
+        "requests": len(samples),
+        "status_codes": dict(status_codes),
+        "error_rate": round(failures / len(samples), 4) if samples else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None,
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else None,
+        },
+    }
+
+
+def run_smoke_test(base_url, endpoints=("/",), concurrency=8, requests_per_endpoint=20, duration=None,
+                   rate=None, timeout=2.0):
+    """
+    Generates traffic against base_url with `concurrency` threads sharing one pooled keep-alive session.
+
+    Either sends requests_per_endpoint requests to every endpoint, or, when duration (seconds) is set,
+    cycles through the endpoints until it elapses. rate caps the total requests per second.
+    Transport errors count as status 'error'; error_rate counts those plus 5xx responses.
+
+    Returns {'endpoints': {path: summary}, 'total': summary, 'duration_s', 'requests_per_second'} where
+    each summary has 'requests', 'status_codes', 'error_rate' and 'latency_ms' (p50/p95/p99/max/mean).
+    """
+    base_url = base_url.rstrip("/")
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    pacer = _Pacer(rate)
+    samples = defaultdict(list)
+    samples_lock = threading.Lock()
+
+    def hit(endpoint):
+        pacer.wait()
+        started = time.perf_counter()
+        try:
+            status = session.get(base_url + endpoint, timeout=timeout).status_code
+        except requests.RequestException:
+            status = None
+        latency_ms = round((time.perf_counter() - started) * 1000, 2)
+        with samples_lock:
+            samples[endpoint].append((latency_ms, status))
+
+    started = time.monotonic()
+    if duration:
+        deadline = started + duration
+        endpoint_cycle = itertools.cycle(endpoints)
+        cycle_lock = threading.Lock()
+
+        def worker():
+            while time.monotonic() < deadline:
+                with cycle_lock:
+                    endpoint = next(endpoint_cycle)
+                hit(endpoint)
+
+        logger.info(f"Smoke test: {concurrency} workers against {base_url} for {duration}s ({list(endpoints)}).")
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(concurrency):
+                pool.submit(worker)
+    else:
+        # Interleave endpoints so every endpoint sees load throughout the run.
+        plan = [endpoint for _ in range(requests_per_endpoint) for endpoint in endpoints]
+        logger.info(f"Smoke test: {len(plan)} requests to {base_url} with concurrency {concurrency} ({list(endpoints)}).")
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(hit, plan))
+    elapsed = time.monotonic() - started
+    session.close()
+
+    all_samples = [sample for endpoint_samples in samples.values() for sample in endpoint_samples]
+    results = {
+        "endpoints": {endpoint: _summarize(samples[endpoint]) for endpoint in endpoints},
+        "total": _summarize(all_samples),
+        "duration_s": round(elapsed, 3),
+        "requests_per_second": round(len(all_samples) / elapsed, 2) if elapsed else None,
+    }
+    logger.info(
+        f"Smoke test finished: {len(all_samples)} requests in {elapsed:.2f}s, "
+        f"error rate {results['total']['error_rate']}, p95 {results['total']['latency_ms']['p95']} ms."
+    )
+    return results
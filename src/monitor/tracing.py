@@ -0,0 +1,132 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from src.config.settings import TRACE_EXPORT_DIR
+from src.monitor.agent_metrics import STAGE_DURATION, STAGE_IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+# Completed span trees, newest last, for GET /traces/<trace_id>.
+MAX_RECENT_TRACES = 100
+
+_current_span = contextvars.ContextVar("sdlc_agent_current_span", default=None)
+_recent_traces = OrderedDict()
+_recent_traces_lock = threading.Lock()
+
+
+class Span:
+    """One timed stage of a pipeline run; spans opened while it is current become its children."""
+
+    def __init__(self, name, trace_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.attributes = dict(attributes)
+        self.started_at = time.time()
+        self.duration_s = None
+        self.status = "ok"
+        self.error = None
+        self.children = []
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set(self, **attributes):
+        """Adds attributes while the span is open, e.g. a cache hit or the number of attempts."""
+        self.attributes.update(attributes)
+
+    def _add_child(self, child):
+        with self._lock:
+            self.children.append(child)
+
+    def to_dict(self):
+        with self._lock:
+            children = list(self.children)
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_s": self.duration_s,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+            "children": [child.to_dict() for child in children],
+        }
+
+
+def current_trace_id():
+    current = _current_span.get()
+    return current.trace_id if current else None
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Times the enclosed block as a stage: sdlc_agent_stage_duration_seconds{stage=name,status} and the
+    sdlc_agent_stage_in_flight gauge. status is 'ok' or 'failed', as in the run history. Nested spans form
+    a tree; a span without a parent is the root of a new trace, which is kept for /traces and written to
+    TRACE_EXPORT_DIR as JSON when that is set.
+    """
+    parent = _current_span.get()
+    current = Span(name, parent.trace_id if parent else uuid.uuid4().hex[:16], attributes)
+    if parent:
+        parent._add_child(current)
+    token = _current_span.set(current)
+    in_flight = STAGE_IN_FLIGHT.labels(stage=name)
+    in_flight.inc()
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "failed"
+        current.error = str(e)[:500]
+        raise
+    finally:
+        current.duration_s = round(time.monotonic() - current._started, 6)
+        _current_span.reset(token)
+        in_flight.dec()
+        STAGE_DURATION.labels(stage=name, status=current.status).observe(current.duration_s)
+        if parent is None:
+            _finish_trace(current)
+
+
+def traced(name=None):
+    """Decorator form of span(); the stage name defaults to the function name."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def propagate(func):
+    """Wraps func to run in a copy of the caller's context, so spans opened in a worker thread join the caller's trace."""
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+def _finish_trace(root):
+    with _recent_traces_lock:
+        _recent_traces[root.trace_id] = root
+        while len(_recent_traces) > MAX_RECENT_TRACES:
+            _recent_traces.popitem(last=False)
+    if TRACE_EXPORT_DIR:
+        try:
+            os.makedirs(TRACE_EXPORT_DIR, exist_ok=True)
+            path = os.path.join(TRACE_EXPORT_DIR, f"{root.name}-{root.trace_id}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"trace_id": root.trace_id, **root.to_dict()}, f, indent=2, default=str)
+        except OSError as e:
+            logger.warning(f"Could not export trace {root.trace_id}: {e}")
+
+
+def get_trace(trace_id):
+    """The span tree of a finished trace as a dict, or None if it is unknown or was evicted."""
+    with _recent_traces_lock:
+        root = _recent_traces.get(trace_id)
+    return {"trace_id": trace_id, **root.to_dict()} if root else None
@@ -1,21 +1,91 @@
+import hashlib
 import logging
 import os
 import re
-import requests
 import time
-from src.config.settings import PROMETHEUS_URL, GITHUB_TOKEN, JIRA_URL, JIRA_USER, JIRA_API_TOKEN, JIRA_PROJECT_KEY, EMAIL_SMTP_SERVER, EMAIL_PORT, EMAIL_USER, EMAIL_PASSWORD, LOG_LEVEL
+from contextlib import contextmanager
+from src.config.settings import (
+    PROMETHEUS_URL,
+    GITHUB_TOKEN,
+    JIRA_URL,
+    JIRA_USER,
+    JIRA_API_TOKEN,
+    JIRA_PROJECT_KEY,
+    EMAIL_SMTP_SERVER,
+    EMAIL_PORT,
+    EMAIL_USER,
+    EMAIL_PASSWORD,
+    LOG_LEVEL,
+    get_settings,
+    DEPLOY_TIMEOUT,
+    DEPLOY_LOG_DIR,
+    DEPLOY_LOG_MAX_BYTES,
+    DEPLOY_LOG_BACKUPS,
+    DEPLOY_LOG_TAIL_LINES,
+    BLUE_GREEN_STATE_DIR,
+    BLUE_GREEN_PORT_OFFSET,
+    DEPLOY_HISTORY_DB,
+    INCIDENT_DB,
+    INCIDENT_DIGEST_INTERVAL,
+    INCIDENT_RATE_LIMIT,
+    INCIDENT_RATE_WINDOW,
+    INCIDENT_RESOLVE_AFTER,
+)
 from src.deploy.deployer import deploy_application
-from src.deploy.auto_deployer import auto_deploy, fetch_app_context_from_local
-from src.monitor.prometheus_client import fetch_metrics
-from src.incident.github_issues import create_github_issue
-from src.incident.jira_client import create_jira_ticket
-from src.incident.email_notifier import send_email_notification
-from src.llm.mistral_chain import get_llm_decision
+from src.deploy.planner import PlanError, plan_deployment, rollback_plan, write_planned_script
+from src.deploy.blue_green import blue_green_deploy
+from src.deploy.auto_deployer import (
+    container_name_for,
+    fetch_app_context_from_local,
+    invalidate_cached_deployment_script,
+    prepare_workspace,
+    write_deployment_script,
+)
+from src.monitor.prometheus_client import fetch_metric_bundle, wait_for_scrape
+from src.monitor.readiness import wait_until_ready
+from src.monitor.smoke_runner import run_smoke_test
+from src.monitor.deploy_watch import DeployWatcher, WATCH_BREACHED, WATCH_PASSED
+from src.incident.correlator import IncidentCorrelator, metric_signature
+from src.incident.incident_store import IncidentStore
+from src.incident.rules import (
+    channels_for,
+    evaluate_incident_rules,
+    describe_decision,
+    VERDICT_AMBIGUOUS,
+    VERDICT_INCIDENT,
+)
+from src.jobs.intake import JOB_ROLLBACK
+from src.history.history_store import DeploymentHistory, RUN_FAILED, RUN_SKIPPED, RUN_SUCCEEDED
+from src.monitor.agent_metrics import DEPLOY_PHASE_DURATION, INCIDENT_DECISIONS
+from src.monitor.tracing import current_trace_id, span, traced
+from src.llm.mistral_chain import (
+    get_structured_decision,
+    PROMPT_DEPLOY_GATE,
+    PROMPT_POST_DEPLOY_ANALYSIS,
+)
 
 # Configure logging
 logging.basicConfig(level=LOG_LEVEL)
 logger = logging.getLogger("SDLC-Agent")
 
+history = DeploymentHistory(DEPLOY_HISTORY_DB)
+# One scheduler thread and a small pool serve every deploy under post-deploy watch.
+deploy_watcher = DeployWatcher(PROMETHEUS_URL)
+# Repeated incidents of the same problem update one ticket and are batched into per-channel digests.
+incident_correlator = IncidentCorrelator(
+    IncidentStore(INCIDENT_DB),
+    digest_interval=INCIDENT_DIGEST_INTERVAL,
+    rate_limit=INCIDENT_RATE_LIMIT,
+    rate_window=INCIDENT_RATE_WINDOW,
+    resolve_after=INCIDENT_RESOLVE_AFTER,
+)
+
+@contextmanager
+def _stage(run_id, name):
+    """A pipeline stage: traced as a span (metrics, span tree) and recorded in the run history."""
+    with span(name), history.stage(run_id, name):
+        yield
+
 def _summarize_pr_for_llm(pr_event):
     """Summarizes a GitHub PR event into a structured string for LLM analysis."""
     try:
@@ -38,23 +108,17 @@ def _summarize_pr_for_llm(pr_event):
         logger.error(f"Failed to summarize PR event: {e}")
         return "Could not summarize PR event."
 
-def _perform_health_check(url, retries=5, delay=5):
-    """Pings a URL to check if the application is responsive after deployment."""
-    logger.info(f"Performing health check on {url}...")
-    for i in range(retries):
-        try:
-            response = requests.get(url, timeout=5)
-            # Check for any 2xx success status code
-            if 200 <= response.status_code < 300:
-                logger.info(f"Health check successful! Status code: {response.status_code}")
-                return True
-            else:
-                logger.warning(f"Health check attempt {i+1}/{retries} failed with status code: {response.status_code}")
-        except requests.RequestException as e:
-            logger.warning(f"Health check attempt {i+1}/{retries} failed with exception: {e}")
-        time.sleep(delay)
-    logger.error(f"Health check failed after {retries} attempts for URL: {url}")
-    return False
+def _perform_health_check(repo, port, pipeline, container_name=None):
+    """Waits for the freshly deployed container to answer its readiness probe."""
+    settings = get_settings()
+    outcome = wait_until_ready(
+        f"http://localhost:{port}",
+        path=settings.readiness_path,
+        timeout=settings.readiness_timeout,
+        container_name=container_name or container_name_for(repo),
+        pipeline=pipeline,
+    )
+    return outcome["ready"]
 
 def _get_port_from_script(script_path):
     """Parses the generated deployment script to find the exposed host port."""
@@ -74,14 +138,281 @@ def _get_port_from_script(script_path):
     logger.warning("Could not determine port from script, falling back to default 5000.")
     return "5000" # Fallback to default
 
+def _run_deployment_script(repo, script_path, cached=True):
+    """
+    Executes the deployment script with a timeout, streaming its output to a per-deployment log.
+    Drops a cached (LLM-generated) script from the script cache if it fails so the next run regenerates it.
+    Returns the deployment snapshot.
+    """
+    try:
+        result = deploy_application(script_path, **_deploy_options())
+    except Exception:
+        if cached:
+            invalidate_cached_deployment_script(os.path.dirname(script_path), container_name_for(repo))
+        raise
+    _record_deployment(repo, result)
+    return result
+
+def _deploy_options():
+    return {
+        "timeout": DEPLOY_TIMEOUT,
+        "log_dir": DEPLOY_LOG_DIR,
+        "tail_lines": DEPLOY_LOG_TAIL_LINES,
+        "log_max_bytes": DEPLOY_LOG_MAX_BYTES,
+        "log_backups": DEPLOY_LOG_BACKUPS,
+    }
+
+def _record_deployment(repo, result):
+    for phase, seconds in result["phases"].items():
+        DEPLOY_PHASE_DURATION.labels(phase=phase, status=result["status"]).observe(seconds)
+    logger.info(f"Deployment {result['deployment_id']} of {repo} took {result['duration_s']}s (phases: {result['phases']}).")
+
+def _file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def _deploy_workspace(repo, workspace_dir, commit_sha=None, pipeline="unknown", branch=None, run_id=None):
+    """
+    Deploys a prepared workspace and returns (host port, deployment snapshot). Repos with a Dockerfile are
+    planned natively (see src/deploy/planner.py); the rest, or all when DEPLOY_PLANNER=llm, use an LLM-written script.
+    With DEPLOY_STRATEGY=blue_green, planned deploys are health-checked in an idle slot before traffic moves
+    and rolled back automatically (DeploymentRolledBack) if the check fails.
+    The last good image from the run history is offered to docker build as an extra cache source.
+    """
+    settings = get_settings()
+    if settings.deploy_planner != "llm":
+        last_good = history.last_successful_run(repo, branch, require_image=True)
+        try:
+            plan = plan_deployment(
+                workspace_dir, container_name_for(repo), commit_sha=commit_sha,
+                cache_from=[last_good["image_ref"]] if last_good else None,
+            )
+        except PlanError as e:
+            logger.info(f"{e}; falling back to an LLM-generated deployment script.")
+        else:
+            if run_id:
+                history.update_run(run_id, image_ref=plan["image_ref"], strategy=settings.deploy_strategy, port=plan["host_port"])
+            if settings.deploy_strategy == "blue_green":
+                result = blue_green_deploy(
+                    plan,
+                    workspace_dir,
+                    health_check=lambda port, container: _perform_health_check(repo, port, pipeline, container),
+                    state_dir=BLUE_GREEN_STATE_DIR,
+                    port_offset=BLUE_GREEN_PORT_OFFSET,
+                    **_deploy_options()
+                )
+                _record_deployment(repo, result)
+            else:
+                script_path = write_planned_script(plan, workspace_dir)
+                result = _run_deployment_script(repo, script_path, cached=False)
+                if run_id:
+                    history.update_run(run_id, script_hash=_file_hash(script_path))
+            if run_id:
+                history.update_run(run_id, deploy=_deploy_summary(result))
+            return str(plan["host_port"]), {**result, "plan": plan}
+        if settings.deploy_strategy == "blue_green":
+            logger.warning("Blue/green deploys need a Dockerfile; using the LLM-generated script instead.")
+    script_path = write_deployment_script(repo, workspace_dir)
+    result = _run_deployment_script(repo, script_path)
+    port = _get_port_from_script(script_path)
+    if run_id:
+        history.update_run(run_id, script_hash=_file_hash(script_path), port=port, deploy=_deploy_summary(result))
+    return port, result
+
+def _deploy_summary(result):
+    keys = ("deployment_id", "status", "duration_s", "phases", "log_path", "slot", "swap_latency_s")
+    return {key: result[key] for key in keys if key in result}
+
+def _rollback_to_last_good(repo, branch, result, pipeline, last_good=None):
+    """
+    After a failed health check of a planned (non blue/green) deploy, re-runs the image of the last
+    successful run from the history (or last_good, a run looked up before this deploy succeeded).
+    Returns the image rolled back to, or None if there was nothing to do.
+    """
+    plan = result.get("plan")
+    image_ref = _rollback_image(result, last_good or history.last_successful_run(repo, branch, require_image=True))
+    if image_ref is None:
+        return None
+    logger.warning(f"Rolling {repo}@{branch} back to {image_ref}...")
+    script_path = write_planned_script(
+        rollback_plan(plan, image_ref), os.path.dirname(result["script_path"]), file_name="rollback_deploy.sh"
+    )
+    _record_deployment(repo, deploy_application(script_path, **_deploy_options()))
+    if not _perform_health_check(repo, plan["host_port"], pipeline=pipeline):
+        logger.error(f"Rollback of {repo}@{branch} to {image_ref} is not healthy either.")
+    return image_ref
+
+def _rollback_image(result, last_good):
+    """The image a deploy can be rolled back to: last_good's, unless it is blue/green, unplanned or already that image."""
+    plan = result.get("plan")
+    if get_settings().deploy_strategy == "blue_green" or not plan or not last_good or last_good["image_ref"] == plan["image_ref"]:
+        return None
+    return last_good["image_ref"]
+
+# (job_queue, on_queued) set by queue_rollbacks(); None runs watch rollbacks on the watcher's thread.
+_rollback_queue = None
+
+def queue_rollbacks(job_queue, on_queued=None):
+    """
+    Makes rollbacks after a post-deploy watch breach run as repo-scoped JOB_ROLLBACK jobs on job_queue
+    (handled by orchestrate_watch_rollback), so they wait for the repo's running deploy instead of racing
+    it. on_queued is called after each enqueue, e.g. to wake the workers. Without a queue they run inline.
+    """
+    global _rollback_queue
+    _rollback_queue = (job_queue, on_queued)
+
+def orchestrate_watch_rollback(payload):
+    """
+    Rolls a deploy whose post-deploy watch breached back to payload['image_ref'], unless a newer run of
+    the same repo@branch has started since: that run owns the container now and must not be replaced by
+    the old image. Returns the image rolled back to, or None.
+    """
+    repo, branch, run_id = payload["repo"], payload["branch"], payload["run_id"]
+    newer = history.newer_run(run_id)
+    if newer:
+        logger.info(f"Skipping the rollback of {repo}@{branch}: run {newer['id']} started after the watched run {run_id}.")
+        history.update_run(run_id, rollback_skipped=f"superseded by run {newer['id']}")
+        return None
+    rolled_back_to = _rollback_to_last_good(
+        repo, branch, payload["deployment"], pipeline="pr_merge", last_good={"image_ref": payload["image_ref"]}
+    )
+    history.update_run(run_id, rolled_back_to=rolled_back_to)
+    return rolled_back_to
+
+def _incident_payload(repo, analysis, pr_summary):
+    """A detailed incident payload, so every channel reports the same thing."""
+    return {
+        "title": f"AI-Detected Incident in {repo}",
+        "description": f"**AI SRE Analysis:**\n{analysis}\n\n**Triggering Pull Request:**\n{pr_summary}",
+        "repo": repo, # For GitHub Issues
+        "recipient": EMAIL_USER, # For Email Notifier
+        "project_key": JIRA_PROJECT_KEY # For Jira Tickets
+    }
+
+def _notification_summary(notifications):
+    return {
+        channel: {"ok": outcome["ok"], "result": str(outcome["result"]) if outcome["result"] else outcome["error"]}
+        for channel, outcome in notifications.items()
+    }
+
+def _watch_deployment(repo, branch, run_id, deployment, scrape_job, scrape_instance, deploy_started, watch_from, pr_summary):
+    """
+    Puts a deploy under post-deploy watch (src/monitor/deploy_watch.py) against its pre-deploy baseline.
+    If the watch breaches, the run is marked failed, a rollback to the image that was live before it is
+    queued (when WATCH_ROLLBACK is on and the deploy allows it; see queue_rollbacks) and an incident is raised.
+    Returns the watch id, or None when watching is disabled.
+    """
+    settings = get_settings()
+    if settings.watch_window <= 0 or not PROMETHEUS_URL:
+        return None
+    # Looked up now: once this run has succeeded it would be the newest good run itself.
+    last_good = history.last_successful_run(repo, branch, require_image=True)
+
+    def on_done(status):
+        finding = status["finding"]
+        history.update_run(run_id, watch={key: status[key] for key in ("outcome", "samples", "baseline", "ewma", "finding")})
+        if status["outcome"] != WATCH_BREACHED:
+            logger.info(f"Post-deploy watch of {repo}@{branch} {status['outcome']} ({status['samples']} samples).")
+            if status["outcome"] == WATCH_PASSED:
+                incident_correlator.resolve(repo, branch)
+            return
+        analysis = f"Post-deploy watch breached {finding['after_s']}s after deploy ({finding['severity']}): {'; '.join(finding['reasons'])}"
+        history.update_run(run_id, status=RUN_FAILED, error=analysis, incident=True)
+        image_ref = _rollback_image(deployment, last_good) if get_settings().watch_rollback else None
+        if image_ref:
+            rollback = {
+                "run_id": run_id, "repo": repo, "branch": branch, "image_ref": image_ref,
+                "deployment": {key: deployment.get(key) for key in ("plan", "script_path")},
+            }
+            if _rollback_queue is None:
+                rolled_back_to = orchestrate_watch_rollback(rollback)
+                if rolled_back_to:
+                    analysis += f"\nRolled back to {rolled_back_to}."
+            else:
+                job_queue, on_queued = _rollback_queue
+                job_id, _ = job_queue.enqueue(JOB_ROLLBACK, rollback, repo=repo, branch=branch)
+                history.update_run(run_id, rollback_job_id=job_id)
+                if on_queued:
+                    on_queued()
+                analysis += f"\nRollback to {image_ref} queued as job {job_id}."
+        logger.warning(f"{analysis} Sending notifications...")
+        channels = channels_for(finding["severity"], get_settings().incident_rules)
+        reported = incident_correlator.report(
+            _incident_payload(repo, analysis, pr_summary), channels, repo=repo, branch=branch,
+            stage="post_deploy_watch", signature=metric_signature("; ".join(finding["reasons"])),
+            severity=finding["severity"],
+        )
+        history.update_run(
+            run_id,
+            watch_incident_id=reported["incident_id"],
+            watch_notifications=_notification_summary(reported["notifications"]),
+            watch_notifications_deferred=reported["deferred"],
+        )
+
+    return deploy_watcher.watch(
+        f"{repo}@{branch}",
+        watch_from,
+        on_done,
+        job=scrape_job,
+        instance=scrape_instance,
+        window=settings.watch_window,
+        interval=settings.watch_interval,
+        step=settings.watch_step,
+        rate_window=settings.metric_bundle_window,
+        baseline_window=settings.watch_baseline_window,
+        baseline_end=deploy_started,
+        rules=settings.watch_rules,
+    )
+
+# JSON schemas for the structured LLM decisions
+DEPLOY_GATE_SCHEMA = {
+    "type": "object",
+    "required": ["decision", "reason"],
+    "properties": {"decision": {"type": "string", "enum": ["deploy", "skip"]}, "reason": {"type": "string"}},
+}
+MONITORING_SCHEMA = {
+    "type": "object",
+    "required": ["instrumented"],
+    "properties": {"instrumented": {"type": "boolean"}},
+}
+INCIDENT_VERDICT_SCHEMA = {
+    "type": "object",
+    "required": ["verdict", "reason"],
+    "properties": {"verdict": {"type": "string", "enum": ["healthy", "incident"]}, "reason": {"type": "string"}},
+}
+INCIDENT_CHANNELS_SCHEMA = {
+    "type": "array",
+    "items": {"type": "string", "enum": ["github", "jira", "email"]},
+}
+
+@traced("pr_merge_pipeline")
 def orchestrate_pr_merge_pipeline(pr_event):
     """Main pipeline for handling PR merge events, with LLM-driven checks."""
+    run_id = None
     try:
         logger.info("Starting AI agent pipeline...")
 
-        # Step 1: LLM decides whether to deploy based on a structured checklist
         pr_summary = _summarize_pr_for_llm(pr_event)
-        
+
+        # Extract repo and branch from pr_event (GitHub PR event structure)
+        repo = pr_event.get("base", {}).get("repo", {}).get("full_name")
+        branch = pr_event.get("base", {}).get("ref")
+        if not (repo and branch):
+            logger.error("Repository or branch information missing. Deployment skipped.")
+            return
+
+        # The checkout is cheap (shared mirror + worktree) and lets the deploy gate and the
+        # monitoring-applicability question share a single LLM request.
+        merge_commit_sha = pr_event.get("merge_commit_sha")
+        run_id = history.start_run(
+            "pr_merge", repo, branch, merge_commit_sha,
+            pr_number=pr_event.get("number"), pr_summary=pr_summary, trace_id=current_trace_id()
+        )
+        with _stage(run_id, "checkout"):
+            workspace_dir = prepare_workspace(repo, branch, commit_sha=merge_commit_sha)
+            app_context = fetch_app_context_from_local(workspace_dir)
+
+        # Step 1: LLM decides whether to deploy based on a structured checklist
         deployment_checklist_prompt = """
 You are an expert SDLC gatekeeper. Your task is to decide if a Pull Request is safe to deploy.
 Analyze the provided PR summary and make a decision based on the following checklist. Provide a clear reason for your choice.
@@ -92,71 +423,88 @@ Deployment Checklist:
 3.  **"Work in Progress" Check**: Are there any keywords like 'WIP', 'Draft', 'Do Not Merge' in the title or body? If so, it should be skipped.
 4.  **Sanity Check**: Does the change seem reasonable and complete?
 
-Based on this checklist, should we deploy this PR? Reply with only 'deploy' or 'skip' and a concise reason based on the checklist items.
+Based on this checklist, should we deploy this PR? Set 'decision' to 'deploy' or 'skip' and give a concise 'reason' based on the checklist items.
 """
-        
-        deploy_decision = get_llm_decision(
-            deployment_checklist_prompt,
-            context=pr_summary
-        )
-        logger.info(f"LLM deploy decision: {deploy_decision}")
-
-        if 'deploy' in deploy_decision.lower():
-            # Extract repo and branch from pr_event (GitHub PR event structure)
-            repo = None
-            branch = None
-            repo = pr_event.get("base", {}).get("repo", {}).get("full_name")
-            branch = pr_event.get("base", {}).get("ref")
-
-            if repo and branch:
-                script_path = auto_deploy(repo, branch)
-                deploy_application(script_path)
-                logger.info(f"Deployment triggered by LLM for {repo}@{branch}.")
-                
-                # Step 2: Perform post-deployment health check.
-                port = _get_port_from_script(script_path)
-                health_check_url = f"http://localhost:{port}"
-                if not _perform_health_check(health_check_url):
-                    raise Exception(f"Post-deployment health check failed for {health_check_url}")
-
-                # Step 3: Check if monitoring is applicable before proceeding
-                local_repo_path = os.path.dirname(script_path)
-                app_context = fetch_app_context_from_local(local_repo_path)
-                
-                monitoring_prompt = "Based on the context (e.g., requirements.txt, Dockerfile), does this application seem to be instrumented to expose a /metrics endpoint for Prometheus? Look for dependencies like 'prometheus-flask-exporter'. Reply with only 'yes' or 'no'."
-                
-                monitoring_decision = get_llm_decision(monitoring_prompt, app_context)
-                logger.info(f"LLM monitoring applicability decision: {monitoring_decision}")
-
-                if 'yes' in monitoring_decision.lower():
-                    # --- NEW: Post-deployment Smoke Test ---
-                    logger.info("Running post-deployment smoke test by generating traffic...")
-                    # A more advanced agent could ask the LLM for likely test endpoints.
-                    # We will try a common /error endpoint first, then the root.
-                    test_endpoints = ["/error", "/"] 
-                    test_url_base = f"http://localhost:{port}"
-                    
-                    for endpoint in test_endpoints:
-                        test_url = test_url_base + endpoint
-                        logger.info(f"Generating 20 requests to {test_url} to check for errors.")
-                        for _ in range(20):
-                            try:
-                                # We don't care about the response, just that the request is made.
-                                requests.get(test_url, timeout=2)
-                            except requests.RequestException:
-                                # Ignore exceptions; we want to see them as error metrics in Prometheus.
-                                pass
-                    
-                    scrape_interval = 15 # This value should be >= your Prometheus scrape_interval.
-                    logger.info(f"Waiting {scrape_interval} seconds for Prometheus to scrape new metrics...")
-                    time.sleep(scrape_interval)
-
-                    # Step 4: Monitor after deploy
-                    logger.info("Application appears to be instrumented. Proceeding with monitoring.")
-                    metrics = fetch_metrics(PROMETHEUS_URL)
-
-                    analysis_prompt = """
+        monitoring_prompt = "Based on the app context (e.g., requirements.txt, Dockerfile), does this application seem to be instrumented to expose a /metrics endpoint for Prometheus? Look for dependencies like 'prometheus-flask-exporter'. Set 'instrumented' to true or false."
+
+        with _stage(run_id, "llm_gate"):
+            gate = get_structured_decision(
+                {
+                    "deploy_gate": {"prompt": deployment_checklist_prompt, "schema": DEPLOY_GATE_SCHEMA},
+                    "monitoring": {"prompt": monitoring_prompt, "schema": MONITORING_SCHEMA},
+                },
+                context={"pr_summary": pr_summary, "app_context": app_context},
+                prompt_type=PROMPT_DEPLOY_GATE,
+                # Without an LLM nothing is deployed automatically.
+                fallback={
+                    "deploy_gate": {"decision": "skip", "reason": "LLM unavailable; deployment gate could not be evaluated"},
+                    "monitoring": {"instrumented": False},
+                }
+            )
+        history.update_run(run_id, gate=gate)
+        logger.info(f"LLM deploy decision: {gate['deploy_gate']}")
+        logger.info(f"LLM monitoring applicability decision: {gate['monitoring']}")
+
+        if gate["deploy_gate"]["decision"] == "deploy":
+            deploy_started = time.time()
+            with _stage(run_id, "deploy"):
+                port, deployment = _deploy_workspace(
+                    repo, workspace_dir, commit_sha=merge_commit_sha, pipeline="pr_merge", branch=branch, run_id=run_id
+                )
+            logger.info(f"Deployment triggered by LLM for {repo}@{branch}.")
+
+            # Step 2: Perform post-deployment health check.
+            health_check_url = f"http://localhost:{port}"
+            with _stage(run_id, "health_check"):
+                healthy = _perform_health_check(repo, port, pipeline="pr_merge")
+            if not healthy:
+                rolled_back_to = _rollback_to_last_good(repo, branch, deployment, pipeline="pr_merge")
+                history.update_run(run_id, rolled_back_to=rolled_back_to)
+                raise Exception(f"Post-deployment health check failed for {health_check_url}")
+
+            # Step 3: Monitor only if the app is instrumented
+            if gate["monitoring"]["instrumented"]:
+                # --- Post-deployment Smoke Test ---
+                # Generates concurrent traffic against the configured endpoints and records latency
+                # and status codes locally, so the analysis doesn't depend on Prometheus alone.
+                logger.info("Running post-deployment smoke test by generating traffic...")
+                settings = get_settings()
+                with _stage(run_id, "smoke_test"):
+                    smoke_test = run_smoke_test(
+                        f"http://localhost:{port}",
+                        endpoints=settings.smoke_test_endpoints,
+                        concurrency=settings.smoke_test_concurrency,
+                        requests_per_endpoint=settings.smoke_test_requests,
+                        duration=settings.smoke_test_duration or None,
+                        rate=settings.smoke_test_rate or None,
+                    )
+                smoke_test_ended = time.time()
+
+                # Proceed as soon as Prometheus has scraped the app after the smoke test ended.
+                logger.info("Waiting for Prometheus to scrape new metrics...")
+                scrape_job = settings.prometheus_scrape_job or None
+                scrape_instance = settings.prometheus_target_instance.format(port=port) or None
+                with _stage(run_id, "scrape_wait"):
+                    wait_for_scrape(
+                        PROMETHEUS_URL,
+                        since=smoke_test_ended,
+                        job=scrape_job,
+                        instance=scrape_instance,
+                        timeout=settings.scrape_wait_timeout,
+                    )
+
+                # Step 4: Monitor after deploy
+                logger.info("Application appears to be instrumented. Proceeding with monitoring.")
+                with _stage(run_id, "metrics"):
+                    metrics = fetch_metric_bundle(
+                        PROMETHEUS_URL, job=scrape_job, instance=scrape_instance, window=settings.metric_bundle_window
+                    )
+                history.update_run(run_id, metrics=metrics, smoke_test=smoke_test["total"])
+
+                analysis_prompt = """
 You are a Site Reliability Engineer (SRE). Your task is to analyze Prometheus metrics and determine if an incident should be declared.
+`metrics` holds per-second request and 4xx/5xx error rates and p50/p95/p99 latencies in seconds for the deployed app (null = no data).
+The context also contains `smoke_test`: per-endpoint status-code counts, error rates and p50/p95/p99 latencies (ms) measured directly by the agent right after deployment.
 
 **Analysis Checklist:**
 1.  **HTTP Server Errors (5xx)**: Are there any metrics indicating HTTP 5xx server errors? A non-zero count of 5xx errors is a strong indicator of an incident.
@@ -164,91 +512,117 @@ You are a Site Reliability Engineer (SRE). Your task is to analyze Prometheus me
 3.  **Request Latency**: Is the request latency (e.g., `http_requests_latency_seconds_bucket`) abnormally high?
 
 **Decision:**
-Based on the checklist and the provided context, is the system 'healthy' or is there an 'incident'? Provide a concise reason for your decision based on the metrics.
+Based on the checklist and the provided context, is the system 'healthy' or is there an 'incident'? Set 'verdict' accordingly and give a concise 'reason' based on the metrics.
 """
+                channels_prompt = "If the verdict is 'incident', which incident channels should be notified? List them from: github, jira, email. Use an empty list when the system is healthy."
 
-                    analysis = get_llm_decision(
-                        analysis_prompt,
-                        context={
-                            "metrics": metrics,
-                            "pr_summary": pr_summary
-                        }
-                    )
-                    logger.info(f"LLM post-deploy analysis: {analysis}")
-                    if 'incident' in analysis.lower():
-                        # Step 5: LLM decides which channels to notify
-                        incident_channels = get_llm_decision(
-                            "Which incident channels should be used? Reply with a comma-separated list from: github, jira, email.",
+                # Clear-cut cases are decided locally; only ambiguous ones cost an LLM round-trip.
+                rules_decision = evaluate_incident_rules(metrics, smoke_test, settings.incident_rules)
+                if rules_decision["verdict"] != VERDICT_AMBIGUOUS:
+                    analysis = describe_decision(rules_decision)
+                    is_incident = rules_decision["verdict"] == VERDICT_INCIDENT
+                    channels = rules_decision["channels"]
+                    INCIDENT_DECISIONS.labels(path="rules", verdict=rules_decision["verdict"]).inc()
+                    logger.info(analysis)
+                else:
+                    # Step 5: verdict and notification channels in one LLM request
+                    with _stage(run_id, "llm_analysis"):
+                        decision = get_structured_decision(
+                            {
+                                "incident": {"prompt": analysis_prompt, "schema": INCIDENT_VERDICT_SCHEMA},
+                                "channels": {"prompt": channels_prompt, "schema": INCIDENT_CHANNELS_SCHEMA},
+                            },
                             context={
                                 "metrics": metrics,
-                                "pr_summary": pr_summary,
-                                "analysis": analysis
+                                "smoke_test": smoke_test,
+                                "pr_summary": pr_summary
+                            },
+                            prompt_type=PROMPT_POST_DEPLOY_ANALYSIS,
+                            # Ambiguous signals with no LLM to weigh them are reported for a human to check.
+                            fallback={
+                                "incident": {"verdict": VERDICT_INCIDENT, "reason": f"LLM unavailable; {describe_decision(rules_decision)}"},
+                                "channels": ["github"],
                             }
                         )
-                        logger.info(f"LLM incident channels: {incident_channels}")
-
-                        # Create a detailed incident payload for consistent reporting
-                        incident_title = f"AI-Detected Incident in {repo}"
-                        incident_description = f"**AI SRE Analysis:**\n{analysis}\n\n**Triggering Pull Request:**\n{pr_summary}"
-                        incident_payload = {
-                            "title": incident_title,
-                            "description": incident_description,
-                            "repo": repo, # For GitHub Issues
-                            "recipient": EMAIL_USER, # For Email Notifier
-                            "project_key": JIRA_PROJECT_KEY # For Jira Tickets
-                        }
-
-                        logger.warning("Incident detected. Sending notifications...")
-                        if 'github' in incident_channels.lower():
-                            try:
-                                create_github_issue(GITHUB_TOKEN, incident_payload)
-                            except Exception as e:
-                                logger.error(f"Failed to create GitHub issue: {e}")
-                        if 'jira' in incident_channels.lower():
-                            try:
-                                create_jira_ticket(JIRA_URL, JIRA_USER, JIRA_API_TOKEN, incident_payload)
-                            except Exception as e:
-                                logger.error(f"Failed to create Jira ticket: {e}")
-                        if 'email' in incident_channels.lower():
-                            try:
-                                send_email_notification(EMAIL_SMTP_SERVER, EMAIL_PORT, EMAIL_USER, EMAIL_PASSWORD, incident_payload)
-                            except Exception as e:
-                                logger.error(f"Failed to send email notification: {e}")
-                        logger.info("Incident response process completed.")
-                    else:
-                        logger.info("No incident detected. System healthy as per LLM.")
+                    analysis = f"{decision['incident']['verdict']}: {decision['incident']['reason']}"
+                    is_incident = decision["incident"]["verdict"] == VERDICT_INCIDENT
+                    channels = decision["channels"]
+                    INCIDENT_DECISIONS.labels(path="llm", verdict=decision["incident"]["verdict"]).inc()
+                    logger.info(f"LLM post-deploy analysis: {analysis} (channels: {channels})")
+
+                history.update_run(run_id, analysis=analysis, incident=is_incident)
+                if is_incident:
+                    logger.warning("Incident detected. Sending notifications...")
+                    # Deduplicated by repo, branch, stage and metric signature: a recurring problem updates its ticket.
+                    with _stage(run_id, "incident_notify"):
+                        reported = incident_correlator.report(
+                            _incident_payload(repo, analysis, pr_summary), channels, repo=repo, branch=branch,
+                            stage="post_deploy_analysis", signature=metric_signature(analysis),
+                            severity=rules_decision["severity"],
+                        )
+                    history.update_run(
+                        run_id,
+                        incident_id=reported["incident_id"],
+                        notifications=_notification_summary(reported["notifications"]),
+                        notifications_deferred=reported["deferred"],
+                    )
+                    logger.info("Incident response process completed.")
                 else:
-                    logger.info("Monitoring skipped: LLM determined the application does not expose a /metrics endpoint.")
+                    logger.info("No incident detected. System healthy.")
+                    # A snapshot right after deploy misses regressions that build up later; keep watching.
+                    watch_id = _watch_deployment(
+                        repo, branch, run_id, deployment, scrape_job, scrape_instance,
+                        deploy_started=deploy_started, watch_from=smoke_test_ended, pr_summary=pr_summary,
+                    )
+                    history.update_run(run_id, watch_id=watch_id)
+                    if watch_id is None:
+                        incident_correlator.resolve(repo, branch)
             else:
-                logger.error("Repository or branch information missing. Deployment skipped.")
+                logger.info("Monitoring skipped: LLM determined the application does not expose a /metrics endpoint.")
 
         else:
-            logger.info("Deployment skipped by LLM decision.")
+            logger.info(f"Deployment skipped by LLM decision: {gate['deploy_gate']['reason']}")
+            history.finish_run(run_id, RUN_SKIPPED)
+            return
 
+        history.finish_run(run_id, RUN_SUCCEEDED)
         logger.info("AI agent pipeline execution completed.")
 
     except Exception as e:
         logger.error(f"Pipeline execution failed: {e}")
+        if run_id:
+            history.finish_run(run_id, RUN_FAILED, e)
         raise
 
-def orchestrate_branch_push_pipeline(repo, branch):
+@traced("branch_push_pipeline")
+def orchestrate_branch_push_pipeline(repo, branch, commit_sha=None):
     """Pipeline for handling direct pushes to feature branches."""
+    run_id = history.start_run("branch_push", repo, branch, commit_sha, trace_id=current_trace_id())
     try:
         logger.info(f"Starting direct deployment pipeline for {repo}@{branch}...")
         # For direct pushes, we bypass the LLM approval and go straight to deployment.
         # The full monitoring and incident response could be added here if desired.
-        script_path = auto_deploy(repo, branch)
-        deploy_application(script_path)
+        with _stage(run_id, "checkout"):
+            workspace_dir = prepare_workspace(repo, branch, commit_sha=commit_sha)
+        with _stage(run_id, "deploy"):
+            port, deployment = _deploy_workspace(
+                repo, workspace_dir, commit_sha=commit_sha, pipeline="branch_push", branch=branch, run_id=run_id
+            )
 
         # Perform post-deployment health check
-        port = _get_port_from_script(script_path)
         health_check_url = f"http://localhost:{port}"
-        if not _perform_health_check(health_check_url):
-            # A more advanced implementation could trigger a rollback here.
+        # With DEPLOY_STRATEGY=blue_green a failing new version was already rolled back by _deploy_workspace.
+        with _stage(run_id, "health_check"):
+            healthy = _perform_health_check(repo, port, pipeline="branch_push")
+        if not healthy:
+            rolled_back_to = _rollback_to_last_good(repo, branch, deployment, pipeline="branch_push")
+            history.update_run(run_id, rolled_back_to=rolled_back_to)
             raise Exception(f"Post-deployment health check failed for {health_check_url}")
 
+        history.finish_run(run_id, RUN_SUCCEEDED)
         logger.info(f"Deployment successful for {repo}@{branch}.")
         logger.info("Direct deployment pipeline execution completed.")
     except Exception as e:
         logger.error(f"Direct deployment pipeline for {repo}@{branch} failed: {e}")
+        history.finish_run(run_id, RUN_FAILED, e)
         raise
@@ -1,21 +1,64 @@
 from flask import Flask, request, jsonify
-from src.orchestrator import orchestrate_pr_merge_pipeline, orchestrate_branch_push_pipeline
+from src.orchestrator import orchestrate_pr_merge_pipeline, orchestrate_branch_push_pipeline, history, deploy_watcher
+from src.orchestrator import incident_correlator, orchestrate_watch_rollback, queue_rollbacks
+from src.config.settings import JOB_QUEUE_DB, PIPELINE_WORKERS, BLUE_GREEN_STATE_DIR
+from src.config.settings import WEBHOOK_JOURNAL_DIR, WEBHOOK_JOURNAL_MAX_BYTES, WEBHOOK_JOURNAL_MAX_FILES
+from src.jobs.job_queue import JobQueue
+from src.jobs.intake import JOB_BRANCH_PUSH, JOB_PR_MERGE, JOB_ROLLBACK, submit_event
+from src.jobs.webhook_journal import WebhookJournal, parse_time, read_journal, replay
+from src.jobs.worker_pool import WorkerPool
+from src.deploy.auto_deployer import app_context_builder, script_cache
+from src.deploy.deployer import get_deployment_log, recent_deployments
+from src.deploy.blue_green import restore_proxies
+from src.monitor.agent_metrics import register_queue_depth
+from src.monitor.tracing import get_trace
+from src.llm.mistral_chain import response_cache
 import logging
 import hmac
+import math
 import os
+import threading
 from prometheus_flask_exporter import PrometheusMetrics
 
 app = Flask(__name__)
 GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "")
 
-# GitHub Event Constants
-EVENT_PULL_REQUEST = "pull_request"
-EVENT_PUSH = "push"
-ACTION_CLOSED = "closed"
-
 # Instrument the app with Prometheus metrics. This creates a /metrics endpoint.
 metrics = PrometheusMetrics(app)
 
+# Pipelines run for minutes, far beyond GitHub's 10 s delivery timeout, so the
+# webhook only enqueues work and a pool of background workers executes it.
+job_queue = JobQueue(JOB_QUEUE_DB)
+register_queue_depth(job_queue.depth)
+worker_pool = WorkerPool(
+    job_queue,
+    handlers={
+        JOB_PR_MERGE: lambda payload: orchestrate_pr_merge_pipeline(payload),
+        JOB_BRANCH_PUSH: lambda payload: orchestrate_branch_push_pipeline(
+            payload["repo"], payload["branch"], commit_sha=payload.get("commit_sha")
+        ),
+        JOB_ROLLBACK: orchestrate_watch_rollback,
+    },
+    workers=PIPELINE_WORKERS,
+)
+# Rollbacks after a post-deploy watch breach wait behind the repo's running deploy like any other job.
+queue_rollbacks(job_queue, on_queued=worker_pool.notify)
+
+# Verified deliveries are journaled before routing, so they can be replayed (POST /replay) after an outage.
+journal = WebhookJournal(WEBHOOK_JOURNAL_DIR, WEBHOOK_JOURNAL_MAX_BYTES, WEBHOOK_JOURNAL_MAX_FILES) if WEBHOOK_JOURNAL_DIR else None
+
+_proxies_restored = False
+
+def _start_workers():
+    """Starts the worker pool and incident digests (no-op once running), restoring blue/green proxies the first time."""
+    global _proxies_restored
+    if not _proxies_restored:
+        # Blue/green apps are served through in-process proxies; bring them back before taking new work.
+        restore_proxies(BLUE_GREEN_STATE_DIR)
+        _proxies_restored = True
+    worker_pool.start()
+    incident_correlator.start()
+
 # Optional: verify GitHub webhook signature
 def verify_signature(payload, signature):
     if not GITHUB_WEBHOOK_SECRET:
@@ -30,48 +73,158 @@ def github_webhook():
     if not verify_signature(request.data, signature):
         return jsonify({"error": "Invalid signature"}), 403
     event = request.headers.get('X-GitHub-Event', '')
+    delivery_id = request.headers.get('X-GitHub-Delivery') or None
 
     data = request.json
 
-    if event == EVENT_PULL_REQUEST:
-        action = data.get("action")
-        pr_data = data.get("pull_request", {})
+    if journal is not None:
+        try:
+            journal.append(event, data, delivery_id=delivery_id)
+        except OSError as e:
+            logging.error(f"Could not journal webhook delivery {delivery_id}: {e}")
 
-        # Trigger orchestrator only when a PR is closed and merged into the main branch
-        if action == ACTION_CLOSED and pr_data.get("merged") and pr_data.get("base", {}).get("ref") == "main":
-            logging.info("PR merged to main, triggering orchestrator.")
-            try:
-                orchestrate_pr_merge_pipeline(pr_data)
-                return jsonify({"status": "orchestrator triggered for merge to main"})
-            except Exception as e:
-                logging.error(f"Orchestrator pipeline failed: {e}")
-                return jsonify({"error": "Orchestrator pipeline failed", "details": str(e)}), 500
+    try:
+        outcome = submit_event(job_queue, event, data, delivery_id=delivery_id)
+    except Exception as e:
+        logging.exception("Failed to queue webhook event:")
+        return jsonify({"error": str(e)}), 500
+    if outcome["status"] == "ignored":
+        return jsonify({**outcome, "event": event})
 
-        logging.info(f"Ignoring pull_request event (action: {action}, merged: {pr_data.get('merged')}, base_ref: {pr_data.get('base', {}).get('ref')})")
-        return jsonify({"status": "ignored", "reason": "not a merge to main"})
+    logging.info(f"{event} event queued as job {outcome['job_id']} ({outcome['status']}).")
+    _start_workers()
+    worker_pool.notify()
+    return jsonify(outcome), 202
 
-    if event == EVENT_PUSH:
-        try:
-            repo = data["repository"]["full_name"]
-            # ref is like 'refs/heads/main', get the branch name
-            ref = data.get("ref", "refs/heads/main")
-            branch = ref.split("/")[-1]
-
-            # Ignore pushes to main to avoid double-triggering on PR merge
-            if branch == 'main':
-                logging.info("Ignoring push event to 'main' branch to prevent duplicate action on PR merge.")
-                return jsonify({"status": "ignored", "reason": "push to main is handled by PR merge event"})
-
-            # For pushes to other branches, trigger the direct deployment pipeline
-            logging.info(f"Push to '{branch}' branch detected, triggering direct deployment orchestrator.")
-            orchestrate_branch_push_pipeline(repo, branch)
-            return jsonify({"status": "orchestrator triggered for push", "branch": branch})
-        except Exception as e:
-            logging.exception(f"Failed to orchestrate push event for branch '{branch}':")
-            return jsonify({"error": str(e)}), 500
-
-    return jsonify({"status": "ignored", "event": event})
+@app.route("/replay", methods=["POST"])
+def replay_journal():
+    """
+    Re-submits journaled deliveries through the normal intake path. JSON body (all optional): since/until
+    (epoch or ISO 8601), coalesce (default true: newest delivery per repo@branch only), redeliver (default
+    false: deliveries already queued once are skipped) and rate (deliveries/s; replays in the background).
+    Signed like a webhook when GITHUB_WEBHOOK_SECRET is set.
+    """
+    if not verify_signature(request.data, request.headers.get('X-Hub-Signature-256', '')):
+        return jsonify({"error": "Invalid signature"}), 403
+    if journal is None:
+        return jsonify({"error": "Webhook journal is disabled (WEBHOOK_JOURNAL_DIR is empty)"}), 404
+    options = request.get_json(silent=True) or {}
+    try:
+        rate = float(options.get("rate") or 0)
+        if not math.isfinite(rate) or rate < 0:
+            raise ValueError(rate)
+    except (TypeError, ValueError):
+        return jsonify({"error": f"Invalid rate: {options.get('rate')!r} (deliveries/s, must be a number >= 0)"}), 400
+    try:
+        records = list(read_journal(journal.directory, parse_time(options.get("since")), parse_time(options.get("until"))))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid time range: {e}"}), 400
+    _start_workers()
+    kwargs = {
+        "coalesce": bool(options.get("coalesce", True)),
+        "rate": rate,
+        "redeliver": bool(options.get("redeliver", False)),
+        "on_queued": worker_pool.notify,
+    }
+    if kwargs["rate"]:
+        threading.Thread(target=replay, args=(records, job_queue), kwargs=kwargs, name="webhook-replay", daemon=True).start()
+        return jsonify({"status": "replaying", "deliveries": len(records)}), 202
+    return jsonify(replay(records, job_queue, **kwargs))
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found", "job_id": job_id}), 404
+    job.pop("payload", None)
+    return jsonify(job)
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify({
+        "deploy_scripts": script_cache.stats(),
+        "llm_responses": response_cache.stats(),
+        "app_context": app_context_builder.stats(),
+    })
+
+@app.route("/deployments/live", methods=["GET"])
+def live_deployments():
+    return jsonify(recent_deployments())
+
+@app.route("/deployments/<deployment_id>/log", methods=["GET"])
+def deployment_log(deployment_id):
+    """Status, phase timings and the last `tail` output lines (default 100) of a running or recent deployment."""
+    log = get_deployment_log(deployment_id)
+    if log is None:
+        return jsonify({"error": "Deployment not found", "deployment_id": deployment_id}), 404
+    return jsonify(log.snapshot(tail=request.args.get("tail", default=100, type=int)))
+
+@app.route("/deployments/watches", methods=["GET"])
+def deployment_watches():
+    """Deploys under post-deploy watch, with their baseline, moving averages and thresholds."""
+    return jsonify(deploy_watcher.active())
+
+@app.route("/incidents", methods=["GET"])
+def incidents():
+    """Correlated incidents, newest activity first; filter with ?status=open|resolved and ?repo=."""
+    return jsonify(incident_correlator.store.list(
+        status=request.args.get("status"),
+        repo=request.args.get("repo"),
+        limit=min(request.args.get("limit", default=50, type=int), 200),
+    ))
+
+@app.route("/traces/<trace_id>", methods=["GET"])
+def trace(trace_id):
+    """Span tree of a recent pipeline run; the trace_id is stored with the run in /history/runs."""
+    tree = get_trace(trace_id)
+    if tree is None:
+        return jsonify({"error": "Trace not found", "trace_id": trace_id}), 404
+    return jsonify(tree)
+
+def _history_window():
+    """The ?days= query parameter (default 7) as seconds. Raises ValueError unless it is a positive number."""
+    days = float(request.args.get("days", 7))
+    if not math.isfinite(days) or days <= 0:
+        raise ValueError(f"days must be a positive number, got {request.args['days']!r}")
+    return days * 86400
+
+def _history_aggregate(aggregate):
+    """Responds with aggregate(window seconds), or 400 for an invalid ?days=."""
+    try:
+        window = _history_window()
+    except ValueError as e:
+        return jsonify({"error": f"Invalid days: {e}"}), 400
+    return jsonify(aggregate(window))
+
+@app.route("/history/runs", methods=["GET"])
+def history_runs():
+    runs = history.recent_runs(
+        repo=request.args.get("repo"),
+        branch=request.args.get("branch"),
+        limit=min(request.args.get("limit", default=20, type=int), 200),
+    )
+    return jsonify(runs)
+
+@app.route("/history/runs/<run_id>", methods=["GET"])
+def history_run(run_id):
+    run = history.get_run(run_id)
+    if run is None:
+        return jsonify({"error": "Run not found", "run_id": run_id}), 404
+    return jsonify(run)
+
+@app.route("/history/deploy-frequency", methods=["GET"])
+def history_deploy_frequency():
+    return _history_aggregate(history.deploy_frequency)
+
+@app.route("/history/stage-durations", methods=["GET"])
+def history_stage_durations():
+    return _history_aggregate(history.stage_durations)
+
+@app.route("/history/failure-rates", methods=["GET"])
+def history_failure_rates():
+    return _history_aggregate(history.failure_rates)
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    _start_workers()
     app.run(host="0.0.0.0", port=5001)
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from src.config.settings import PipelineSettings, get_settings, load_settings
+
+
+def test_settings_come_from_env_then_config_then_defaults():
+    config = {"smoke_test_requests": 50, "readiness_path": "/ready", "incident_rules": {"enabled": False}}
+    environ = {"SMOKE_TEST_REQUESTS": "7", "SMOKE_TEST_ENDPOINTS": "/a, /b,", "INCIDENT_RULES": "ignored"}
+    settings = load_settings(config, environ)
+    assert settings.smoke_test_requests == 7
+    assert settings.smoke_test_endpoints == ("/a", "/b")
+    assert settings.readiness_path == "/ready"
+    assert settings.incident_rules == {"enabled": False}
+    assert settings.readiness_timeout == PipelineSettings.readiness_timeout
+
+
+def test_settings_reject_values_of_the_wrong_type():
+    with pytest.raises(ValueError, match="smoke_test_concurrency"):
+        load_settings({"smoke_test_concurrency": "many"}, {})
+    with pytest.raises(ValueError, match="watch_rollback"):
+        load_settings({}, {"WATCH_ROLLBACK": "maybe"})
+    assert load_settings({"watch_rollback": True}, {"WATCH_ROLLBACK": "off"}).watch_rollback is False
+
+
+def test_settings_reload_when_config_file_changes(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text("smoke_test_requests: 5\n")
+    first = get_settings(str(path))
+    assert first.smoke_test_requests == 5
+    assert get_settings(str(path)) is first
+
+    path.write_text("smoke_test_requests: 9\n")
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 1_000_000))
+    assert get_settings(str(path)).smoke_test_requests == 9
+
+    # A broken edit keeps the last good settings in force.
+    path.write_text("smoke_test_requests: [unclosed\n")
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 2_000_000))
+    assert get_settings(str(path)).smoke_test_requests == 9
@@ -0,0 +1,424 @@
+import logging
+import os
+import socket
+import subprocess
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.deploy.app_context import AppContextBuilder
+from src.deploy.blue_green import DeploymentRolledBack, SwapProxy, blue_green_deploy, load_state
+from src.deploy.deployer import deploy_application, get_deployment_log, phase_for_marker
+from src.deploy.git_checkout import CheckoutError, sync_worktree
+from src.deploy.planner import PlanError, execute_plan, parse_dockerfile, plan_deployment, render_script
+from src.deploy.script_cache import ScriptCache
+
+
+def test_script_cache_hit_miss_and_persistence(tmp_path):
+    cache = ScriptCache(str(tmp_path))
+    key = ScriptCache.make_key("# Dockerfile\nFROM python", "owner_repo", "1")
+    assert cache.get(key) is None
+
+    cache.put(key, "#!/bin/bash\necho deploy")
+    assert cache.get(key) == "#!/bin/bash\necho deploy"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+    # A fresh instance (e.g. after a restart) sees the same entries.
+    assert ScriptCache(str(tmp_path)).get(key) == "#!/bin/bash\necho deploy"
+
+
+def test_script_cache_creates_its_directory_on_first_use(tmp_path):
+    cache = ScriptCache(str(tmp_path / "scripts"))
+    assert not (tmp_path / "scripts").exists()
+    assert cache.stats()["entries"] == 0
+    assert (tmp_path / "scripts").is_dir()
+
+
+def test_script_cache_key_depends_on_context_container_and_prompt_version():
+    base = ScriptCache.make_key("ctx", "app", "1")
+    assert base != ScriptCache.make_key("ctx2", "app", "1")
+    assert base != ScriptCache.make_key("ctx", "app2", "1")
+    assert base != ScriptCache.make_key("ctx", "app", "2")
+
+
+def test_script_cache_evicts_least_recently_used(tmp_path):
+    cache = ScriptCache(str(tmp_path), max_entries=2)
+    cache.put("a", "script a")
+    cache.put("b", "script b")
+    time.sleep(0.01)
+    cache.get("a")
+    cache.put("c", "script c")
+    assert cache.get("b") is None
+    assert cache.get("a") == "script a"
+    assert cache.get("c") == "script c"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_script_cache_expires_entries(tmp_path):
+    cache = ScriptCache(str(tmp_path), ttl_seconds=0)
+    cache.put("a", "script a")
+    time.sleep(0.01)
+    assert cache.get("a") is None
+
+
+def _git(*args, cwd=None):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def _commit_file(work_dir, name, content, message):
+    with open(os.path.join(work_dir, name), "w", encoding="utf-8") as f:
+        f.write(content)
+    _git("-C", work_dir, "add", name)
+    _git("-C", work_dir, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-m", message)
+    return _git("-C", work_dir, "rev-parse", "HEAD")
+
+
+@pytest.fixture
+def remote_repo(tmp_path):
+    """A local bare 'GitHub' remote plus a working clone used to push commits to it."""
+    remote = tmp_path / "remote.git"
+    work = tmp_path / "work"
+    _git("init", "--bare", "-q", "-b", "main", str(remote))
+    _git("clone", "-q", str(remote), str(work))
+    _git("-C", str(work), "checkout", "-q", "-b", "main")
+    return f"file://{remote}", str(work)
+
+
+def test_sync_worktree_checks_out_exact_commit_and_updates_incrementally(tmp_path, remote_repo):
+    url, work = remote_repo
+    first = _commit_file(work, "Dockerfile", "FROM python:3.11\n", "first")
+    _git("-C", work, "push", "-q", "origin", "main")
+    mirror, worktree = str(tmp_path / "mirror.git"), str(tmp_path / "wt" / "main")
+
+    assert sync_worktree(url, mirror, worktree, "main", commit_sha=first) == first
+    assert open(os.path.join(worktree, "Dockerfile")).read() == "FROM python:3.11\n"
+
+    second = _commit_file(work, "Dockerfile", "FROM python:3.12\n", "second")
+    _git("-C", work, "push", "-q", "origin", "main")
+    assert sync_worktree(url, mirror, worktree, "main", commit_sha=second) == second
+    assert open(os.path.join(worktree, "Dockerfile")).read() == "FROM python:3.12\n"
+
+    # Without a SHA the branch tip is deployed.
+    assert sync_worktree(url, mirror, worktree, "main") == second
+
+
+def test_sync_worktree_shares_one_mirror_between_branches(tmp_path, remote_repo):
+    url, work = remote_repo
+    main_sha = _commit_file(work, "app.py", "main\n", "main")
+    _git("-C", work, "checkout", "-q", "-b", "dev")
+    dev_sha = _commit_file(work, "app.py", "dev\n", "dev")
+    _git("-C", work, "push", "-q", "origin", "main", "dev")
+    mirror = str(tmp_path / "mirror.git")
+
+    sync_worktree(url, mirror, str(tmp_path / "wt" / "main"), "main", commit_sha=main_sha)
+    sync_worktree(url, mirror, str(tmp_path / "wt" / "dev"), "dev", commit_sha=dev_sha)
+
+    assert open(tmp_path / "wt" / "main" / "app.py").read() == "main\n"
+    assert open(tmp_path / "wt" / "dev" / "app.py").read() == "dev\n"
+    assert len(_git("-C", mirror, "worktree", "list").splitlines()) == 3
+
+
+def test_sync_worktree_repairs_broken_worktree_without_refetching(tmp_path, remote_repo):
+    url, work = remote_repo
+    sha = _commit_file(work, "app.py", "v1\n", "v1")
+    _git("-C", work, "push", "-q", "origin", "main")
+    mirror, worktree = str(tmp_path / "mirror.git"), str(tmp_path / "wt" / "main")
+    sync_worktree(url, mirror, worktree, "main", commit_sha=sha)
+
+    # Corrupt the worktree link and make the remote unreachable: recovery must come from the mirror.
+    with open(os.path.join(worktree, ".git"), "w") as f:
+        f.write("gitdir: /nonexistent\n")
+    assert sync_worktree("file:///nonexistent.git", mirror, worktree, "main", commit_sha=sha) == sha
+    assert open(os.path.join(worktree, "app.py")).read() == "v1\n"
+
+
+def test_sync_worktree_redacts_remote_url_from_fetch_warnings(tmp_path, caplog):
+    # git echoes an unreachable local remote verbatim, like a tokenised URL in some of its messages.
+    url = str(tmp_path / "x-access-token-s3cret" / "remote.git")
+    with caplog.at_level(logging.WARNING), pytest.raises(CheckoutError) as error:
+        sync_worktree(url, str(tmp_path / "mirror.git"), str(tmp_path / "wt"), "main", commit_sha="0" * 40)
+    assert "directly failed" in caplog.text and "<remote>" in caplog.text
+    assert "s3cret" not in caplog.text and "s3cret" not in str(error.value)
+
+
+def test_sync_worktree_reports_unknown_commit(tmp_path, remote_repo):
+    url, work = remote_repo
+    _commit_file(work, "app.py", "v1\n", "v1")
+    _git("-C", work, "push", "-q", "origin", "main")
+    with pytest.raises(CheckoutError):
+        sync_worktree(url, str(tmp_path / "mirror.git"), str(tmp_path / "wt"), "main", commit_sha="0" * 40)
+
+
+def _write_script(tmp_path, body):
+    path = tmp_path / "generated_deploy.sh"
+    path.write_text("#!/bin/bash\nset -e\n" + body)
+    return str(path)
+
+
+def test_phase_markers_map_to_phases():
+    assert phase_for_marker("--- Cleaning up old container ---") == "cleanup"
+    assert phase_for_marker("--- Building image ---") == "build"
+    assert phase_for_marker("--- Running container ---") == "run"
+    assert phase_for_marker("--- Pushing to registry ---") == "pushing_to_registry"
+    assert phase_for_marker("Step 1/5 : FROM python") is None
+
+
+def test_deploy_streams_output_and_times_phases(tmp_path):
+    script = _write_script(tmp_path, (
+        'echo "--- Cleaning up old container ---"\n'
+        'echo "--- Building image ---"\nfor i in $(seq 1 20); do echo "build line $i"; done\nsleep 0.3\n'
+        'echo "--- Running container ---"\necho started >&2\n'
+    ))
+    result = deploy_application(script, timeout=10, log_dir=str(tmp_path / "logs"), tail_lines=5)
+    assert result["status"] == "succeeded"
+    assert set(result["phases"]) == {"cleanup", "build", "run"}
+    assert result["phases"]["build"] >= 0.3
+    # The ring buffer keeps only the last lines; the log file keeps everything, stderr included.
+    assert get_deployment_log(result["deployment_id"]).tail() == [
+        "build line 18", "build line 19", "build line 20", "--- Running container ---", "started"
+    ]
+    log_text = open(result["log_path"], encoding="utf-8").read()
+    assert "build line 1\n" in log_text and "started" in log_text
+
+
+def test_deploy_failure_raises_with_output_tail(tmp_path):
+    script = _write_script(tmp_path, 'echo "--- Building image ---"\necho "no such image"\nexit 3\n')
+    with pytest.raises(subprocess.CalledProcessError) as excinfo:
+        deploy_application(script, timeout=10, deployment_id="failing-deploy")
+    assert excinfo.value.returncode == 3
+    assert "no such image" in excinfo.value.output
+    assert get_deployment_log("failing-deploy").status == "failed"
+
+
+@pytest.mark.skipif(os.name == "nt", reason="process groups are POSIX-only here")
+def test_deploy_timeout_kills_process_group(tmp_path):
+    pid_file = tmp_path / "child.pid"
+    script = _write_script(tmp_path, f'sleep 30 &\necho $! > "{pid_file}"\nwait\n')
+    started = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        deploy_application(script, timeout=0.5, deployment_id="hung-deploy")
+    assert time.monotonic() - started < 5
+    assert get_deployment_log("hung-deploy").status == "timeout"
+    assert _wait_until_dead(int(pid_file.read_text()))
+
+
+@pytest.mark.skipif(os.name == "nt", reason="process groups are POSIX-only here")
+def test_deploy_returns_when_background_child_keeps_output_open(tmp_path):
+    pid_file = tmp_path / "child.pid"
+    script = _write_script(tmp_path, f'echo "--- Running container ---"\nsleep 60 &\necho $! > "{pid_file}"\necho done\n')
+    started = time.monotonic()
+    result = deploy_application(script, timeout=30, deployment_id="orphan-deploy")
+    assert time.monotonic() - started < 10
+    assert result["status"] == "succeeded"
+    assert get_deployment_log("orphan-deploy").tail()[-1] == "done"
+    assert _wait_until_dead(int(pid_file.read_text()))
+
+
+def _wait_until_dead(pid, timeout=3):
+    """True once pid is gone or a zombie (killed, waiting to be reaped by its new parent)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                if f.read().rsplit(")", 1)[1].split()[0] == "Z":
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.05)
+    return False
+
+
+DOCKERFILE = """ARG PY=3.11
+FROM python:${PY}-slim AS build
+EXPOSE 9999
+FROM python:${PY}-slim
+# runtime stage
+ENV APP_ENV=prod \\
+    PORT=8000
+EXPOSE 8000/tcp
+CMD ["gunicorn", "app:app"]
+"""
+
+
+def test_parse_dockerfile_uses_final_stage(tmp_path):
+    (tmp_path / "Dockerfile").write_text(DOCKERFILE)
+    info = parse_dockerfile(str(tmp_path / "Dockerfile"))
+    assert info["base_image"] == "python:3.11-slim"
+    assert info["exposed_ports"] == [8000]
+    assert info["env_port"] == 8000
+    assert info["cmd"] == '["gunicorn", "app:app"]'
+
+
+def test_plan_builds_before_stopping_old_container(tmp_path):
+    (tmp_path / "Dockerfile").write_text(DOCKERFILE)
+    (tmp_path / "docker-compose.yml").write_text("services:\n  web:\n    build: .\n    ports:\n      - '8080:8000'\n")
+    plan = plan_deployment(str(tmp_path), "owner_app", commit_sha="0123456789abcdef")
+    assert (plan["host_port"], plan["container_port"]) == (8080, 8000)
+    assert plan["image_ref"] == "owner_app:0123456789ab"
+
+    commands = execute_plan(plan, str(tmp_path), dry_run=True)["commands"]
+    assert [c[1] for c in commands] == ["build", "stop", "rm", "run"]
+    assert commands[0][commands[0].index("--cache-from") + 1] == "owner_app:latest"
+    assert commands[3][-3:] == ["-p", "8080:8000", "owner_app:0123456789ab"]
+    assert not (tmp_path / "planned_deploy.sh").exists()
+
+
+def test_planned_script_has_phase_markers_and_tolerates_missing_container(tmp_path):
+    (tmp_path / "Dockerfile").write_text("FROM node:20\n")
+    (tmp_path / "package.json").write_text('{"scripts": {"start": "next start --port 3000"}}')
+    plan = plan_deployment(str(tmp_path), "web", commit_sha="abc")
+    assert plan["host_port"] == 3000
+    script = render_script(plan)
+    assert script.index("--- Building image ---") < script.index("--- Cleaning up old container ---")
+    assert "docker stop web || true" in script
+
+
+def test_plan_requires_dockerfile(tmp_path):
+    with pytest.raises(PlanError):
+        plan_deployment(str(tmp_path), "app")
+
+
+def test_app_context_extracts_deploy_facts_within_budget(tmp_path):
+    (tmp_path / "Dockerfile").write_text(
+        "FROM python:3.11-slim\nRUN pip install -r requirements.txt \\\n    && rm -rf /root/.cache\n"
+        "COPY . /app\nEXPOSE 8080\nCMD [\"python\", \"app.py\"]\n"
+    )
+    (tmp_path / "requirements.txt").write_text("# web\nFlask==3.0.0\nprometheus-flask-exporter>=0.23\n-e .\n")
+    (tmp_path / "package.json").write_text(
+        '{"name": "ui", "scripts": {"start": "node server.js", "test": "jest"}, "dependencies": {"express": "^4"}}'
+    )
+    (tmp_path / "README.md").write_text("# App\n" + "lorem ipsum dolor\n" * 5000)
+    builder = AppContextBuilder(max_file_bytes=512, max_tokens=400)
+
+    context = builder.build(str(tmp_path))
+    assert "- exposed ports: 8080" in context
+    assert "- metrics exporter: yes (prometheus-flask-exporter)" in context
+    assert "dependencies: flask, prometheus-flask-exporter" in context
+    assert "EXPOSE 8080" in context and "RUN" not in context
+    assert '"start": "node server.js"' in context and "jest" not in context
+    assert "[... truncated]" in context
+    assert len(context) <= 400 * 4 + 100
+
+    assert builder.build(str(tmp_path)) == context
+    assert builder.stats()["hits"] == 1
+    (tmp_path / "requirements.txt").write_text("flask\n")
+    assert "metrics exporter: none found" in builder.build(str(tmp_path))
+
+
+FAKE_DOCKER = """#!/bin/bash
+echo "$*" >> "$FAKE_DOCKER_LOG"
+if [ "$1" = "inspect" ]; then
+  case "$3" in *Image*) echo sha256:0ld ;; *) echo true ;; esac
+fi
+"""
+
+
+@pytest.fixture
+def fake_docker(tmp_path, monkeypatch):
+    """Puts a `docker` on PATH that only records its arguments, one invocation per line."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "docker").write_text(FAKE_DOCKER)
+    (bin_dir / "docker").chmod(0o755)
+    log = tmp_path / "docker.log"
+    log.write_text("")
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_DOCKER_LOG", str(log))
+    return lambda: log.read_text().splitlines()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _blue_green_plan(tmp_path, sha):
+    workspace = tmp_path / "ws"
+    workspace.mkdir(exist_ok=True)
+    (workspace / "Dockerfile").write_text("FROM python:3.11\nEXPOSE 5000\n")
+    return plan_deployment(str(workspace), "app", commit_sha=sha, host_port=_free_port()), str(workspace)
+
+
+def test_blue_green_alternates_slots_and_retires_old_one(tmp_path, fake_docker):
+    state_dir = str(tmp_path / "state")
+    plan, workspace = _blue_green_plan(tmp_path, "1111111")
+    first = blue_green_deploy(plan, workspace, lambda port, container: True, state_dir, port_offset=100)
+    assert first["slot"] == "blue" and first["slot_port"] == plan["host_port"] + 100
+    assert "rm -f app" in fake_docker()
+
+    plan["image_ref"] = "app:2222222"
+    second = blue_green_deploy(plan, workspace, lambda port, container: True, state_dir, port_offset=100)
+    assert second["slot"] == "green" and second["slot_port"] == plan["host_port"] + 101
+    assert second["swap_latency_s"] < 1
+    assert fake_docker()[-1] == "rm -f app-blue"
+    assert load_state(state_dir, "app")["previous_image_ref"] == "app:1111111"
+
+
+def test_blue_green_rolls_back_when_new_slot_is_unhealthy(tmp_path, fake_docker):
+    state_dir = str(tmp_path / "state")
+    plan, workspace = _blue_green_plan(tmp_path, "1111111")
+    blue_green_deploy(plan, workspace, lambda port, container: True, state_dir, port_offset=100)
+
+    plan["image_ref"] = "app:bad"
+    with pytest.raises(DeploymentRolledBack):
+        blue_green_deploy(plan, workspace, lambda port, container: container != "app-green", state_dir, port_offset=100)
+    calls = fake_docker()
+    assert "rm -f app-green" in calls
+    assert "tag app:1111111 app:latest" in calls
+    assert load_state(state_dir, "app")["active_slot"] == "blue"
+
+
+def test_blue_green_restores_plain_container_when_first_swap_fails(tmp_path, fake_docker):
+    state_dir = str(tmp_path / "state")
+    plan, workspace = _blue_green_plan(tmp_path, "1111111")
+    public_port = plan["host_port"]
+    with pytest.raises(DeploymentRolledBack):
+        blue_green_deploy(plan, workspace, lambda port, container: port != public_port, state_dir, port_offset=100)
+    calls = fake_docker()
+    assert "stop app" in calls and "rm -f app" not in calls
+    assert calls[-3:] == ["rm -f app-blue", "tag sha256:0ld app:latest", "start app"]
+    assert load_state(state_dir, "app") == {}
+    # The proxy released the public port for the restarted container.
+    with socket.socket() as sock:
+        sock.bind(("0.0.0.0", public_port))
+
+
+class _NamedApp(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = self.server.name.encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_swap_proxy_switches_upstream_for_new_connections():
+    servers = []
+    for name in ("blue", "green"):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _NamedApp)
+        server.name = name
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    proxy = SwapProxy(0, servers[0].server_port, host="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{proxy.port}/"
+        assert urllib.request.urlopen(url, timeout=5).read() == b"blue"
+        proxy.switch(servers[1].server_port)
+        assert urllib.request.urlopen(url, timeout=5).read() == b"green"
+    finally:
+        proxy.close()
+        for server in servers:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,98 @@
+import time
+
+import pytest
+
+from src.history.history_store import DeploymentHistory, RUN_FAILED, RUN_SKIPPED, RUN_SUCCEEDED
+
+
+@pytest.fixture
+def history(tmp_path):
+    return DeploymentHistory(str(tmp_path / "history.sqlite3"))
+
+
+def test_run_records_fields_data_and_stages(history):
+    run_id = history.start_run("pr_merge", "owner/app", "main", "abc123", pr_number=7)
+    with history.stage(run_id, "checkout"):
+        time.sleep(0.01)
+    with pytest.raises(RuntimeError):
+        with history.stage(run_id, "deploy"):
+            raise RuntimeError("build failed")
+    history.update_run(run_id, image_ref="owner_app:abc123", gate={"decision": "deploy"})
+    history.update_run(run_id, port=5000)
+    history.finish_run(run_id, RUN_FAILED, "build failed")
+
+    run = history.get_run(run_id)
+    assert run["status"] == RUN_FAILED and run["error"] == "build failed"
+    assert run["image_ref"] == "owner_app:abc123"
+    assert run["data"] == {"pr_number": 7, "gate": {"decision": "deploy"}, "port": 5000}
+    assert [(s["stage"], s["status"]) for s in run["stages"]] == [("checkout", "ok"), ("deploy", "failed")]
+    assert run["stages"][0]["duration_s"] >= 0.01
+    assert run["duration_s"] >= 0
+
+
+def test_last_successful_run_with_image(history):
+    first = history.start_run("branch_push", "owner/app", "main")
+    history.update_run(first, image_ref="owner_app:1111")
+    history.finish_run(first, RUN_SUCCEEDED)
+    second = history.start_run("branch_push", "owner/app", "main")
+    history.finish_run(second, RUN_SUCCEEDED)
+    failed = history.start_run("branch_push", "owner/app", "main")
+    history.update_run(failed, image_ref="owner_app:2222")
+    history.finish_run(failed, RUN_FAILED)
+
+    assert history.last_successful_run("owner/app", "main")["id"] == second
+    assert history.last_successful_run("owner/app", "main", require_image=True)["image_ref"] == "owner_app:1111"
+    assert history.last_successful_run("owner/app", "dev") is None
+
+
+def test_database_is_created_on_first_use(tmp_path):
+    path = tmp_path / "nested" / "history.sqlite3"
+    history = DeploymentHistory(str(path))
+    assert not path.parent.exists()
+    assert history.recent_runs() == []
+    assert path.exists()
+
+
+def test_newer_run_of_the_same_branch(history):
+    watched = history.start_run("pr_merge", "owner/app", "main")
+    history.start_run("branch_push", "owner/app", "dev")
+    history.start_run("pr_merge", "owner/other", "main")
+    assert history.newer_run(watched) is None
+    time.sleep(0.01)
+    newer = history.start_run("pr_merge", "owner/app", "main")
+    assert history.newer_run(watched)["id"] == newer
+    assert history.newer_run(newer) is None
+    assert history.newer_run("unknown") is None
+
+
+def test_aggregates_frequency_stage_percentiles_and_failure_rates(history):
+    for i, status in enumerate([RUN_SUCCEEDED, RUN_SUCCEEDED, RUN_FAILED, RUN_SKIPPED]):
+        run_id = history.start_run("pr_merge", "owner/app", "main")
+        history.record_stage(run_id, "deploy", duration_s=float(i + 1))
+        history.finish_run(run_id, status)
+    other = history.start_run("pr_merge", "owner/other", "main")
+    history.finish_run(other, RUN_SUCCEEDED)
+
+    frequency = {row["repo"]: row for row in history.deploy_frequency(since_s=86400)}
+    assert frequency["owner/app"]["deploys"] == 2 and frequency["owner/app"]["per_day"] == 2
+    assert history.stage_durations()["deploy"] == {"count": 4, "p50": 2.0, "p95": 4.0}
+    rates = {row["repo"]: row for row in history.failure_rates()}
+    assert rates["owner/app"] == {"repo": "owner/app", "runs": 3, "failed": 1, "failure_rate": 0.333}
+    assert rates["owner/other"]["failure_rate"] == 0
+    assert [run["repo"] for run in history.recent_runs(limit=2)] == ["owner/other", "owner/app"]
+
+
+@pytest.fixture
+def webhook_client(tmp_path, monkeypatch):
+    # The server opens its job queue at import, relative to the working directory.
+    monkeypatch.chdir(tmp_path)
+    from src import webhook_server
+    return webhook_server.app.test_client()
+
+
+@pytest.mark.parametrize("days", ["0", "-1", "abc", "inf"])
+def test_history_endpoints_reject_invalid_days(webhook_client, days):
+    for path in ("deploy-frequency", "stage-durations", "failure-rates"):
+        response = webhook_client.get(f"/history/{path}?days={days}")
+        assert response.status_code == 400
+        assert "days" in response.get_json()["error"]
@@ -0,0 +1,359 @@
+import smtplib
+import socketserver
+import threading
+import time
+
+import pytest
+
+from src.incident import email_notifier, github_issues
+from src.incident.correlator import IncidentCorrelator, fingerprint, metric_signature
+from src.incident.dispatcher import dispatch_incident, parse_channels
+from src.incident.incident_store import INCIDENT_OPEN, IncidentStore
+from src.incident.rules import VERDICT_AMBIGUOUS, VERDICT_HEALTHY, VERDICT_INCIDENT, evaluate_incident_rules
+
+
+def _slow_sender(delay, result):
+    def send(payload):
+        time.sleep(delay)
+        return result
+    return send
+
+
+def test_parse_channels_from_llm_reply():
+    assert parse_channels("GitHub, email") == ["github", "email"]
+    assert parse_channels("none") == []
+
+
+def test_dispatch_sends_to_channels_concurrently():
+    senders = {
+        "github": _slow_sender(0.3, "https://github.com/o/r/issues/1"),
+        "jira": _slow_sender(0.3, "https://jira/browse/OPS-1"),
+        "email": _slow_sender(0.3, None),
+    }
+    started = time.monotonic()
+    results = dispatch_incident({"title": "t"}, ["github", "jira", "email"], senders=senders, timeout=5)
+    assert time.monotonic() - started < 0.8
+    assert all(outcome["ok"] for outcome in results.values())
+    assert results["jira"]["result"] == "https://jira/browse/OPS-1"
+
+
+def test_slow_channel_times_out_without_delaying_others():
+    senders = {"email": _slow_sender(2, None), "jira": _slow_sender(0, "OPS-1")}
+    started = time.monotonic()
+    results = dispatch_incident({}, ["email", "jira"], senders=senders, timeout=0.3, retries=0)
+    assert time.monotonic() - started < 1
+    assert results["jira"]["ok"]
+    assert not results["email"]["ok"]
+    assert "timed out" in results["email"]["error"]
+
+
+def test_failed_channel_is_retried_with_backoff():
+    calls = []
+
+    def flaky(payload):
+        calls.append(time.monotonic())
+        if len(calls) < 3:
+            raise ConnectionError("smtp unavailable")
+        return "sent"
+
+    results = dispatch_incident({}, ["email", "pager"], senders={"email": flaky}, timeout=5, retries=2, backoff=0.05)
+    assert results["email"]["ok"]
+    assert results["email"]["attempts"] == 3
+    assert results["email"]["result"] == "sent"
+    assert calls[2] - calls[1] >= calls[1] - calls[0]
+    assert results["pager"]["error"] == "unknown channel"
+
+
+def test_create_is_not_retried_when_the_failed_attempt_created_the_ticket():
+    created = []
+
+    def create(payload):
+        created.append(payload["title"])
+        if len(created) == 1:
+            raise TimeoutError("read timed out")
+        return f"https://github.com/o/r/issues/{len(created)}"
+
+    def lookup(found):
+        return lambda payload, since: found
+
+    results = dispatch_incident({"title": "t"}, ["github"], senders={"github": create}, timeout=5, retries=2,
+                                backoff=0.01, lookups={"github": lookup("https://github.com/o/r/issues/1")})
+    assert results["github"]["ok"] and results["github"]["result"] == "https://github.com/o/r/issues/1"
+    assert len(created) == 1
+
+    # Nothing found: the create was lost before reaching the server, so it is retried.
+    results = dispatch_incident({"title": "t"}, ["github"], senders={"github": create}, timeout=5, retries=2,
+                                backoff=0.01, lookups={"github": lookup(None)})
+    assert results["github"]["ok"] and len(created) == 2
+
+    def broken_lookup(payload, since):
+        raise ConnectionError("api down")
+
+    created.clear()
+    results = dispatch_incident({"title": "t"}, ["github"], senders={"github": create}, timeout=5, retries=2,
+                                backoff=0.01, lookups={"github": broken_lookup})
+    assert not results["github"]["ok"] and "not retried" in results["github"]["error"]
+    assert len(created) == 1
+
+
+def test_incident_label_lookup_is_cached_per_repo():
+    class Label:
+        name = "incident"
+
+    class Repo:
+        full_name = "o/label-cache"
+        lookups = 0
+
+        def get_labels(self):
+            Repo.lookups += 1
+            return [Label()]
+
+    repo = Repo()
+    assert [l.name for l in github_issues._incident_labels(repo)] == ["incident"]
+    github_issues._incident_labels(repo)
+    assert Repo.lookups == 1
+
+
+class _FakeSMTP:
+    def __init__(self, errors):
+        self.errors = errors
+        self.sent = 0
+
+    def noop(self):
+        return (250, b"ok")
+
+    def sendmail(self, sender, recipient, message):
+        self.sent += 1
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+def test_email_resends_only_after_a_dropped_connection(monkeypatch):
+    servers = []
+
+    def connect(*args):
+        servers.append(_FakeSMTP(errors))
+        return servers[-1]
+
+    monkeypatch.setattr(email_notifier, "_connect", connect)
+    monkeypatch.setattr(email_notifier, "_connections", {})
+    errors = [smtplib.SMTPServerDisconnected("idle timeout")]
+    email_notifier._send_pooled("smtp", 587, "u", "p", "ops@x", "message")
+    assert len(servers) == 2 and servers[-1].sent == 1
+
+    # A refused recipient is an OSError too, but resending could deliver the message twice.
+    errors.append(smtplib.SMTPRecipientsRefused({"ops@x": (550, b"no such user")}))
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        email_notifier._send_pooled("smtp", 587, "u", "p", "ops@x", "message")
+    assert len(servers) == 2 and servers[-1].sent == 2
+
+
+class _SMTPStub(socketserver.StreamRequestHandler):
+    """
+    Just enough SMTP for smtplib: the first drop_sessions sessions are closed at MAIL FROM (like a
+    server timing out an idle session), recipients starting with 'refused' get a 550.
+    """
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.sessions += 1
+        drop = self.server.sessions <= self.server.drop_sessions
+        self.reply("220 stub ESMTP")
+        for raw in self.rfile:
+            command = raw.decode().strip().upper()
+            if command.startswith("MAIL") and drop:
+                return
+            if command.startswith("RCPT") and "<REFUSED" in command:
+                self.reply("550 no such user")
+            elif command == "DATA":
+                self.reply("354 end data with <CR><LF>.<CR><LF>")
+                self.server.delivered.append(b"".join(iter(self.rfile.readline, b".\r\n")))
+                self.reply("250 queued")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+@pytest.fixture
+def smtp_stub():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SMTPStub)
+    server.daemon_threads = True
+    server.sessions, server.drop_sessions, server.delivered = 0, 0, []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_email_resends_after_smtp_server_drops_the_session(smtp_stub, monkeypatch):
+    # A plain session instead of STARTTLS + login; everything after that is real smtplib against the stub.
+    monkeypatch.setattr(email_notifier, "_connect", lambda host, port, user, password, timeout:
+                        smtplib.SMTP(host, port, timeout=timeout))
+    monkeypatch.setattr(email_notifier, "_connections", {})
+    port = smtp_stub.server_address[1]
+    smtp_stub.drop_sessions = 1
+    email_notifier._send_pooled("127.0.0.1", port, "agent@x", "pw", "ops@x", "Subject: incident\r\n\r\nbody")
+    assert smtp_stub.sessions == 2 and len(smtp_stub.delivered) == 1
+
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        email_notifier._send_pooled("127.0.0.1", port, "agent@x", "pw", "refused@x", "Subject: incident\r\n\r\nbody")
+    assert smtp_stub.sessions == 2 and len(smtp_stub.delivered) == 1
+
+
+class _Channels:
+    """Recording incident channels: GitHub opens numbered issues, email just sends, comments go to `comments`."""
+
+    def __init__(self):
+        self.opened = {"github": [], "email": []}
+        self.comments = []
+        self.senders = {"github": self._open_issue, "email": lambda payload: self.opened["email"].append(payload)}
+        self.updaters = {"github": lambda ticket, payload: self.comments.append((ticket, payload)) or ticket}
+
+    def _open_issue(self, payload):
+        self.opened["github"].append(payload)
+        return f"https://github.com/o/r/issues/{len(self.opened['github'])}"
+
+
+def _correlator(tmp_path, channels, now, **kwargs):
+    return IncidentCorrelator(IncidentStore(str(tmp_path / "incidents.sqlite3")), senders=channels.senders,
+                              updaters=channels.updaters, clock=lambda: now[0], **kwargs)
+
+
+def test_incident_store_creates_its_database_on_first_use(tmp_path):
+    path = tmp_path / "nested" / "incidents.sqlite3"
+    store = IncidentStore(str(path))
+    assert not path.parent.exists()
+    assert store.list() == [] and path.exists()
+
+
+def _incident(description="Rule-based verdict: incident (major) - 5xx ratio 0.200 >= 0.05"):
+    return {"title": "AI-Detected Incident in o/r", "description": description, "repo": "o/r", "recipient": "ops@x"}
+
+
+def test_repeated_incident_updates_its_ticket_in_one_digest(tmp_path):
+    channels, now = _Channels(), [1000.0]
+    correlator = _correlator(tmp_path, channels, now)
+    first = correlator.report(_incident(), ["github", "email"], repo="o/r", branch="main", stage="post_deploy_analysis")
+    for _ in range(3):
+        now[0] += 60
+        repeat = correlator.report(_incident(), ["github", "email"], repo="o/r", branch="main", stage="post_deploy_analysis")
+    other = correlator.report(_incident("p95 latency 2.500s >= 2.0s"), ["github"], repo="o/r", branch="main",
+                              stage="post_deploy_analysis")
+
+    assert first["created"] and first["notifications"]["github"]["ok"]
+    assert not repeat["created"] and repeat["incident_id"] == first["incident_id"] and repeat["occurrences"] == 4
+    assert repeat["deferred"] == ["github", "email"] and repeat["notifications"] == {}
+    assert other["created"] and other["fingerprint"] == fingerprint("o/r", "main", "post_deploy_analysis", "latency")
+    assert len(channels.opened["github"]) == 2 and len(channels.opened["email"]) == 1
+
+    assert correlator.flush(force=True) == {"github": 3, "email": 3}
+    # Three repeats become one comment on the issue opened first, and one digest email.
+    assert len(channels.comments) == 1
+    ticket, comment = channels.comments[0]
+    assert ticket == "https://github.com/o/r/issues/1"
+    assert "Seen 3 more time(s)" in comment["description"]
+    assert len(channels.opened["email"]) == 2 and channels.opened["email"][1]["title"].startswith("Incident digest: 3")
+    assert correlator.flush(force=True) == {}
+
+
+def test_failed_immediate_notification_goes_out_with_the_next_digest(tmp_path):
+    channels, now = _Channels(), [1000.0]
+    open_issue = channels.senders["github"]
+
+    def github_down(payload):
+        raise ConnectionError("github unavailable")
+
+    channels.senders["github"] = github_down
+    correlator = _correlator(tmp_path, channels, now)
+    first = correlator.report(_incident(), ["github", "email"], repo="o/r", branch="main", stage="post_deploy_analysis")
+    assert not first["notifications"]["github"]["ok"] and first["notifications"]["email"]["ok"]
+    assert first["deferred"] == ["github"]
+
+    channels.senders["github"] = open_issue
+    assert correlator.flush(force=True) == {"github": 1}
+    assert len(channels.opened["github"]) == 1
+    assert correlator.store.get(first["incident_id"])["tickets"]["github"] == "https://github.com/o/r/issues/1"
+
+
+def test_incident_storm_is_rate_limited_per_channel(tmp_path):
+    channels, now = _Channels(), [1000.0]
+    correlator = _correlator(tmp_path, channels, now, rate_limit=2, rate_window=600, digest_interval=60)
+    results = [
+        correlator.report(_incident(), ["github"], repo="o/r", branch=f"feature-{i}", stage="post_deploy_watch")
+        for i in range(5)
+    ]
+    assert [bool(result["notifications"]) for result in results] == [True, True, False, False, False]
+    assert len(channels.opened["github"]) == 2
+
+    # The window is used up, so the digest waits; once it has passed, the deferred incidents get their issues.
+    now[0] += 120
+    assert correlator.flush() == {}
+    now[0] += 600
+    assert correlator.flush() == {"github": 3}
+    assert len(channels.opened["github"]) == 5
+    assert "Occurrences (1)" in channels.opened["github"][2]["description"]
+    tickets = {incident["branch"]: incident["tickets"]["github"] for incident in correlator.store.list()}
+    assert len(set(tickets.values())) == 5
+
+
+def test_resolved_or_quiet_incident_opens_a_new_one(tmp_path):
+    channels, now = _Channels(), [1000.0]
+    correlator = _correlator(tmp_path, channels, now, resolve_after=3600)
+    report = lambda: correlator.report(_incident(), ["github"], repo="o/r", branch="main", stage="post_deploy_watch")
+    first = report()
+    assert correlator.resolve("o/r", "main") == 1
+    second = report()
+    now[0] += 3601
+    third = report()
+    assert len({first["incident_id"], second["incident_id"], third["incident_id"]}) == 3
+    assert [incident["id"] for incident in correlator.store.list(status=INCIDENT_OPEN)] == [third["incident_id"]]
+    assert metric_signature("scrape target is down; 5xx ratio 0.3") == "target_down"
+    assert metric_signature("p95_latency_s EWMA 0.300 > 0.150") == "latency"
+
+
+def _smoke(requests=40, status_codes=None, error_rate=0.0, p95_ms=20):
+    return {"total": {
+        "requests": requests,
+        "status_codes": status_codes or {"200": requests},
+        "error_rate": error_rate,
+        "latency_ms": {"p95": p95_ms},
+    }}
+
+
+def test_rules_declare_clearly_healthy_deploy():
+    metrics = {"up": 1, "request_rate": 2.0, "error_5xx_rate": 0.0, "error_5xx_ratio": 0.0,
+               "error_4xx_rate": 0.0, "latency_p95_s": 0.05}
+    decision = evaluate_incident_rules(metrics, _smoke())
+    assert decision["verdict"] == VERDICT_HEALTHY
+    assert decision["channels"] == []
+
+
+def test_rules_route_channels_by_severity():
+    major = evaluate_incident_rules({}, _smoke(status_codes={"200": 36, "500": 4}, error_rate=0.1))
+    assert major["verdict"] == VERDICT_INCIDENT
+    assert major["severity"] == "major"
+    assert major["channels"] == ["github", "jira"]
+
+    critical = evaluate_incident_rules({"up": 0}, _smoke())
+    assert critical["severity"] == "critical"
+    assert critical["channels"] == ["github", "jira", "email"]
+
+
+def test_rules_leave_borderline_cases_to_llm():
+    # A few 5xx, but below the incident threshold.
+    decision = evaluate_incident_rules({}, _smoke(status_codes={"200": 39, "500": 1}, error_rate=0.025))
+    assert decision["verdict"] == VERDICT_AMBIGUOUS
+    # Not enough traffic to call it healthy.
+    assert evaluate_incident_rules({}, _smoke(requests=2))["verdict"] == VERDICT_AMBIGUOUS
+
+
+def test_rules_thresholds_come_from_config():
+    rules = {"incident": {"min_p95_latency_s": 0.01}, "channels": {"major": ["email"]}}
+    decision = evaluate_incident_rules({}, _smoke(p95_ms=20), rules)
+    assert decision["verdict"] == VERDICT_INCIDENT
+    assert decision["channels"] == ["email"]
+    assert evaluate_incident_rules({}, _smoke(), {"enabled": False})["verdict"] == VERDICT_AMBIGUOUS
@@ -0,0 +1,104 @@
+import threading
+
+from src.jobs.job_queue import (
+    JobQueue,
+    STATUS_FAILED,
+    STATUS_QUEUED,
+    STATUS_RUNNING,
+    STATUS_SUCCEEDED,
+    STATUS_SUPERSEDED,
+)
+from src.jobs.worker_pool import WorkerPool
+
+
+def test_enqueue_claim_complete(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    job_id, created = queue.enqueue("branch_push", {"repo": "o/r", "branch": "dev"}, repo="o/r", branch="dev")
+    assert created
+    assert queue.get(job_id)["status"] == STATUS_QUEUED
+
+    job = queue.claim()
+    assert job["id"] == job_id
+    assert job["payload"] == {"repo": "o/r", "branch": "dev"}
+    assert queue.get(job_id)["status"] == STATUS_RUNNING
+    assert queue.claim() is None
+
+    queue.complete(job_id)
+    assert queue.get(job_id)["status"] == STATUS_SUCCEEDED
+
+
+def test_redelivered_webhook_is_not_queued_twice(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    first, created = queue.enqueue("pr_merge", {}, delivery_id="abc")
+    second, created_again = queue.enqueue("pr_merge", {}, delivery_id="abc")
+    assert created and not created_again
+    assert first == second
+    assert queue.depth() == {STATUS_QUEUED: 1}
+
+
+def test_interrupted_jobs_are_requeued(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    job_id, _ = JobQueue(db_path).enqueue("pr_merge", {})
+    JobQueue(db_path).claim()
+    assert JobQueue(db_path).requeue_running() == 1
+    assert JobQueue(db_path).get(job_id)["status"] == STATUS_QUEUED
+
+
+def test_worker_pool_drains_queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    done = threading.Event()
+    seen = []
+
+    def handler(payload):
+        seen.append(payload["n"])
+        if len(seen) == 2:
+            done.set()
+        if payload["n"] == 1:
+            raise RuntimeError("boom")
+
+    ok_id, _ = queue.enqueue("test", {"n": 0})
+    bad_id, _ = queue.enqueue("test", {"n": 1})
+    pool = WorkerPool(queue, {"test": handler}, workers=2, poll_interval=0.05)
+    pool.start()
+    try:
+        assert done.wait(5)
+    finally:
+        pool.stop(timeout=5)
+
+    assert sorted(seen) == [0, 1]
+    assert queue.get(ok_id)["status"] == STATUS_SUCCEEDED
+    failed = queue.get(bad_id)
+    assert failed["status"] == STATUS_FAILED
+    assert "boom" in failed["error"]
+
+
+def test_jobs_for_same_repo_are_serialized(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    first, _ = queue.enqueue("branch_push", {}, repo="o/a", branch="dev")
+    queue.enqueue("pr_merge", {}, repo="o/a", branch="main")
+    other, _ = queue.enqueue("branch_push", {}, repo="o/b", branch="dev")
+
+    assert queue.claim()["id"] == first
+    # o/a is busy, so the next runnable job belongs to a different repo.
+    assert queue.claim()["id"] == other
+    assert queue.claim() is None
+
+    queue.complete(first)
+    assert queue.claim()["kind"] == "pr_merge"
+
+
+def test_queued_events_for_same_target_are_coalesced(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    old_1, _ = queue.enqueue("branch_push", {"sha": 1}, repo="o/a", branch="dev")
+    old_2, _ = queue.enqueue("branch_push", {"sha": 2}, repo="o/a", branch="dev")
+    latest, _ = queue.enqueue("branch_push", {"sha": 3}, repo="o/a", branch="dev")
+
+    job = queue.claim()
+    assert job["id"] == latest
+    assert job["payload"] == {"sha": 3}
+    assert job["superseded_count"] == 2
+    for job_id in (old_1, old_2):
+        superseded = queue.get(job_id)
+        assert superseded["status"] == STATUS_SUPERSEDED
+        assert superseded["superseded_by"] == latest
+    assert queue.claim() is None
@@ -0,0 +1,237 @@
+import threading
+import time
+
+import pytest
+import requests
+from prometheus_client import REGISTRY
+
+from src.llm import mistral_chain
+from src.llm.backends import CircuitBreaker, Completion, LLMUnavailableError, ResilientLLM, StubBackend, TokenBucket
+from src.llm.stub_server import make_server
+from src.llm.response_cache import ResponseCache, make_key
+
+
+def test_make_key_normalizes_whitespace_and_context_order():
+    a = make_key("system", "Does it  expose /metrics?", {"b": 1, "a": 2}, "model")
+    b = make_key("system", "Does it expose /metrics?\n", {"a": 2, "b": 1}, "model")
+    assert a == b
+    assert a != make_key("system", "Does it expose /metrics?", {"a": 2, "b": 1}, "other-model")
+
+
+def test_response_cache_respects_prompt_type_ttl(tmp_path):
+    cache = ResponseCache(ttls={"cached": 60})
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "yes"
+
+    assert cache.get_or_compute("k", compute, prompt_type="cached") == "yes"
+    assert cache.get_or_compute("k", compute, prompt_type="cached") == "yes"
+    assert len(calls) == 1
+
+    cache.get_or_compute("k2", compute, prompt_type="uncached")
+    cache.get_or_compute("k2", compute, prompt_type="uncached")
+    assert len(calls) == 3
+
+
+def test_response_cache_disk_tier_survives_restart(tmp_path):
+    db_path = str(tmp_path / "llm.sqlite3")
+    ResponseCache(disk_path=db_path, ttls={"t": 60}).get_or_compute("k", lambda: "no", prompt_type="t")
+
+    fresh = ResponseCache(disk_path=db_path, ttls={"t": 60})
+    assert fresh.get_or_compute("k", lambda: pytest.fail("should be served from disk"), prompt_type="t") == "no"
+    assert fresh.stats()["hits"] == 1
+
+
+def test_response_cache_single_flight_shares_one_call():
+    cache = ResponseCache()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "deploy"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()["deduplicated"] < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["deploy"] * 5
+    assert len(calls) == 1
+
+
+class FakeBackend:
+    """Local stand-in for an LLM backend that replays canned replies (or raises them) and records prompts."""
+
+    def __init__(self, *replies, name="fake"):
+        self.name = name
+        self.replies = list(replies)
+        self.prompts = []
+
+    def invoke(self, system_prompt, prompt, context):
+        self.prompts.append(prompt)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+@pytest.fixture
+def use_client():
+    yield mistral_chain.set_llm_client
+    mistral_chain.set_llm_client(None)
+
+
+GATE_QUESTIONS = {
+    "deploy_gate": {
+        "prompt": "Should we deploy?",
+        "schema": {
+            "type": "object",
+            "required": ["decision"],
+            "properties": {"decision": {"type": "string", "enum": ["deploy", "skip"]}},
+        },
+    },
+    "monitoring": {"prompt": "Is it instrumented?", "schema": {"type": "boolean"}},
+}
+
+
+def test_structured_decision_batches_questions_into_one_call(use_client):
+    fake = FakeBackend('```json\n{"deploy_gate": {"decision": "skip"}, "monitoring": true}\n```')
+    use_client(fake)
+    answer = mistral_chain.get_structured_decision(GATE_QUESTIONS, context={"pr": 1})
+    assert answer == {"deploy_gate": {"decision": "skip"}, "monitoring": True}
+    assert len(fake.prompts) == 1
+    assert "### deploy_gate" in fake.prompts[0] and "### monitoring" in fake.prompts[0]
+
+
+def test_structured_decision_retries_once_on_invalid_reply(use_client):
+    fake = FakeBackend(
+        '{"deploy_gate": {"decision": "do not deploy"}, "monitoring": true}',
+        '{"deploy_gate": {"decision": "skip"}, "monitoring": false}',
+    )
+    use_client(fake)
+    answer = mistral_chain.get_structured_decision(GATE_QUESTIONS, context={"pr": 2})
+    assert answer["deploy_gate"]["decision"] == "skip"
+    assert "$.deploy_gate.decision must be one of" in fake.prompts[1]
+
+
+def test_structured_decision_gives_up_after_retry(use_client):
+    use_client(FakeBackend("deploy", '{"monitoring": "yes"}'))
+    with pytest.raises(mistral_chain.LLMResponseError):
+        mistral_chain.get_structured_decision(GATE_QUESTIONS, context={"pr": 3})
+
+
+class _HTTPError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_resilient_llm_retries_throttled_calls():
+    fake = FakeBackend(_HTTPError(429), _HTTPError(503), "ok")
+    client = ResilientLLM(fake, retries=2, backoff=0.01)
+    assert client.invoke("system", "prompt", "") == "ok"
+    assert len(fake.prompts) == 3
+
+
+def test_resilient_llm_does_not_retry_client_errors():
+    fake = FakeBackend(_HTTPError(401), "ok")
+    client = ResilientLLM(fake, retries=2, backoff=0.01)
+    with pytest.raises(LLMUnavailableError):
+        client.invoke("system", "prompt", "")
+    assert len(fake.prompts) == 1
+
+
+def test_open_circuit_fails_over_to_secondary():
+    primary = FakeBackend(_HTTPError(500), _HTTPError(500), name="primary")
+    secondary = FakeBackend("first", "second", name="secondary")
+    client = ResilientLLM(primary, secondary, retries=0, failure_threshold=2, reset_timeout=60)
+    assert client.invoke("system", "a", "") == "first"
+    assert client.invoke("system", "b", "") == "second"
+    assert client.breakers["primary"].state == "open"
+    # The open circuit keeps the primary from being called at all.
+    with pytest.raises(LLMUnavailableError, match="primary: circuit open"):
+        client.invoke("system", "c", "")
+    assert len(primary.prompts) == 2
+
+
+def test_circuit_breaker_half_opens_after_reset_timeout():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.15)
+    assert breaker.state == "half-open"
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_half_open_circuit_lets_exactly_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    breaker.record_failure()
+    time.sleep(0.15)
+    assert breaker.allow()
+    assert not breaker.allow()
+    # A failed trial re-opens the circuit; the next trial after the timeout closes it.
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.15)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.allow() and breaker.allow()
+
+
+def test_fallback_backend_answers_are_not_cached(use_client):
+    primary = FakeBackend(_HTTPError(500), name="primary")
+    secondary = FakeBackend("skip", "skip", name="secondary")
+    use_client(ResilientLLM(primary, secondary, retries=0, failure_threshold=1, reset_timeout=60))
+    for _ in range(2):
+        answer = mistral_chain.get_llm_decision("Deploy?", context={"pr": 7}, prompt_type=mistral_chain.PROMPT_DEPLOY_GATE)
+        assert answer == "skip"
+    assert len(secondary.prompts) == 2
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=20, capacity=1)
+    started = time.monotonic()
+    for _ in range(4):
+        assert bucket.acquire()
+    assert time.monotonic() - started >= 0.14
+    empty = TokenBucket(rate=0.1, capacity=1)
+    empty.acquire()
+    assert not empty.acquire(timeout=0.05)
+
+
+def test_unavailable_llm_returns_deterministic_fallback(use_client):
+    use_client(ResilientLLM(FakeBackend(requests.ConnectionError("refused")), retries=0))
+    fallback = {"deploy_gate": {"decision": "skip"}, "monitoring": False}
+    answer = mistral_chain.get_structured_decision(GATE_QUESTIONS, context={"pr": 4}, fallback=fallback)
+    assert answer == fallback
+
+
+def test_stub_backend_answers_structured_prompts_offline(use_client):
+    server = make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        use_client(ResilientLLM(StubBackend(f"http://127.0.0.1:{server.server_port}")))
+        answer = mistral_chain.get_structured_decision(GATE_QUESTIONS, context={"pr": 5})
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert answer == {"deploy_gate": {"decision": "deploy"}, "monitoring": True}
+
+
+def test_llm_calls_are_counted_with_reported_token_usage(use_client):
+    labels = {"prompt_type": "test_tokens", "direction": "output"}
+    before = REGISTRY.get_sample_value("sdlc_agent_llm_tokens_total", labels) or 0
+    use_client(FakeBackend(Completion("deploy", {"input_tokens": 120, "output_tokens": 3})))
+    assert mistral_chain.get_llm_decision("Deploy?", context={"pr": 6}, prompt_type="test_tokens") == "deploy"
+    assert REGISTRY.get_sample_value("sdlc_agent_llm_tokens_total", labels) == before + 3
+    assert REGISTRY.get_sample_value("sdlc_agent_llm_requests_total", {"prompt_type": "test_tokens", "outcome": "ok"}) >= 1
@@ -0,0 +1,380 @@
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from prometheus_client import REGISTRY
+
+from src.config.settings import PipelineSettings
+from src.incident.rules import VERDICT_HEALTHY, evaluate_incident_rules
+from src.monitor import tracing
+from src.monitor.deploy_watch import WATCH_BREACHED, WATCH_CANCELLED, WATCH_PASSED, DeployWatcher
+from src.monitor.prometheus_client import _parse_timestamp, fetch_metric_bundle, fetch_metric_range, wait_for_scrape
+from src.monitor.readiness import wait_until_ready
+from src.monitor.smoke_runner import percentile, run_smoke_test
+
+
+class _StubApp(BaseHTTPRequestHandler):
+    """Answers 503 until the server's ready_at time has passed, then 200."""
+
+    def do_GET(self):
+        ready = time.monotonic() >= self.server.ready_at and self.path == self.server.ready_path
+        self.send_response(200 if ready else 503)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_app():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubApp)
+    server.ready_at = 0
+    server.ready_path = "/"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_ready_app_is_detected_within_milliseconds(stub_app):
+    outcome = wait_until_ready(f"http://127.0.0.1:{stub_app.server_port}", timeout=5)
+    assert outcome["ready"]
+    assert outcome["attempts"] == 1
+    assert outcome["time_to_ready_s"] < 0.5
+
+
+def test_waits_for_app_on_custom_readiness_path(stub_app):
+    stub_app.ready_at = time.monotonic() + 0.3
+    stub_app.ready_path = "/healthz"
+    outcome = wait_until_ready(f"http://127.0.0.1:{stub_app.server_port}", path="/healthz", timeout=5)
+    assert outcome["ready"]
+    assert outcome["status_code"] == 200
+    assert 0.3 <= outcome["time_to_ready_s"] < 2
+
+
+def test_unready_app_fails_at_timeout(stub_app):
+    stub_app.ready_at = time.monotonic() + 60
+    started = time.monotonic()
+    outcome = wait_until_ready(f"http://127.0.0.1:{stub_app.server_port}", timeout=0.5)
+    assert not outcome["ready"]
+    assert outcome["status_code"] == 503
+    assert time.monotonic() - started < 1.5
+
+
+def test_closed_port_fails_without_http_attempts():
+    with ThreadingHTTPServer(("127.0.0.1", 0), _StubApp) as server:
+        port = server.server_port
+    outcome = wait_until_ready(f"http://127.0.0.1:{port}", timeout=0.3)
+    assert not outcome["ready"]
+    assert outcome["attempts"] == 0
+    assert "did not open" in outcome["reason"]
+
+
+def test_smoke_test_reports_per_endpoint_statuses_and_latency(stub_app):
+    stub_app.ready_path = "/"
+    results = run_smoke_test(
+        f"http://127.0.0.1:{stub_app.server_port}", endpoints=["/", "/error"], concurrency=4, requests_per_endpoint=10
+    )
+    assert results["endpoints"]["/"]["status_codes"] == {"200": 10}
+    assert results["endpoints"]["/"]["error_rate"] == 0
+    assert results["endpoints"]["/error"]["status_codes"] == {"503": 10}
+    assert results["endpoints"]["/error"]["error_rate"] == 1
+    assert results["total"]["requests"] == 20
+    latency = results["total"]["latency_ms"]
+    assert latency["p50"] <= latency["p95"] <= latency["p99"] <= latency["max"]
+
+
+def test_default_smoke_test_of_a_healthy_app_is_decided_locally(stub_app):
+    endpoints = PipelineSettings().smoke_test_endpoints
+    results = run_smoke_test(f"http://127.0.0.1:{stub_app.server_port}", endpoints=endpoints, concurrency=4,
+                             requests_per_endpoint=20)
+    assert evaluate_incident_rules({}, results)["verdict"] == VERDICT_HEALTHY
+
+
+def test_smoke_test_respects_rate_limit(stub_app):
+    results = run_smoke_test(
+        f"http://127.0.0.1:{stub_app.server_port}", endpoints=["/"], concurrency=4, requests_per_endpoint=6, rate=20
+    )
+    assert results["total"]["requests"] == 6
+    assert results["duration_s"] >= 0.25
+
+
+def test_smoke_test_counts_connection_errors():
+    with ThreadingHTTPServer(("127.0.0.1", 0), _StubApp) as server:
+        port = server.server_port
+    results = run_smoke_test(f"http://127.0.0.1:{port}", endpoints=["/"], concurrency=2, requests_per_endpoint=3)
+    assert results["total"]["status_codes"] == {"error": 3}
+    assert results["total"]["error_rate"] == 1
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([7], 95) == 7
+    assert percentile([], 50) is None
+
+
+class _StubPrometheus(BaseHTTPRequestHandler):
+    """Serves /api/v1/targets; the target's lastScrape advances every server.interval seconds."""
+
+    def do_GET(self):
+        now = time.time()
+        last_scrape = now - (now - self.server.first_scrape) % self.server.interval
+        body = json.dumps({
+            "status": "success",
+            "data": {"activeTargets": [{
+                "labels": {"job": "app", "instance": "localhost:5000"},
+                "health": "up",
+                "lastScrape": datetime.fromtimestamp(last_scrape, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f123Z"),
+                "scrapeInterval": f"{self.server.interval}s",
+            }]},
+        }).encode()
+        self.server.requests += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_prometheus():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubPrometheus)
+    server.interval = 1
+    server.first_scrape = time.time()
+    server.requests = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_wait_for_scrape_returns_at_next_scrape(stub_prometheus):
+    url = f"http://127.0.0.1:{stub_prometheus.server_port}"
+    since = time.time()
+    outcome = wait_for_scrape(url, since, job="app", instance="localhost:5000", timeout=5)
+    assert outcome["scraped"]
+    assert outcome["last_scrape"] >= since
+    assert outcome["waited_s"] < 1.5
+    # It sleeps until the scrape is due rather than polling continuously.
+    assert stub_prometheus.requests <= 4
+
+
+def test_wait_for_scrape_returns_immediately_for_fresh_scrape(stub_prometheus):
+    url = f"http://127.0.0.1:{stub_prometheus.server_port}"
+    outcome = wait_for_scrape(url, since=time.time() - 60, timeout=5)
+    assert outcome["scraped"]
+    assert stub_prometheus.requests == 1
+
+
+def test_wait_for_scrape_gives_up_at_timeout(stub_prometheus):
+    url = f"http://127.0.0.1:{stub_prometheus.server_port}"
+    outcome = wait_for_scrape(url, since=time.time(), job="other-job", timeout=0.5)
+    assert not outcome["scraped"]
+    assert outcome["waited_s"] < 1.5
+
+
+def test_parse_prometheus_timestamp_with_nanoseconds():
+    assert _parse_timestamp("1970-01-01T00:00:01.500000000Z") == 1.5
+    assert _parse_timestamp("1970-01-01T01:00:01+01:00") == 1.0
+    assert _parse_timestamp("garbage") is None
+
+
+class _StubPromQL(BaseHTTPRequestHandler):
+    """Answers /api/v1/query with canned values chosen by substrings of the PromQL expression."""
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)["query"][0]
+        self.server.queries.append(query)
+        if 'status=~"5.."' in query:
+            result = [{"metric": {}, "value": [0, "0.5"]}]
+        elif "histogram_quantile(0.95" in query:
+            result = [{"metric": {}, "value": [0, "0.25"]}]
+        elif "histogram_quantile" in query:
+            result = [{"metric": {}, "value": [0, "NaN"]}]
+        elif "http_requests_total" in query:
+            result = [{"metric": {}, "value": [0, "2"]}]
+        else:
+            result = []
+        body = json.dumps({"status": "success", "data": {"resultType": "vector", "result": result}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_metric_bundle_returns_compact_numbers():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubPromQL)
+    server.queries = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        bundle = fetch_metric_bundle(f"http://127.0.0.1:{server.server_port}", job="app", instance="localhost:5000")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert bundle["request_rate"] == 2.0
+    assert bundle["error_5xx_rate"] == 0.5
+    assert bundle["error_5xx_ratio"] == 0.25
+    assert bundle["latency_p95_s"] == 0.25
+    assert bundle["latency_p50_s"] is None
+    assert bundle["up"] is None
+    assert len(server.queries) == len(bundle) - 1
+    assert all('job="app",instance="localhost:5000"' in query for query in server.queries)
+
+
+class _StubPromQLRange(BaseHTTPRequestHandler):
+    """Answers /api/v1/query_range with two series per query, one of them NaN at the second step."""
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        self.server.ranges.append((params["start"][0], params["end"][0], params["step"][0]))
+        result = [
+            {"metric": {"pod": "a"}, "values": [[100, "1"], [115, "2"]]},
+            {"metric": {"pod": "b"}, "values": [[100, "0.5"], [115, "NaN"]]},
+        ]
+        body = json.dumps({"status": "success", "data": {"resultType": "matrix", "result": result}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_metric_range_sums_series_per_timestamp():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubPromQLRange)
+    server.ranges = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        series = fetch_metric_range(
+            f"http://127.0.0.1:{server.server_port}", 100, 115, 15, job="app", queries={"request_rate": "up"}
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert series == {"request_rate": [(100.0, 1.5), (115.0, 2.0)]}
+    start, end, step = server.ranges[0]
+    assert float(start) == 100 and float(end) == 115 and step == "15s"
+
+
+def _fake_range(deployed_at, before, after):
+    """fetch_range stand-in: samples every step, with before(t)/after(t) -> (5xx ratio, p95 latency) around deployed_at."""
+    calls = []
+
+    def fetch_range(url, start, end, step, **kwargs):
+        calls.append((start, end))
+        series = {"up": [], "request_rate": [], "error_5xx_rate": [], "latency_p95_s": []}
+        t = start
+        while t <= end:
+            ratio, latency = (before if t < deployed_at else after)(t)
+            series["up"].append((t, 1.0))
+            series["request_rate"].append((t, 10.0))
+            series["error_5xx_rate"].append((t, 10.0 * ratio))
+            series["latency_p95_s"].append((t, latency))
+            t += step
+        return series
+
+    fetch_range.calls = calls
+    return fetch_range
+
+
+def _wait_for(results, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while len(results) < count and time.monotonic() < deadline:
+        time.sleep(0.02)
+
+
+def test_watch_breaches_on_latency_shift_relative_to_baseline():
+    deployed_at = time.time()
+    fetch_range = _fake_range(deployed_at, before=lambda t: (0.0, 0.1), after=lambda t: (0.0, 0.3))
+    watcher = DeployWatcher("http://prometheus", fetch_range=fetch_range)
+    results = []
+    try:
+        watcher.watch("o/r@main", deployed_at, results.append, window=5, interval=0.05, step=0.05,
+                      rate_window="0s", baseline_window=1)
+        _wait_for(results, 1)
+    finally:
+        watcher.stop()
+
+    status = results[0]
+    # 0.3s is far below the absolute 2s incident threshold, but double the previous version's p95.
+    assert status["outcome"] == WATCH_BREACHED
+    assert status["baseline"]["p95_latency_s"]["p95"] == 0.1
+    assert status["thresholds"]["p95_latency_s"] == pytest.approx(0.15)
+    assert any(reason.startswith("p95_latency_s") for reason in status["finding"]["reasons"])
+    # Only the baseline and the samples since the previous tick are fetched.
+    assert fetch_range.calls[0] == (deployed_at - 1, deployed_at)
+    assert all(end <= later_start for (_, end), (later_start, _) in zip(fetch_range.calls[1:], fetch_range.calls[2:]))
+
+
+def test_many_watches_share_one_scheduler_and_a_new_deploy_supersedes_its_watch():
+    deployed_at = time.time()
+    fetch_range = _fake_range(deployed_at, before=lambda t: (0.01, 0.1), after=lambda t: (0.01, 0.11))
+    watcher = DeployWatcher("http://prometheus", workers=2, fetch_range=fetch_range)
+    results = []
+    threads_before = threading.active_count()
+    try:
+        for i in range(30):
+            watcher.watch(f"o/app-{i}@main", deployed_at, results.append, window=0.4, interval=0.05, step=0.05,
+                          rate_window="0s", baseline_window=1)
+        watcher.watch("o/app-0@main", deployed_at, results.append, window=0.4, interval=0.05, step=0.05,
+                      rate_window="0s", baseline_window=1)
+        assert threading.active_count() - threads_before <= 3
+        _wait_for(results, 31)
+    finally:
+        watcher.stop()
+
+    outcomes = [status["outcome"] for status in results]
+    assert outcomes.count(WATCH_CANCELLED) == 1
+    assert outcomes.count(WATCH_PASSED) == 30
+    assert watcher.active() == []
+
+
+def test_spans_build_a_tree_across_threads_and_export_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_EXPORT_DIR", str(tmp_path))
+    before = REGISTRY.get_sample_value("sdlc_agent_stage_duration_seconds_count", {"stage": "test_child", "status": "failed"}) or 0
+
+    def work():
+        with tracing.span("test_worker"):
+            pass
+
+    with tracing.span("test_pipeline", repo="o/r") as root:
+        with tracing.span("test_stage"):
+            with ThreadPoolExecutor(2) as pool:
+                pool.submit(tracing.propagate(work)).result()
+        with pytest.raises(ValueError):
+            with tracing.span("test_child"):
+                raise ValueError("boom")
+        assert tracing.current_trace_id() == root.trace_id
+    assert tracing.current_trace_id() is None
+
+    tree = tracing.get_trace(root.trace_id)
+    assert tree["attributes"] == {"repo": "o/r"}
+    assert [child["name"] for child in tree["children"]] == ["test_stage", "test_child"]
+    assert tree["children"][0]["children"][0]["name"] == "test_worker"
+    assert tree["children"][1]["status"] == "failed" and tree["children"][1]["error"] == "boom"
+    exported = json.loads((tmp_path / f"test_pipeline-{root.trace_id}.json").read_text())
+    assert exported["trace_id"] == root.trace_id
+    after = REGISTRY.get_sample_value("sdlc_agent_stage_duration_seconds_count", {"stage": "test_child", "status": "failed"})
+    assert after == before + 1
+    assert REGISTRY.get_sample_value("sdlc_agent_stage_in_flight", {"stage": "test_stage"}) == 0
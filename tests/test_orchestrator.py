@@ -1,2 +1,43 @@
 def test_orchestrator():
     assert True  # Add real tests here
+
+
+def test_importing_the_webhook_server_does_not_load_heavy_clients(tmp_path):
+    from benchmarks.import_bench import LAZY_MODULES, sample
+
+    _, modules = sample("src.webhook_server", str(tmp_path))
+    assert "src.orchestrator" in modules
+    assert not [name for name in LAZY_MODULES if name in modules]
+
+
+def test_importing_the_orchestrator_creates_no_files(tmp_path):
+    import os
+    import subprocess
+    import sys
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", "import src.orchestrator"], cwd=tmp_path, check=True,
+                   env={**os.environ, "PYTHONPATH": root})
+    assert os.listdir(tmp_path) == []
+
+
+def test_watch_rollback_skips_when_a_newer_run_started(tmp_path, monkeypatch):
+    import time
+
+    from src import orchestrator
+    from src.history.history_store import DeploymentHistory
+
+    history = DeploymentHistory(str(tmp_path / "history.sqlite3"))
+    monkeypatch.setattr(orchestrator, "history", history)
+    rollbacks = []
+    monkeypatch.setattr(orchestrator, "_rollback_to_last_good", lambda repo, branch, result, pipeline, last_good=None:
+                        rollbacks.append(last_good["image_ref"]) or last_good["image_ref"])
+    watched = history.start_run("pr_merge", "o/r", "main")
+    payload = {"run_id": watched, "repo": "o/r", "branch": "main", "image_ref": "o_r:good", "deployment": {}}
+
+    assert orchestrator.orchestrate_watch_rollback(payload) == "o_r:good"
+    time.sleep(0.01)
+    newer = history.start_run("pr_merge", "o/r", "main")
+    assert orchestrator.orchestrate_watch_rollback(payload) is None
+    assert rollbacks == ["o_r:good"]
+    assert history.get_run(watched)["data"]["rollback_skipped"] == f"superseded by run {newer}"
@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.pipeline_bench import compare_to_baseline, synthesize_deliveries
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_synthesized_deliveries_alternate_merges_and_pushes():
+    deliveries = synthesize_deliveries(4, ["bench/a", "bench/b"])
+    assert [d["event"] for d in deliveries] == ["pull_request", "push", "pull_request", "push"]
+    assert deliveries[0]["payload"]["pull_request"]["base"]["repo"]["full_name"] == "bench/a"
+    assert deliveries[1]["payload"]["repository"]["full_name"] == "bench/b"
+
+
+def test_compare_to_baseline_flags_only_real_regressions():
+    baseline = {"events_per_s": 10, "pipelines_per_s": 4, "peak_rss_mb": 100,
+                "stages": {"deploy": {"p95": 1.0}, "checkout": {"p95": 0.01}}}
+    report = {"events_per_s": 7, "pipelines_per_s": 3.9, "peak_rss_mb": 110,
+              "stages": {"deploy": {"p95": 1.5}, "checkout": {"p95": 0.03}}}
+    regressions = compare_to_baseline(report, baseline, tolerance=0.25)
+    assert [r.split(":")[0] for r in regressions] == ["events_per_s", "stages.deploy.p95"]
+
+
+def test_benchmark_runs_end_to_end_offline(tmp_path):
+    # Settings are read at import time, so the harness needs a fresh interpreter.
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.pipeline_bench", "--events", "4", "--repos", "2",
+         "--build-seconds", "0", "--llm-latency", "0", "--json", "--baseline", str(tmp_path / "baseline.json")],
+        cwd=REPO_ROOT, capture_output=True, text=True, timeout=300,
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    report = json.loads(result.stdout)
+    assert report["processed"] + report["superseded"] == 4
+    assert report["jobs"].get("failed", 0) == 0
+    assert {"checkout", "deploy", "health_check"} <= set(report["stages"])
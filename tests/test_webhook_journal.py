@@ -0,0 +1,90 @@
+import gzip
+import time
+
+import pytest
+
+from src.jobs.intake import JOB_BRANCH_PUSH, JOB_PR_MERGE, route_event
+from src.jobs.job_queue import JobQueue, STATUS_QUEUED
+from src.jobs.webhook_journal import WebhookJournal, read_journal, replay
+
+
+def _push(repo, branch, sha):
+    return {"ref": f"refs/heads/{branch}", "repository": {"full_name": repo}, "after": sha}
+
+
+def _merge(repo):
+    return {"action": "closed", "pull_request": {"merged": True, "base": {"ref": "main", "repo": {"full_name": repo}}}}
+
+
+def test_route_event():
+    job, _ = route_event("push", _push("o/r", "dev", "abc"))
+    assert job == {"kind": JOB_BRANCH_PUSH, "payload": {"repo": "o/r", "branch": "dev", "commit_sha": "abc"},
+                   "repo": "o/r", "branch": "dev"}
+    assert route_event("pull_request", _merge("o/r"))[0]["kind"] == JOB_PR_MERGE
+    assert route_event("push", _push("o/r", "main", "abc")) == (None, "push to main is handled by PR merge event")
+    assert route_event("ping", {})[0] is None
+
+
+def test_journal_rotates_and_reads_back_in_order(tmp_path):
+    journal = WebhookJournal(str(tmp_path), max_bytes=200, max_files=50)
+    for i in range(30):
+        journal.append("push", _push("o/r", "dev", f"sha-{i}" * 10), delivery_id=f"d{i}", received_at=1000 + i)
+    # The current segment is still open (no gzip trailer) and must be readable as is.
+    records = list(read_journal(str(tmp_path)))
+    assert [r["delivery_id"] for r in records] == [f"d{i}" for i in range(30)]
+    assert len(list(tmp_path.glob("webhooks-*.jsonl.gz"))) > 1
+    assert [r["delivery_id"] for r in read_journal(str(tmp_path), since=1010, until=1012)] == ["d10", "d11", "d12"]
+    journal.close()
+    with gzip.open(sorted(tmp_path.glob("webhooks-*.jsonl.gz"))[-1], "rt") as f:
+        assert f.read().endswith("\n")
+
+
+def test_journal_keeps_at_most_max_files_segments(tmp_path):
+    journal = WebhookJournal(str(tmp_path), max_bytes=1, max_files=3)
+    for i in range(6):
+        journal.append("push", _push("o/r", "dev", str(i)), delivery_id=str(i))
+    journal.close()
+    assert len(list(tmp_path.glob("webhooks-*.jsonl.gz"))) == 3
+    assert [r["delivery_id"] for r in read_journal(str(tmp_path))] == ["3", "4", "5"]
+
+
+def test_replay_coalesces_per_target_and_skips_seen_deliveries(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    records = [
+        {"received_at": 1, "event": "push", "delivery_id": "a", "payload": _push("o/r", "dev", "1")},
+        {"received_at": 2, "event": "push", "delivery_id": "b", "payload": _push("o/r", "dev", "2")},
+        {"received_at": 3, "event": "pull_request", "delivery_id": "c", "payload": _merge("o/r")},
+        {"received_at": 4, "event": "push", "delivery_id": "d", "payload": _push("o/r", "main", "3")},
+    ]
+    summary = replay(records, queue)
+    assert summary == {"submitted": 2, "queued": 2, "duplicates": 0, "ignored": 0, "coalesced": 2, "errors": 0}
+    assert queue.claim()["payload"] == {"repo": "o/r", "branch": "dev", "commit_sha": "2"}
+
+    # Replaying the same journal again does not run anything twice, unless asked to redeliver.
+    assert replay(records, queue)["duplicates"] == 2
+    assert replay(records, queue, coalesce=False, redeliver=True)["queued"] == 3
+    assert queue.depth()[STATUS_QUEUED] == 4
+
+
+def test_replay_rate_limits_submissions(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    records = [{"received_at": i, "event": "push", "delivery_id": str(i), "payload": _push("o/r", f"b{i}", "x")}
+               for i in range(5)]
+    started = time.monotonic()
+    assert replay(records, queue, rate=20)["queued"] == 5
+    assert time.monotonic() - started >= 0.19
+
+
+@pytest.fixture
+def webhook_client(tmp_path, monkeypatch):
+    # The server opens its job queue at import, relative to the working directory.
+    monkeypatch.chdir(tmp_path)
+    from src import webhook_server
+    return webhook_server.app.test_client()
+
+
+@pytest.mark.parametrize("rate", ["fast", -1, [2], "nan"])
+def test_replay_rejects_an_invalid_rate(webhook_client, rate):
+    response = webhook_client.post("/replay", json={"rate": rate})
+    assert response.status_code == 400
+    assert "Invalid rate" in response.get_json()["error"]